@@ -0,0 +1,80 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+from database import WishDatabase
+from banner_index import BannerList
+from pity_tracker import PityTracker
+import threading
+import logging
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class DatabaseLoader(QObject):
+    # Opens, upgrades and reads wish database on worker thread with its own connection, so GUI stays responsive
+    # while big database loads. Results are sent to GUI thread by signals:
+    # database_ready - database is created/upgraded and annotated, GUI can open its own connection
+    # headers_ready - lifetime pulls and pity of every banner, enough to fill banner headers
+    # wishes_loaded - next chunk of wishes of one banner (oldest first)
+    # banner_loaded - all wishes of banner were sent
+    # progress - number of loaded wishes and number of all wishes
+    chunk_size = 5000
+
+    database_ready = pyqtSignal()
+    headers_ready = pyqtSignal(dict)
+    wishes_loaded = pyqtSignal(list, str)
+    banner_loaded = pyqtSignal(str)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, db_path):
+        QObject.__init__(self)
+        self.db_path = db_path
+        self.cancelled = False
+
+    def cancel(self):
+        # stops loading after current chunk, e.g. when user switched to other profile
+        self.cancelled = True
+
+    def start(self):
+        load_thread = threading.Thread(target=self.load_database_thread, daemon=True)
+        load_thread.start()
+
+    def load_database_thread(self):
+        try:
+            db = WishDatabase(self.db_path)
+            db.initialize_database()
+            BannerList().annotate_database(db)
+            self.database_ready.emit()
+
+            headers = {table_name: self.get_banner_header(db, table_name) for table_name in db.wish_table_names}
+            self.headers_ready.emit(headers)
+
+            total = sum(header["pulls"] for header in headers.values())
+            loaded = 0
+            self.progress.emit(loaded, total)
+            for table_name in db.wish_table_names:
+                for chunk in db.iterate_wishes_from_table(table_name, self.chunk_size):
+                    if self.cancelled:
+                        logger.info("Loading of {} cancelled".format(self.db_path))
+                        db.connection.close()
+                        return
+                    self.wishes_loaded.emit(chunk, table_name)
+                    loaded = loaded + len(chunk)
+                    self.progress.emit(loaded, total)
+                self.banner_loaded.emit(table_name)
+            db.connection.close()
+            self.finished.emit()
+        except Exception as e:
+            logger.error("Failed to load database. {}".format(e))
+            self.failed.emit(str(e))
+
+    @staticmethod
+    def get_banner_header(db, table_name):
+        five_star_pity = db.get_current_pity(table_name, 5)
+        four_star_pity = db.get_current_pity(table_name, 4)
+        if table_name in PityTracker.four_star_reset_banners:
+            # 5-star resets 4-star pity as well
+            four_star_pity = min(four_star_pity, five_star_pity)
+        return {"pulls": db.get_number_of_elements_in_table(table_name),
+                "five_star_pity": five_star_pity,
+                "four_star_pity": four_star_pity}
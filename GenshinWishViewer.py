@@ -1,3 +1,5 @@
+import time
+start_time = time.perf_counter()  # taken before other imports, so start-up profile includes them
 from argparse import ArgumentParser
 import logging
 from datetime import date
@@ -5,20 +7,36 @@ import os
 from database import WishDatabase
 from ImportWishWindow import ImportWishDialog
 from StartupWindow import SplashScreen
+from DatabaseLoader import DatabaseLoader
+from profiles import ProfileRegistry
+from ocr_backends import backends
 from SideGrip import SideGrip
-from importer import WishImporter
-import time
-from PyQt5 import QtWidgets, uic
+from WishTableModel import WishTableModel
+from WishSearchWidget import WishSearchWidget
+from wish_store import WishStore
+from pity_tracker import PityTracker
+from analytics import WishAnalytics
+from startup_profiler import profiler
+from ui_loader import CompiledUiLoader
+from PyQt5 import QtWidgets
 from PyQt5.QtGui import QIcon, QPalette, QColor, QPixmap, QBitmap, QPainter, QBrush
 from PyQt5.QtCore import Qt, QSize, QEvent, QTimer, QRect, QMetaObject, QPoint
-from PyQt5.QtWidgets import QApplication, QPushButton, QFrame, QMainWindow, QSplashScreen, QWidget, QVBoxLayout, QHBoxLayout, QSizePolicy, QSizeGrip, QPushButton, QLabel, QTableWidgetItem
+from PyQt5.QtWidgets import QApplication, QPushButton, QFrame, QMainWindow, QSplashScreen, QWidget, QVBoxLayout, QHBoxLayout, QSizePolicy, QSizeGrip, QPushButton, QLabel, QLineEdit, QComboBox, QInputDialog, QMessageBox
 import sys
+
+logger = logging.getLogger('GenshinWishViewer')
 # potential UI - https://github.com/Wanderson-Magalhaes/Simple_PySide_Base/blob/master/main.py
 
 
 def parse_arguments():
     parser = ArgumentParser()
     parser.add_argument("-d", "--debug", '--DEBUG', action='store_true', help="set logging to be debug")
+    parser.add_argument("-p", "--profile", help="UID of profile (account) to open, unknown UID is added as new profile")
+    parser.add_argument("--profile-startup", action='store_true', help="print how long every phase of start-up took")
+    parser.add_argument("--ocr-backend", default="tesseract", choices=list(backends),
+                        help="OCR backend preselected in import dialog")
+    parser.add_argument("--resume", action='store_true',
+                        help="finish imports of screenshots, which were interrupted (e.g. by crash)")
     return parser.parse_args()
 
 
@@ -57,12 +75,36 @@ def init_logger(debug):
 class Ui(QtWidgets.QMainWindow):
 
     db = None
-    wish_entries = {
-        "wishCharacter": [],
-        "wishWeapon": [],
-        "wishStandard": [],
-        "wishBeginner": []
-    }
+    banner_tables = None
+    wish_table_models = None
+    wish_entries = None
+    pity_trackers = None
+    analytics = None
+    banner_title_labels = None
+    banner_labels = None
+    splash_w = None
+    database_loader = None
+    loading_banners = None
+    profiles = None
+    profile_stores = None  # uid -> (wish_entries, pity_trackers) of profiles loaded in this session
+    ui_ready = False
+    search_edit = None
+    search_widget = None
+    profile_combo_box = None
+    ocr_backend = "tesseract"
+    resume_imports = False
+    # start-up profile is printed once, when the window was painted and loading ended
+    first_painted = False
+    loading_ended = False
+    startup_reported = False
+
+    # banners which have to be refreshed on next tick of event loop
+    dirty_banners = None
+    reloaded_banners = None
+    label_texts = None
+    refresh_timer = None
+    last_refresh_time = 0
+    min_refresh_interval = 0.1  # seconds
 
     sideGrips = None
     cornerGrips = None
@@ -70,20 +112,176 @@ class Ui(QtWidgets.QMainWindow):
     maximized = False
     drag_pos = None
 
-    def __init__(self):
+    def __init__(self, profile=None, ocr_backend=None, resume_imports=False):
         super(Ui, self).__init__()
+        if ocr_backend is not None:
+            self.ocr_backend = ocr_backend
+        self.resume_imports = resume_imports
+        self.profiles = ProfileRegistry()
+        if profile is not None:
+            if str(profile) not in self.profiles.profiles:
+                self.profiles.add_profile(profile)
+            self.profiles.set_active(profile)
+        self.profile_stores = {}
+        self.dirty_banners = set()
+        self.reloaded_banners = set()
+        self.label_texts = {}
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.timeout.connect(self.refresh_dirty_banners)
+
+        with profiler.phase("splash screen"):
+            self.splash_w = SplashScreen()
+            self.splash_w.add_progress_bar()
+            self.splash_w.show()
+        with profiler.phase("load mainwindow.ui"):
+            CompiledUiLoader('mainwindow.ui').setup_ui(self)
+
+        self.switch_profile(self.profiles.active)
+
+    def switch_profile(self, uid):
+        """Makes profile active. Wishes of profile, which was already loaded in this session, are kept in memory,
+        so switching back to it doesn't touch database at all. Other profiles are never loaded.
+        :param uid: UID of profile from registry
+        :return:
+        """
+        logger.info("Switching to profile {}".format(uid))
+        if self.database_loader is not None:
+            # previous profile didn't finish loading, its wishes in memory are incomplete
+            self.database_loader.cancel()
+            self.database_loader = None
+            if self.loading_banners:
+                self.profile_stores.pop(self.profiles.active, None)
+        self.profiles.set_active(uid)
+        if uid in self.profile_stores:
+            self.wish_entries, self.pity_trackers = self.profile_stores[uid]
+            self.loading_banners = set()
+            self.open_profile_database()
+            for banner_type in self.wish_entries:
+                self.mark_banner_dirty(banner_type, reloaded=True)
+            return
 
-        splash_w = SplashScreen()
-        splash_w.show()
-        uic.loadUi('mainwindow.ui', self)
+        self.wish_entries = {}
+        self.pity_trackers = {}
+        for banner_type in WishDatabase.wish_table_names:
+            self.wish_entries[banner_type] = WishStore()
+            self.pity_trackers[banner_type] = PityTracker.for_banner(banner_type)
+        self.profile_stores[uid] = (self.wish_entries, self.pity_trackers)
+        self.loading_banners = set(WishDatabase.wish_table_names)
+
+        # database is opened, upgraded and read on worker thread, GUI thread only receives results
+        self.database_loader = DatabaseLoader(self.profiles.get_db_path())
+        self.database_loader.database_ready.connect(self.on_database_ready)
+        self.database_loader.headers_ready.connect(self.on_headers_ready)
+        self.database_loader.wishes_loaded.connect(self.on_wishes_loaded)
+        self.database_loader.banner_loaded.connect(self.on_banner_loaded)
+        self.database_loader.progress.connect(self.on_load_progress)
+        self.database_loader.finished.connect(self.on_load_finished)
+        self.database_loader.failed.connect(self.on_load_failed)
+        self.database_loader.start()
+
+    def is_stale_signal(self):
+        # signal can still come from loader of profile, which isn't active anymore
+        return self.sender() is not None and self.sender() is not self.database_loader
+
+    def on_database_ready(self):
+        if self.is_stale_signal():
+            return
+        profiler.mark("database ready")
+        self.open_profile_database()
+
+    def open_profile_database(self):
+        # database is already created and upgraded, so opening GUI connection is cheap
+        self.db = WishDatabase(self.profiles.get_db_path())
+        self.analytics = WishAnalytics(self.db)
+        if self.ui_ready:
+            for model in self.wish_table_models.values():
+                model.db = self.db
+            self.search_widget.set_database(self.db)
+            return
+        with profiler.phase("setup ui"):
+            self.setup_ui()
+        self.ui_ready = True
+
+    def on_headers_ready(self, headers):
+        if self.is_stale_signal():
+            return
+        for banner_type, header in headers.items():
+            self.set_banner_labels(banner_type, header["pulls"], header["five_star_pity"], header["four_star_pity"])
+        self.close_splash_screen()
+        with profiler.phase("show"):
+            self.show()
+        # first paint happens in the next iteration of event loop, only the first one at start-up is profiled
+        if not self.first_painted:
+            QTimer.singleShot(0, self.on_first_paint)
+
+    def on_first_paint(self):
+        profiler.mark("first paint")
+        self.first_painted = True
+        self.report_startup()
+
+    def report_startup(self):
+        if self.first_painted and self.loading_ended and not self.startup_reported:
+            self.startup_reported = True
+            profiler.report()
+
+    def on_wishes_loaded(self, wishes, banner_type):
+        if self.is_stale_signal():
+            return
+        # labels keep values from headers until whole banner is loaded
+        self.wish_entries[banner_type].append_many(wishes)
+        self.pity_trackers[banner_type].add_wishes([wish[3] for wish in wishes])
+
+    def on_banner_loaded(self, banner_type):
+        if self.is_stale_signal():
+            return
+        self.loading_banners.discard(banner_type)
+        self.mark_banner_dirty(banner_type, reloaded=True)
 
-        self.db = WishDatabase('db.db')
-        self.db.initialize_database()
-        self.load_wishes_to_memory_from_db()
+    def on_load_progress(self, loaded, total):
+        if self.splash_w is None:
+            return
+        self.splash_w.set_min_max_progress(0, max(total, 1))
+        self.splash_w.set_progress(loaded)
 
-        self.setup_ui()
-        splash_w.close()
+    def on_load_finished(self):
+        if self.is_stale_signal():
+            return
+        profiler.mark("all wishes loaded")
+        self.loading_ended = True
+        self.report_startup()
+        # wishes of resumed import go to memory, so it has to be loaded first
+        unfinished_imports = self.db.get_unfinished_imports()
+        if unfinished_imports and not self.resume_imports:
+            logger.warning("{} imports were interrupted, start with --resume to finish them"
+                           .format(len(unfinished_imports)))
+        elif unfinished_imports:
+            self.resume_imports = False
+            QTimer.singleShot(0, lambda: self.resume_unfinished_imports(unfinished_imports))
+
+    def resume_unfinished_imports(self, unfinished_imports):
+        for import_id, banner_type, backend, started in unfinished_imports:
+            logger.info("Resuming import of {} started at {}".format(banner_type, started))
+            dialog = ImportWishDialog(banner_type, self.profiles.get_db_path(), backend, import_id)
+            dialog.reload_memory_wishes.connect(self.load_wishes_to_memory_from_db)
+            dialog.insert_wishes_to_memory.connect(self.add_wishes_to_memory)
+            dialog.exec_()
+
+    def on_load_failed(self, error):
+        if self.is_stale_signal():
+            return
+        self.close_splash_screen()
         self.show()
+        self.loading_ended = True
+        if self.first_painted:
+            self.report_startup()
+        else:
+            QTimer.singleShot(0, self.on_first_paint)
+
+    def close_splash_screen(self):
+        if self.splash_w is not None:
+            self.splash_w.close()
+            self.splash_w = None
 
     def setup_ui(self):
         self.setWindowTitle("Genshin Wish Viewer")
@@ -101,10 +299,10 @@ class Ui(QtWidgets.QMainWindow):
         self.closeButton.setIcon(QIcon("icons/exit_white.png"))
 
         # ----------SETTING TABLES----------
+        self.create_wish_table_models()
         self.characterBannerTableWidget.setColumnWidth(0, 120)  # was 130 without scrollbar
         self.characterBannerTableWidget.setColumnWidth(1, 118)  # 118
         self.characterBannerTableWidget.setColumnWidth(2, 30)
-        self.characterBannerTableWidget.setColumnHidden(3, True)
         for i in range(3):
             self.characterBannerTableWidget.horizontalHeader().setSectionResizeMode(i, QtWidgets.QHeaderView.Fixed)
         self.characterBannerTableWidget.verticalScrollBar().setStyleSheet("QScrollBar:vertical { border: none; background: rgb(75, 75, 75); width: 5px; margin: 5 0 0 0; border-radius: 2px; }"
@@ -117,7 +315,6 @@ class Ui(QtWidgets.QMainWindow):
         self.weaponBannerTableWidget.setColumnWidth(0, 120)  # was 130 without scrollbar
         self.weaponBannerTableWidget.setColumnWidth(1, 118)  # 118
         self.weaponBannerTableWidget.setColumnWidth(2, 30)
-        self.weaponBannerTableWidget.setColumnHidden(3, True)
         for i in range(3):
             self.weaponBannerTableWidget.horizontalHeader().setSectionResizeMode(i, QtWidgets.QHeaderView.Fixed)
         self.weaponBannerTableWidget.verticalScrollBar().setStyleSheet("QScrollBar:vertical { border: none; background: rgb(75, 75, 75); width: 5px; margin: 5 0 0 0; border-radius: 2px; }"
@@ -130,7 +327,6 @@ class Ui(QtWidgets.QMainWindow):
         self.standardBannerTableWidget.setColumnWidth(0, 120)  # was 130 without scrollbar
         self.standardBannerTableWidget.setColumnWidth(1, 118)  # 118
         self.standardBannerTableWidget.setColumnWidth(2, 30)
-        self.standardBannerTableWidget.setColumnHidden(3, True)
         for i in range(3):
             self.standardBannerTableWidget.horizontalHeader().setSectionResizeMode(i, QtWidgets.QHeaderView.Fixed)
         self.standardBannerTableWidget.verticalScrollBar().setStyleSheet("QScrollBar:vertical { border: none; background: rgb(75, 75, 75); width: 5px; margin: 5 0 0 0; border-radius: 2px; }"
@@ -143,7 +339,6 @@ class Ui(QtWidgets.QMainWindow):
         self.beginnerBannerTableWidget.setColumnWidth(0, 120)  # was 130 without scrollbar
         self.beginnerBannerTableWidget.setColumnWidth(1, 118)  # 118
         self.beginnerBannerTableWidget.setColumnWidth(2, 30)
-        self.beginnerBannerTableWidget.setColumnHidden(3, True)
         for i in range(3):
             self.beginnerBannerTableWidget.horizontalHeader().setSectionResizeMode(i, QtWidgets.QHeaderView.Fixed)
         self.beginnerBannerTableWidget.verticalScrollBar().setStyleSheet("QScrollBar:vertical { border: none; background: rgb(75, 75, 75); width: 5px; margin: 5 0 0 0; border-radius: 2px; }"
@@ -155,6 +350,8 @@ class Ui(QtWidgets.QMainWindow):
         # ----------DONE WITH SETTING TABLES----------
 
         self.menuBarVLayout.setAlignment(Qt.AlignTop)
+        self.setup_search()
+        self.setup_profile_selector()
 
         self.minimizeButton.clicked.connect(self.showMinimized)
         self.maximizeRestoreButton.clicked.connect(self.maximize_restore)
@@ -169,20 +366,54 @@ class Ui(QtWidgets.QMainWindow):
         self.beginnerBannerTableButton.clicked.connect(self.on_click_beginner_banner_table_button)
         self.beginnerBannerAddButton.clicked.connect(lambda: self.on_click_banner_add_button("wishBeginner"))
 
-        self.characterBannerFiveStarButton.clicked.connect(self.update_character_wish_table)
-        self.characterBannerFourStarButton.clicked.connect(self.update_character_wish_table)
+        self.characterBannerFiveStarButton.clicked.connect(lambda: self.update_wish_table("wishCharacter"))
+        self.characterBannerFourStarButton.clicked.connect(lambda: self.update_wish_table("wishCharacter"))
 
-        self.weaponBannerFiveStarButton.clicked.connect(self.update_weapon_wish_table)
-        self.weaponBannerFourStarButton.clicked.connect(self.update_weapon_wish_table)
+        self.weaponBannerFiveStarButton.clicked.connect(lambda: self.update_wish_table("wishWeapon"))
+        self.weaponBannerFourStarButton.clicked.connect(lambda: self.update_wish_table("wishWeapon"))
 
-        self.standardBannerFiveStarButton.clicked.connect(self.update_standard_wish_table)
-        self.standardBannerFourStarButton.clicked.connect(self.update_standard_wish_table)
+        self.standardBannerFiveStarButton.clicked.connect(lambda: self.update_wish_table("wishStandard"))
+        self.standardBannerFourStarButton.clicked.connect(lambda: self.update_wish_table("wishStandard"))
 
-        self.beginnerBannerFiveStarButton.clicked.connect(self.update_beginner_wish_table)
-        self.beginnerBannerFourStarButton.clicked.connect(self.update_beginner_wish_table)
+        self.beginnerBannerFiveStarButton.clicked.connect(lambda: self.update_wish_table("wishBeginner"))
+        self.beginnerBannerFourStarButton.clicked.connect(lambda: self.update_wish_table("wishBeginner"))
 
         self.update_wish_ui()
 
+    def create_wish_table_models(self):
+        self.banner_tables = {
+            "wishCharacter": (self.characterBannerTableWidget, self.characterBannerFiveStarButton,
+                              self.characterBannerFourStarButton),
+            "wishWeapon": (self.weaponBannerTableWidget, self.weaponBannerFiveStarButton,
+                           self.weaponBannerFourStarButton),
+            "wishStandard": (self.standardBannerTableWidget, self.standardBannerFiveStarButton,
+                             self.standardBannerFourStarButton),
+            "wishBeginner": (self.beginnerBannerTableWidget, self.beginnerBannerFiveStarButton,
+                             self.beginnerBannerFourStarButton)
+        }
+        self.banner_title_labels = {
+            "wishCharacter": self.characterBannerLabel_1,
+            "wishWeapon": self.weaponBannerLabel_1,
+            "wishStandard": self.standardBannerLabel_1,
+            "wishBeginner": self.beginnerBannerLabel_1
+        }
+        # (lifetime pulls, primogems, 5-star pity, 4-star pity)
+        self.banner_labels = {
+            "wishCharacter": (self.characterBannerLabel_2_3, self.characterBannerLabel_2_1_2,
+                              self.characterBannerLabel_3_3, self.characterBannerLabel_4_3),
+            "wishWeapon": (self.weaponBannerLabel_2_3, self.weaponBannerLabel_2_1_2,
+                           self.weaponBannerLabel_3_3, self.weaponBannerLabel_4_3),
+            "wishStandard": (self.standardBannerLabel_2_3, self.standardBannerLabel_2_1_2,
+                             self.standardBannerLabel_3_3, self.standardBannerLabel_4_3),
+            "wishBeginner": (self.beginnerBannerLabel_2_3, self.beginnerBannerLabel_2_1_2,
+                             self.beginnerBannerLabel_3_3, self.beginnerBannerLabel_4_3)
+        }
+        self.wish_table_models = {}
+        for banner_type, (table, five_star_button, four_star_button) in self.banner_tables.items():
+            self.wish_table_models[banner_type] = WishTableModel(self.db, banner_type, self)
+            table.setModel(self.wish_table_models[banner_type])
+            self.update_wish_table(banner_type)
+
     def on_click_close_button(self):
         self.close()
 
@@ -249,245 +480,172 @@ class Ui(QtWidgets.QMainWindow):
             self.beginnerBannerFrame_Bottom.updateGeometry()
             self.beginnerBannerFrame.adjustSize()
 
-    def update_character_wish_table(self):
-        # TODO rethink how to implement this
-        # maybe add hidden column with rarity and remove from end?
-        # clear table and sort by id
-        self.characterBannerTableWidget.setRowCount(0)
-        self.characterBannerTableWidget.sortItems(3, Qt.AscendingOrder)
-
-        if self.characterBannerFiveStarButton.isChecked():
-            pity_number_5_star = 0
-            for wish in self.wish_entries['wishCharacter']:
-                pity_number_5_star = pity_number_5_star + 1
-                if wish[3] == 5:
-                    self.characterBannerTableWidget.insertRow(self.characterBannerTableWidget.rowCount())
-
-                    self.characterBannerTableWidget.setItem(self.characterBannerTableWidget.rowCount() - 1, 0, QTableWidgetItem(wish[1]))  # name
-                    self.characterBannerTableWidget.setItem(self.characterBannerTableWidget.rowCount() - 1, 1, QTableWidgetItem(wish[2]))  # date
-                    self.characterBannerTableWidget.setItem(self.characterBannerTableWidget.rowCount() - 1, 2, QTableWidgetItem((' ' + str(pity_number_5_star))[-2:]))  # pity
-                    self.characterBannerTableWidget.setItem(self.characterBannerTableWidget.rowCount() - 1, 3, QTableWidgetItem("{:03d}".format(self.characterBannerTableWidget.rowCount() - 1)))  # id
-
-                    # color item to gold
-                    for column in range(3):
-                        self.characterBannerTableWidget.item(self.characterBannerTableWidget.rowCount() - 1, column).setForeground(QBrush(QColor(255, 215, 0)))
-                    pity_number_5_star = 0
-
-        if self.characterBannerFourStarButton.isChecked():
-            pity_number_4_star = 0
-            for wish in self.wish_entries['wishCharacter']:
-                pity_number_4_star = pity_number_4_star + 1
-                if wish[3] == 4:
-                    self.characterBannerTableWidget.insertRow(self.characterBannerTableWidget.rowCount())
-
-                    self.characterBannerTableWidget.setItem(self.characterBannerTableWidget.rowCount() - 1, 0, QTableWidgetItem(wish[1]))  # name
-                    self.characterBannerTableWidget.setItem(self.characterBannerTableWidget.rowCount() - 1, 1, QTableWidgetItem(wish[2]))  # date
-                    self.characterBannerTableWidget.setItem(self.characterBannerTableWidget.rowCount() - 1, 2, QTableWidgetItem((' ' + str(pity_number_4_star))[-2:])) # pity
-                    self.characterBannerTableWidget.setItem(self.characterBannerTableWidget.rowCount() - 1, 3, QTableWidgetItem("{:03d}".format(self.characterBannerTableWidget.rowCount() - 1)))  # id
-
-                    # color item to violet
-                    for column in range(3):
-                        self.characterBannerTableWidget.item(self.characterBannerTableWidget.rowCount() - 1, column).setForeground(QBrush(QColor(238, 130, 238)))
-                    pity_number_4_star = 0
-
-    def update_weapon_wish_table(self):
-        # TODO rethink how to implement this
-        # clear table and sort by id
-        self.weaponBannerTableWidget.setRowCount(0)
-        self.weaponBannerTableWidget.sortItems(3, Qt.AscendingOrder)
-
-        if self.weaponBannerFiveStarButton.isChecked():
-            pity_number_5_star = 0
-            for wish in self.wish_entries['wishWeapon']:
-                pity_number_5_star = pity_number_5_star + 1
-                if wish[3] == 5:
-                    self.weaponBannerTableWidget.insertRow(self.weaponBannerTableWidget.rowCount())
-
-                    self.weaponBannerTableWidget.setItem(self.weaponBannerTableWidget.rowCount() - 1, 0, QTableWidgetItem(wish[1]))  # name
-                    self.weaponBannerTableWidget.setItem(self.weaponBannerTableWidget.rowCount() - 1, 1, QTableWidgetItem(wish[2]))  # date
-                    self.weaponBannerTableWidget.setItem(self.weaponBannerTableWidget.rowCount() - 1, 2, QTableWidgetItem((' ' + str(pity_number_5_star))[-2:]))   # pity
-                    self.weaponBannerTableWidget.setItem(self.weaponBannerTableWidget.rowCount() - 1, 3, QTableWidgetItem("{:03d}".format(self.weaponBannerTableWidget.rowCount() - 1)))  # id
-
-                    # color item to gold
-                    for column in range(3):
-                        self.weaponBannerTableWidget.item(self.weaponBannerTableWidget.rowCount() - 1, column).setForeground(QBrush(QColor(255, 215, 0)))
-                    pity_number_5_star = 0
-
-        if self.weaponBannerFourStarButton.isChecked():
-            pity_number_4_star = 0
-            for wish in self.wish_entries['wishWeapon']:
-                pity_number_4_star = pity_number_4_star + 1
-                if wish[3] == 4:
-                    self.weaponBannerTableWidget.insertRow(self.weaponBannerTableWidget.rowCount())
-
-                    self.weaponBannerTableWidget.setItem(self.weaponBannerTableWidget.rowCount() - 1, 0, QTableWidgetItem(wish[1]))  # name
-                    self.weaponBannerTableWidget.setItem(self.weaponBannerTableWidget.rowCount() - 1, 1, QTableWidgetItem(wish[2]))  # date
-                    self.weaponBannerTableWidget.setItem(self.weaponBannerTableWidget.rowCount() - 1, 2, QTableWidgetItem((' ' + str(pity_number_4_star))[-2:]))  # pity
-                    self.weaponBannerTableWidget.setItem(self.weaponBannerTableWidget.rowCount() - 1, 3, QTableWidgetItem("{:03d}".format(self.weaponBannerTableWidget.rowCount() - 1)))  # id
-
-                    # color item to violet
-                    for column in range(3):
-                        self.weaponBannerTableWidget.item(self.weaponBannerTableWidget.rowCount() - 1, column).setForeground(QBrush(QColor(238, 130, 238)))
-                    pity_number_4_star = 0
-
-    def update_standard_wish_table(self):
-        # TODO rethink how to implement this
-        # clear table and sort by id
-        self.standardBannerTableWidget.setRowCount(0)
-        self.standardBannerTableWidget.sortItems(3, Qt.AscendingOrder)
-
-        if self.standardBannerFiveStarButton.isChecked():
-            pity_number_5_star = 0
-            for wish in self.wish_entries['wishStandard']:
-                pity_number_5_star = pity_number_5_star + 1
-                if wish[3] == 5:
-                    self.standardBannerTableWidget.insertRow(self.standardBannerTableWidget.rowCount())
-
-                    self.standardBannerTableWidget.setItem(self.standardBannerTableWidget.rowCount() - 1, 0, QTableWidgetItem(wish[1]))  # name
-                    self.standardBannerTableWidget.setItem(self.standardBannerTableWidget.rowCount() - 1, 1, QTableWidgetItem(wish[2]))  # date
-                    self.standardBannerTableWidget.setItem(self.standardBannerTableWidget.rowCount() - 1, 2, QTableWidgetItem((' ' + str(pity_number_5_star))[-2:]))  # pity
-                    self.standardBannerTableWidget.setItem(self.standardBannerTableWidget.rowCount() - 1, 3, QTableWidgetItem("{:03d}".format(self.standardBannerTableWidget.rowCount() - 1)))  # id
-                    # color item to gold
-                    for column in range(3):
-                        self.standardBannerTableWidget.item(self.standardBannerTableWidget.rowCount() - 1, column).setForeground(QBrush(QColor(255, 215, 0)))
-                    pity_number_5_star = 0
-
-        if self.standardBannerFourStarButton.isChecked():
-            pity_number_4_star = 0
-            for wish in self.wish_entries['wishStandard']:
-                pity_number_4_star = pity_number_4_star + 1
-                if wish[3] == 4:
-                    self.standardBannerTableWidget.insertRow(self.standardBannerTableWidget.rowCount())
-
-                    self.standardBannerTableWidget.setItem(self.standardBannerTableWidget.rowCount() - 1, 0, QTableWidgetItem(wish[1]))  # name
-                    self.standardBannerTableWidget.setItem(self.standardBannerTableWidget.rowCount() - 1, 1, QTableWidgetItem(wish[2]))  # date
-                    self.standardBannerTableWidget.setItem(self.standardBannerTableWidget.rowCount() - 1, 2, QTableWidgetItem((' ' + str(pity_number_4_star))[-2:]))  # pity
-                    self.standardBannerTableWidget.setItem(self.standardBannerTableWidget.rowCount() - 1, 3, QTableWidgetItem("{:03d}".format(self.standardBannerTableWidget.rowCount() - 1)))  # id
-
-                    # color item to violet
-                    for column in range(3):
-                        self.standardBannerTableWidget.item(self.standardBannerTableWidget.rowCount() - 1, column).setForeground(QBrush(QColor(238, 130, 238)))
-                    pity_number_4_star = 0
-
-    def update_beginner_wish_table(self):
-        # TODO rethink how to implement this
-        # clear table and sort by id
-        self.beginnerBannerTableWidget.setRowCount(0)
-        self.beginnerBannerTableWidget.sortItems(3, Qt.AscendingOrder)
-
-        if self.beginnerBannerFiveStarButton.isChecked():
-            pity_number_5_star = 0
-            for wish in self.wish_entries['wishBeginner']:
-                pity_number_5_star = pity_number_5_star + 1
-                if wish[3] == 5:
-                    self.beginnerBannerTableWidget.insertRow(self.beginnerBannerTableWidget.rowCount())
-
-                    self.beginnerBannerTableWidget.setItem(self.beginnerBannerTableWidget.rowCount() - 1, 0, QTableWidgetItem(wish[1]))  # name
-                    self.beginnerBannerTableWidget.setItem(self.beginnerBannerTableWidget.rowCount() - 1, 1, QTableWidgetItem(wish[2]))  # date
-                    self.beginnerBannerTableWidget.setItem(self.beginnerBannerTableWidget.rowCount() - 1, 2, QTableWidgetItem((' ' + str(pity_number_5_star))[-2:]))   # pity
-                    self.beginnerBannerTableWidget.setItem(self.beginnerBannerTableWidget.rowCount() - 1, 3, QTableWidgetItem("{:03d}".format(self.beginnerBannerTableWidget.rowCount() - 1)))  # id
-
-                    # color item to gold
-                    for column in range(3):
-                        self.beginnerBannerTableWidget.item(self.beginnerBannerTableWidget.rowCount() - 1, column).setForeground(QBrush(QColor(255, 215, 0)))
-                    pity_number_5_star = 0
-
-        if self.beginnerBannerFourStarButton.isChecked():
-            pity_number_4_star = 0
-            for wish in self.wish_entries['wishBeginner']:
-                pity_number_4_star = pity_number_4_star + 1
-                if wish[3] == 4:
-                    self.beginnerBannerTableWidget.insertRow(self.beginnerBannerTableWidget.rowCount())
-
-                    self.beginnerBannerTableWidget.setItem(self.beginnerBannerTableWidget.rowCount() - 1, 0, QTableWidgetItem(wish[1]))  # name
-                    self.beginnerBannerTableWidget.setItem(self.beginnerBannerTableWidget.rowCount() - 1, 1, QTableWidgetItem(wish[2]))  # date
-                    self.beginnerBannerTableWidget.setItem(self.beginnerBannerTableWidget.rowCount() - 1, 2, QTableWidgetItem((' ' + str(pity_number_4_star))[-2:]))  # pity
-                    self.beginnerBannerTableWidget.setItem(self.beginnerBannerTableWidget.rowCount() - 1, 3, QTableWidgetItem("{:03d}".format(self.beginnerBannerTableWidget.rowCount() - 1)))  # id
-
-                    # color item to violet
-                    for column in range(3):
-                        self.beginnerBannerTableWidget.item(self.beginnerBannerTableWidget.rowCount() - 1, column).setForeground(QBrush(QColor(238, 130, 238)))
-                    pity_number_4_star = 0
+    def setup_search(self):
+        # search box in title bar, results are shown on their own page of content stacked widget
+        self.search_widget = WishSearchWidget(self.db, self)
+        self.contentStackedWidget.addWidget(self.search_widget)
+        self.search_edit = QLineEdit(self)
+        self.search_edit.setPlaceholderText("Search wishes...")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.setFixedWidth(220)
+        self.search_edit.setStyleSheet("QLineEdit { background-color: rgb(60, 60, 60); color: white;"
+                                       " border: none; border-radius: 4px; padding: 2px 6px; }")
+        self.titleBarHLayout_1.addWidget(self.search_edit)
+        self.search_edit.textChanged.connect(self.on_search_text_changed)
+        self.wishCounterButton.clicked.connect(lambda: self.search_edit.clear())
+
+    def setup_profile_selector(self):
+        # profile (account) selector in title bar, last item adds new profile
+        self.profile_combo_box = QComboBox(self)
+        self.profile_combo_box.setFixedWidth(160)
+        self.profile_combo_box.setStyleSheet("QComboBox { background-color: rgb(60, 60, 60); color: white;"
+                                             " border: none; border-radius: 4px; padding: 2px 6px; }")
+        self.titleBarHLayout_1.addWidget(self.profile_combo_box)
+        self.update_profile_selector()
+        self.profile_combo_box.activated.connect(self.on_profile_selected)
+
+    def update_profile_selector(self):
+        self.profile_combo_box.blockSignals(True)
+        self.profile_combo_box.clear()
+        for uid, profile in self.profiles.profiles.items():
+            self.profile_combo_box.addItem(profile["name"], uid)
+        self.profile_combo_box.addItem("Add profile...", None)
+        self.profile_combo_box.setCurrentIndex(self.profile_combo_box.findData(self.profiles.active))
+        self.profile_combo_box.blockSignals(False)
+
+    def on_profile_selected(self, index):
+        uid = self.profile_combo_box.itemData(index)
+        if uid is None:
+            uid, accepted = QInputDialog.getText(self, "Add profile", "UID of account:")
+            uid = uid.strip()
+            if not accepted or not uid:
+                self.update_profile_selector()
+                return
+            if uid not in self.profiles.profiles:
+                try:
+                    self.profiles.add_profile(uid)
+                except Exception as e:
+                    logger.error("Couldn't add profile. {}".format(e))
+                    QMessageBox.warning(self, "Add profile", str(e))
+                    self.update_profile_selector()
+                    return
+        if uid != self.profiles.active:
+            self.switch_profile(uid)
+        self.update_profile_selector()
+
+    def on_search_text_changed(self, text):
+        if text.strip():
+            self.search_widget.set_query(text)
+            self.contentStackedWidget.setCurrentWidget(self.search_widget)
+        else:
+            self.contentStackedWidget.setCurrentWidget(self.wishCounterPage)
+
+    def update_wish_table(self, banner_type):
+        # table model fetches rows from database by itself, just tell it which rarities should be shown
+        table, five_star_button, four_star_button = self.banner_tables[banner_type]
+        rarities = []
+        if five_star_button.isChecked():
+            rarities.append(5)
+        if four_star_button.isChecked():
+            rarities.append(4)
+        self.wish_table_models[banner_type].set_filter(rarities)
 
     def on_click_banner_add_button(self, banner_type):
-        dialog = ImportWishDialog(banner_type)
+        if banner_type in self.loading_banners:
+            logger.info("Wishes of {} are still loading, try again in a moment.".format(banner_type))
+            return
+        dialog = ImportWishDialog(banner_type, self.profiles.get_db_path(), self.ocr_backend)
         dialog.reload_memory_wishes.connect(self.load_wishes_to_memory_from_db)
         dialog.insert_wishes_to_memory.connect(self.add_wishes_to_memory)
         dialog.exec_()
 
     def load_wishes_to_memory_from_db(self):
         for key in self.wish_entries:
-            self.wish_entries[key] = self.db.get_wishes_from_table(key)
-        self.update_wish_ui()
+            self.wish_entries[key].clear()
+            self.wish_entries[key].append_many(self.db.get_wishes_from_table(key))
+            self.pity_trackers[key].reset()
+            self.pity_trackers[key].add_wishes(self.wish_entries[key].get_rarities())
+            self.mark_banner_dirty(key, reloaded=True)
 
     def add_wishes_to_memory(self, wishes, banner_type):
         # someone could give wrong banner_type
-        for wish in wishes:
-            self.wish_entries[banner_type].append(wish)
-        self.update_wish_ui(banner_type)
-
-    def update_character_wish_ui(self):
-        self.characterBannerLabel_2_3.setText("{}".format(len(self.wish_entries['wishCharacter'])))  # lifetime pulls
-        self.characterBannerLabel_2_1_2.setText(
-            "{:,}".format(len(self.wish_entries['wishCharacter']) * 160).replace(',', ' '))  # primo
-        self.characterBannerLabel_3_3.setText(
-            "{}".format(self.get_pity_number(self.wish_entries['wishCharacter'], 5)))  # 5* pity
-        self.characterBannerLabel_4_3.setText(
-            "{}".format(self.get_pity_number(self.wish_entries['wishCharacter'], 4)))  # 4* pity
-
-    def update_weapon_wish_ui(self):
-        self.weaponBannerLabel_2_3.setText("{}".format(len(self.wish_entries['wishWeapon'])))  # lifetime pulls
-        self.weaponBannerLabel_2_1_2.setText(
-            "{:,}".format(len(self.wish_entries['wishWeapon']) * 160).replace(',', ' '))  # primo
-        self.weaponBannerLabel_3_3.setText(
-            "{}".format(self.get_pity_number(self.wish_entries['wishWeapon'], 5)))  # 5* pity
-        self.weaponBannerLabel_4_3.setText(
-            "{}".format(self.get_pity_number(self.wish_entries['wishWeapon'], 4)))  # 4* pity
-
-    def update_standard_wish_ui(self):
-        self.standardBannerLabel_2_3.setText("{}".format(len(self.wish_entries['wishStandard'])))  # lifetime pulls
-        self.standardBannerLabel_2_1_2.setText(
-            "{:,}".format(len(self.wish_entries['wishStandard']) * 160).replace(',', ' '))  # primo
-        self.standardBannerLabel_3_3.setText(
-            "{}".format(self.get_pity_number(self.wish_entries['wishStandard'], 5)))  # 5* pity
-        self.standardBannerLabel_4_3.setText(
-            "{}".format(self.get_pity_number(self.wish_entries['wishStandard'], 4)))  # 4* pity
-
-    def update_beginner_wish_ui(self):
-        self.beginnerBannerLabel_2_3.setText("{}".format(len(self.wish_entries['wishBeginner'])))  # lifetime pulls
-        self.beginnerBannerLabel_2_1_2.setText(
-            "{:,}".format(len(self.wish_entries['wishBeginner']) * 160).replace(',', ' '))  # primo
-        self.beginnerBannerLabel_3_3.setText(
-            "{}".format(self.get_pity_number(self.wish_entries['wishBeginner'], 5)))  # 5* pity
-        self.beginnerBannerLabel_4_3.setText(
-            "{}".format(self.get_pity_number(self.wish_entries['wishBeginner'], 4)))  # 4* pity
+        self.wish_entries[banner_type].append_many(wishes)
+        self.pity_trackers[banner_type].add_wishes([wish[3] for wish in wishes])
+        self.mark_banner_dirty(banner_type)
+
+    def mark_banner_dirty(self, banner_type, reloaded=False):
+        """Schedules refresh of banner labels and table. Refresh is done on next tick of event loop, so many changes
+        (e.g. every imported image emits new wishes) are coalesced into one repaint.
+        :param banner_type: table name of banner
+        :param reloaded: whole banner was reloaded from database, not only appended
+        :return:
+        """
+        self.dirty_banners.add(banner_type)
+        if reloaded:
+            self.reloaded_banners.add(banner_type)
+        if not self.refresh_timer.isActive():
+            # don't refresh more often than min_refresh_interval, even if wishes come in slowly one by one
+            delay = self.min_refresh_interval - (time.monotonic() - self.last_refresh_time)
+            self.refresh_timer.start(max(0, int(delay * 1000)))
+
+    def refresh_dirty_banners(self):
+        self.last_refresh_time = time.monotonic()
+        dirty_banners = self.dirty_banners
+        reloaded_banners = self.reloaded_banners
+        self.dirty_banners = set()
+        self.reloaded_banners = set()
+        logger.debug("Refreshing banners: {}".format(dirty_banners))
+        for banner_type in dirty_banners:
+            self.update_wish_ui(banner_type)
+            self.update_banner_statistics(banner_type)
+            if banner_type in reloaded_banners:
+                self.update_wish_table(banner_type)
+            else:
+                # wishes were only appended - existing rows didn't change, so just add new ones at the end
+                self.wish_table_models[banner_type].fetch_new_rows()
+
+    def update_banner_statistics(self, banner_type):
+        # statistics are cached by analytics, so they are recomputed only if database changed
+        statistics = self.analytics.get_banner_statistics(banner_type)
+        lines = []
+        for rarity, key in [(5, "five_star"), (4, "four_star")]:
+            pity = statistics[key]
+            luck = statistics["luck"][key]
+            if pity["count"]:
+                lines.append("{} ★: {}, average pity {:.1f} (expected {:.1f}), median pity {:.0f}"
+                             .format(rarity, pity["count"], pity["average_pity"], luck["expected_pity"],
+                                     pity["percentiles"][50]))
+            else:
+                lines.append("{} ★: none yet (expected pity {:.1f})".format(rarity, luck["expected_pity"]))
+        fifty_fifty = statistics["fifty_fifty"]
+        if fifty_fifty is not None and fifty_fifty["win_rate"] is not None:
+            lines.append("50/50: won {}, lost {} ({:.0%}), next 5 ★ is {}guaranteed"
+                         .format(fifty_fifty["won"], fifty_fifty["lost"], fifty_fifty["win_rate"],
+                                 "" if fifty_fifty["next_is_guaranteed"] else "not "))
+        self.banner_title_labels[banner_type].setToolTip("\n".join(lines))
+
+    def set_label_text(self, label, text):
+        # skip labels, which value didn't change
+        if self.label_texts.get(label) == text:
+            return
+        self.label_texts[label] = text
+        label.setText(text)
+
+    def set_banner_labels(self, banner_type, pulls, five_star_pity, four_star_pity):
+        pulls_label, primo_label, five_star_label, four_star_label = self.banner_labels[banner_type]
+        self.set_label_text(pulls_label, "{}".format(pulls))  # lifetime pulls
+        self.set_label_text(primo_label, "{:,}".format(pulls * 160).replace(',', ' '))  # primo
+        self.set_label_text(five_star_label, "{}".format(five_star_pity))  # 5* pity
+        self.set_label_text(four_star_label, "{}".format(four_star_pity))  # 4* pity
 
     def update_wish_ui(self, to_update=None):
-        # TODO dont update ui, if it wasn't changed
-        if to_update is None:
-            self.update_character_wish_ui()
-            self.update_weapon_wish_ui()
-            self.update_standard_wish_ui()
-            self.update_beginner_wish_ui()
-
-        elif to_update == 'wishCharacter':
-            self.update_character_wish_ui()
-        elif to_update == 'wishWeapon':
-            self.update_weapon_wish_ui()
-        elif to_update == 'wishStandard':
-            self.update_standard_wish_ui()
-        elif to_update == 'wishBeginner':
-            self.update_beginner_wish_ui()
-
-    def get_pity_number(self, wish_list, rarity):
-        # if wish_list is empty
-        if not wish_list:
-            return 0
-        for idx, wish in enumerate(reversed(wish_list)):
-            if wish[3] == rarity:
-                return idx
-        # there are entries, but none with sought rarity
-        return len(wish_list)
+        for banner_type in ([to_update] if to_update is not None else self.banner_labels):
+            if banner_type in self.loading_banners:
+                # banner is still loading, labels show values from headers
+                continue
+            self.set_banner_labels(banner_type, len(self.wish_entries[banner_type]),
+                                   self.pity_trackers[banner_type].get_pity(5),
+                                   self.pity_trackers[banner_type].get_pity(4))
 
     def make_window_frameless(self):
         self.setWindowFlags(Qt.FramelessWindowHint)
@@ -607,11 +765,15 @@ class Ui(QtWidgets.QMainWindow):
 
 
 def main():
+    profiler.reset(start_time)
+    profiler.add_phase("imports", start_time, time.perf_counter())
     args = parse_arguments()
+    profiler.enabled = args.profile_startup
     init_logger(args.debug)
 
-    app = QtWidgets.QApplication(sys.argv)
-    window = Ui()
+    with profiler.phase("create QApplication"):
+        app = QtWidgets.QApplication(sys.argv)
+    window = Ui(args.profile, args.ocr_backend, args.resume)
     app.exec_()
 
     # wi = WishImporter('db')
@@ -1,8 +1,10 @@
 from PyQt5.QtGui import QIcon, QColor, QBitmap, QPainter
-from PyQt5.QtCore import Qt, QRect, QPoint, pyqtSignal
-from PyQt5.QtWidgets import QFrame, QVBoxLayout, QHBoxLayout, QSizePolicy, QProgressBar, QPushButton, QLabel, QDialog, QFileDialog
+from PyQt5.QtCore import Qt, QRect, QPoint, pyqtSignal, QTimer
+from PyQt5.QtWidgets import QFrame, QVBoxLayout, QHBoxLayout, QSizePolicy, QProgressBar, QPushButton, QLabel, QDialog, QFileDialog, QComboBox
 from importer import WishImporter
+from ocr_backends import backends, create_backend
 from database import WishDatabase
+from banner_index import BannerList
 import threading
 import logging
 
@@ -11,22 +13,53 @@ logger = logging.getLogger('GenshinWishViewer')
 
 class ImportWishDialog(QDialog):
     banner_type = ""
+    db_path = ""
+    ocr_backend = "tesseract"
     selected_files = []
+    import_id = None  # journal of import in database, set when import starts or is resumed
 
     number_label = None
     select_button = None
     accept_button = None
+    backend_combo = None
     exit_button = None
     progress_bar = None
 
     reload_memory_wishes = pyqtSignal()
     insert_wishes_to_memory = pyqtSignal(list, str)
-
-    def __init__(self, banner_type):
+    # widgets are changed only from GUI thread, import thread sends its progress through these
+    progress_value_changed = pyqtSignal(int)
+    progress_format_changed = pyqtSignal(str)
+    progress_tooltip_changed = pyqtSignal(str)
+    import_finished = pyqtSignal()
+
+    def __init__(self, banner_type, db_path, ocr_backend=None, import_id=None):
+        """
+        :param banner_type: table name of banner
+        :param db_path: path to WishDatabase
+        :param ocr_backend: name of OCR backend preselected in dialog
+        :param import_id: id of interrupted import, which is resumed as soon as dialog is shown
+        """
         QDialog.__init__(self)
         self.banner_type = banner_type
+        self.db_path = db_path
+        if ocr_backend is not None:
+            self.ocr_backend = ocr_backend
         self.setup_ui()
         self.setup_ui_logic()
+        if import_id is not None:
+            self.resume_import(import_id)
+
+    def resume_import(self, import_id):
+        # screenshots, which were already read, are only merged, the rest of them is read
+        self.import_id = import_id
+        self.selected_files = [row[1] for row in WishDatabase(self.db_path).get_import_images(import_id)]
+        self.number_label.setText("Resuming import of {} images".format(len(self.selected_files)))
+        self.progress_bar.setRange(0, len(self.selected_files))
+        self.progress_bar.setFormat("%v/{}".format(len(self.selected_files)))
+        self.select_button.setDisabled(True)
+        self.backend_combo.setDisabled(True)
+        QTimer.singleShot(0, self.on_click_accept_button)
 
     def setup_ui(self):
         self.setMinimumSize(250, 275)
@@ -103,6 +136,12 @@ class ImportWishDialog(QDialog):
         self.select_button.setMinimumSize(50, 50)
         content_layout.addWidget(self.select_button)
 
+        self.backend_combo = QComboBox(self)
+        self.backend_combo.addItems(list(backends))
+        self.backend_combo.setCurrentText(self.ocr_backend)
+        self.backend_combo.setToolTip("OCR backend used to read screenshots")
+        content_layout.addWidget(self.backend_combo)
+
         self.accept_button = QPushButton("Accept", self)
         self.accept_button.setMinimumSize(50, 50)
         content_layout.addWidget(self.accept_button)
@@ -122,10 +161,15 @@ class ImportWishDialog(QDialog):
         self.select_button.clicked.connect(self.on_click_select_button)
         self.accept_button.clicked.connect(self.on_click_accept_button)
         self.exit_button.clicked.connect(self.on_click_exit_button)
+        self.progress_value_changed.connect(self.progress_bar.setValue)
+        self.progress_format_changed.connect(self.progress_bar.setFormat)
+        self.progress_tooltip_changed.connect(self.progress_bar.setToolTip)
+        self.import_finished.connect(self.unlock_ui)
 
     def on_click_select_button(self):
         files = QFileDialog.getOpenFileNames(self, "Select one or more files to open", "C:", "Images (*.png *.jpg)")
         self.selected_files = files[0]
+        self.import_id = None  # new selection is new import, failed one is left for --resume
         self.number_label.setText("Selected {} images".format(len(self.selected_files)))
         self.progress_bar.setValue(0)
         if self.selected_files:
@@ -136,7 +180,8 @@ class ImportWishDialog(QDialog):
 
     def on_click_accept_button(self):
         # insert wishes to db using importer
-        import_thread = threading.Thread(target=self.import_images_thread)
+        self.lock_ui()
+        import_thread = threading.Thread(target=self.import_images_thread, args=(self.backend_combo.currentText(),))
         import_thread.start()
 
     def on_click_exit_button(self):
@@ -159,25 +204,61 @@ class ImportWishDialog(QDialog):
         painter.end()
         self.setMask(bitmap)
 
-    def import_images_thread(self):
-        wi = WishImporter(WishDatabase("db.db"))
-        self.lock_ui()
+    def import_images_thread(self, backend_name):
+        """Runs in its own thread, UI is unlocked when import ends, even if it fails. Failed import stays unfinished
+        in journal.
+        :param backend_name: name of OCR backend, which reads screenshots
+        :return:
+        """
+        try:
+            self.import_images(backend_name)
+        except Exception as e:
+            logger.error("Import of {} failed. {}".format(self.banner_type, e))
+            self.progress_format_changed.emit("Import failed")
+            self.progress_tooltip_changed.emit(str(e))
+        finally:
+            # import_id of failed import is kept, so Accept resumes it instead of starting new import
+            self.import_finished.emit()
+
+    def import_images(self, backend_name):
+        try:
+            backend = create_backend(backend_name)
+        except Exception as e:
+            logger.error("Couldn't create OCR backend. {}".format(e))
+            self.progress_format_changed.emit("OCR backend isn't available")
+            return
+        wi = WishImporter(WishDatabase(self.db_path), backend)
 
         if self.banner_type not in ["wishCharacter", "wishWeapon", "wishStandard", "wishBeginner"]:
             logger.error("Wrong table name!")
             return
-        for count, img_path in enumerate(self.selected_files, start=1):
-            wishes = wi.get_wishes_from_imagev2(img_path)
-            wi.insert_to_db(wishes, self.banner_type)
-            self.insert_wishes_to_memory.emit(wishes, self.banner_type)
-            self.progress_bar.setValue(count)
-        self.unlock_ui()
-        self.progress_bar.setFormat("Done")
+        if self.import_id is None:
+            self.import_id = wi.db.start_import(self.banner_type, backend.name, self.selected_files)
+        merger, new_wishes = wi.import_journaled(self.import_id, self.progress_value_changed.emit)
+        self.import_id = None
+        BannerList().annotate_database(wi.db, [self.banner_type])
+        # wishes in memory can be only appended, once page went into the middle of history, they're reloaded
+        if merger.needs_reload:
+            self.reload_memory_wishes.emit()
+        elif new_wishes:
+            self.insert_wishes_to_memory.emit(new_wishes, self.banner_type)
+        for gap in merger.get_gaps():
+            logger.warning("Wishes of {} are missing between {} and {} ({})".format(
+                self.banner_type, gap["after"], gap["before"], gap["reason"]))
+        report = "{}, {}".format(merger.get_report(), wi.get_import_report())
+        logger.info("Import finished: {}".format(report))
+        self.progress_tooltip_changed.emit(report)
+        if wi.review_list:
+            self.progress_format_changed.emit("Done - {} wishes to review".format(len(wi.review_list)))
+        else:
+            self.progress_format_changed.emit("Done")
 
     def lock_ui(self):
         self.select_button.setDisabled(True)
         self.accept_button.setDisabled(True)
+        self.backend_combo.setDisabled(True)
 
     def unlock_ui(self):
         self.select_button.setDisabled(False)
         self.accept_button.setDisabled(False)
+        self.backend_combo.setDisabled(False)
@@ -0,0 +1,148 @@
+from PyQt5.QtGui import QBrush
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QComboBox, QLabel, QTableView, QHeaderView
+from WishTableModel import WishTableModel
+import logging
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class WishSearchModel(QAbstractTableModel):
+    # Results of WishDatabase.search_wishes, fetched in pages while view scrolls (like WishTableModel)
+    page_size = 50
+    header_labels = ["Banner", "Name", "Date"]
+    banner_names = {"wishCharacter": "Character", "wishWeapon": "Weapon", "wishStandard": "Standard",
+                    "wishBeginner": "Beginner"}
+
+    db = None
+
+    def __init__(self, db, parent=None):
+        QAbstractTableModel.__init__(self, parent)
+        self.db = db
+        self.rows = []  # banner, id, itemType, itemName, timeReceived, itemRarity
+        self.search = {}
+        self.count = 0
+        self.all_fetched = True
+
+    def set_search(self, query, table_names=None, rarities=None):
+        """Starts new search, first page is fetched right away to get number of all results.
+        :return: number of all matching wishes
+        """
+        self.beginResetModel()
+        self.search = {"query": query, "table_names": table_names, "rarities": rarities}
+        self.rows = []
+        self.count, page = self.db.search_wishes(limit=self.page_size, **self.search)
+        self.rows.extend(page)
+        self.all_fetched = len(self.rows) >= self.count
+        self.endResetModel()
+        return self.count
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.header_labels)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            if index.column() == 0:
+                return self.banner_names[row[0]]
+            return row[index.column() + 2]  # name, date
+        elif role == Qt.ForegroundRole:
+            if row[5] in WishTableModel.rarity_colors:
+                return QBrush(WishTableModel.rarity_colors[row[5]])
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.header_labels[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return not self.all_fetched
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.all_fetched:
+            return
+        count, page = self.db.search_wishes(limit=self.page_size, cursor=self.rows[-1], **self.search)
+        if not page:
+            self.all_fetched = True
+            return
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+        self.rows.extend(page)
+        self.endInsertRows()
+        self.all_fetched = len(page) < self.page_size or len(self.rows) >= self.count
+
+
+class WishSearchWidget(QWidget):
+    # Search page - search box with banner and rarity filters and table of found wishes.
+    # Search runs when user stops typing for search_delay, not on every key press.
+    search_delay = 150  # ms
+    rarity_filters = [("All rarities", None), ("5 ★", [5]), ("4 ★", [4]), ("3 ★", [3])]
+
+    def __init__(self, db, parent=None):
+        QWidget.__init__(self, parent)
+        self.model = WishSearchModel(db, self)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.run_search)
+        self.setup_ui()
+
+    def setup_ui(self):
+        self.search_edit = QLineEdit(self)
+        self.search_edit.setPlaceholderText("Search wishes, e.g. Skyward Harp")
+        self.search_edit.setClearButtonEnabled(True)
+        self.banner_combo = QComboBox(self)
+        self.banner_combo.addItem("All banners", None)
+        for table_name, banner_name in WishSearchModel.banner_names.items():
+            self.banner_combo.addItem(banner_name, table_name)
+        self.rarity_combo = QComboBox(self)
+        for label, rarities in self.rarity_filters:
+            self.rarity_combo.addItem(label, rarities)
+        self.count_label = QLabel(self)
+        self.count_label.setStyleSheet("color: rgb(200, 200, 200);")
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(self.search_edit, 1)
+        filter_layout.addWidget(self.banner_combo)
+        filter_layout.addWidget(self.rarity_combo)
+        filter_layout.addWidget(self.count_label)
+
+        self.table = QTableView(self)
+        self.table.setModel(self.model)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(filter_layout)
+        layout.addWidget(self.table)
+
+        self.search_edit.textChanged.connect(self.schedule_search)
+        self.banner_combo.currentIndexChanged.connect(self.schedule_search)
+        self.rarity_combo.currentIndexChanged.connect(self.schedule_search)
+
+    def set_database(self, db):
+        # active profile changed
+        self.model.db = db
+        self.schedule_search()
+
+    def set_query(self, query):
+        self.search_edit.setText(query)
+
+    def schedule_search(self):
+        self.search_timer.start(self.search_delay)
+
+    def run_search(self):
+        table_name = self.banner_combo.currentData()
+        count = self.model.set_search(self.search_edit.text(), [table_name] if table_name else None,
+                                      self.rarity_combo.currentData())
+        self.count_label.setText("{} wishes".format(count))
@@ -0,0 +1,111 @@
+from PyQt5.QtGui import QBrush, QColor
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from pity_tracker import PityTracker
+import logging
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class WishTableModel(QAbstractTableModel):
+    # Model for banner tables. It doesn't keep whole banner history in memory - rows are fetched from database
+    # in pages, when view asks for them (canFetchMore/fetchMore is called by view while scrolling).
+    # So memory usage and time to first paint depends on how many rows are visible, not on number of wishes in db.
+    page_size = 50
+    header_labels = ["Name", "Date", "Pity"]
+    rarity_colors = {5: QColor(255, 215, 0),  # gold
+                     4: QColor(238, 130, 238)}  # violet
+
+    db = None
+    table_name = ""
+    rarities = None
+    date_from = None
+    date_to = None
+
+    def __init__(self, db, table_name, parent=None):
+        QAbstractTableModel.__init__(self, parent)
+        self.db = db
+        self.table_name = table_name
+        self.rows = []  # id, itemType, itemName, timeReceived, itemRarity, pity
+        self.cursor = None  # (timeReceived, id) of last fetched row
+        self.all_fetched = True
+
+    def set_filter(self, rarities, date_from=None, date_to=None):
+        """Drops fetched rows and starts paging again with new filter. Nothing is fetched until view asks for it.
+        :param rarities: list of rarities to show, empty list shows nothing
+        :param date_from: show only wishes received at or after this date
+        :param date_to: show only wishes received before this date
+        :return:
+        """
+        self.beginResetModel()
+        self.rarities = list(rarities)
+        self.date_from = date_from
+        self.date_to = date_to
+        self.rows = []
+        self.cursor = None
+        self.all_fetched = not self.rarities
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.header_labels)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            if index.column() == 0:
+                return row[2]  # name
+            elif index.column() == 1:
+                return row[3]  # date
+            else:
+                return (' ' + str(row[5]))[-2:]  # pity
+        elif role == Qt.ForegroundRole:
+            if row[4] in self.rarity_colors:
+                return QBrush(self.rarity_colors[row[4]])
+        elif role == Qt.TextAlignmentRole:
+            if index.column() == 2:
+                return Qt.AlignRight | Qt.AlignVCenter
+            return Qt.AlignLeft | Qt.AlignVCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.header_labels[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return not self.all_fetched
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.all_fetched:
+            return
+        page = self.db.get_pity_entries(self.table_name, self.rarities, self.cursor, self.page_size,
+                                        date_from=self.date_from, date_to=self.date_to,
+                                        four_star_resets_on_five_star=self.table_name in
+                                        PityTracker.four_star_reset_banners)
+        if len(page) < self.page_size:
+            self.all_fetched = True
+        if not page:
+            return
+        logger.debug("Fetched {} rows of {} table".format(len(page), self.table_name))
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+        self.rows.extend(page)
+        self.cursor = (page[-1][3], page[-1][0])
+        self.endInsertRows()
+
+    def fetch_new_rows(self):
+        # wishes were appended to banner - if all rows were already fetched, then everything after cursor is new.
+        # Otherwise new rows will be fetched, when user scrolls to them.
+        if not self.rarities or not self.all_fetched:
+            return
+        self.all_fetched = False
+        self.fetchMore()
@@ -0,0 +1,96 @@
+import numpy as np
+import logging
+from pity_tracker import PityTracker
+from pull_model import banner_models
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class WishAnalytics:
+    # Statistics of banners computed from WishDatabase. Results are cached together with database change counter,
+    # so rendering dashboard again doesn't compute anything, unless new wishes were written to database.
+    percentiles = [25, 50, 75, 90]
+
+    def __init__(self, db):
+        self.db = db
+        self.cache = {}  # table name -> (change counter, statistics)
+
+    def get_banner_statistics(self, table_name):
+        """Returns statistics of one banner:
+        pulls - number of wishes
+        five_star, four_star - count, average pity and pity percentiles
+        pulls_per_five_star - histogram, pulls_per_five_star[k] is how many times 5-star took k wishes
+        fifty_fifty - won/lost/guaranteed 5-stars, unknown ones (on unknown banners or after them), win rate and if
+                      next 5-star is guaranteed (None for banners without rate up)
+        luck - expected pity according to soft pity model and average percentile of pities in that model
+               (0.5 is average luck, less is luckier)
+        :param table_name: one of WishDatabase.wish_table_names
+        :return: dict
+        """
+        change_counter = self.db.get_change_counter()
+        cached = self.cache.get(table_name)
+        if cached is not None and cached[0] == change_counter:
+            return cached[1]
+        logger.debug("Computing statistics of {}".format(table_name))
+        statistics = self.compute_banner_statistics(table_name)
+        self.cache[table_name] = (change_counter, statistics)
+        return statistics
+
+    def get_statistics(self):
+        return {table_name: self.get_banner_statistics(table_name) for table_name in self.db.wish_table_names}
+
+    def compute_banner_statistics(self, table_name):
+        model = banner_models[table_name]
+        entries = self.db.get_pity_entries(table_name, four_star_resets_on_five_star=table_name in
+                                           PityTracker.four_star_reset_banners)
+        rarities = np.array([entry[4] for entry in entries], dtype=np.int64)
+        pities = np.array([entry[5] for entry in entries], dtype=np.int64)
+        five_star_pities = pities[rarities == 5]
+        four_star_pities = pities[rarities == 4]
+        return {
+            "pulls": self.db.get_number_of_elements_in_table(table_name),
+            "five_star": self.get_pity_statistics(five_star_pities),
+            "four_star": self.get_pity_statistics(four_star_pities),
+            "pulls_per_five_star": np.bincount(five_star_pities, minlength=model.hard_pity + 1),
+            "fifty_fifty": self.get_fifty_fifty_statistics(table_name, model),
+            "luck": {
+                "five_star": self.get_luck(five_star_pities, model, 5),
+                "four_star": self.get_luck(four_star_pities, model, 4)
+            }
+        }
+
+    def get_pity_statistics(self, pities):
+        if not len(pities):
+            return {"count": 0, "average_pity": None, "percentiles": None}
+        return {"count": len(pities),
+                "average_pity": float(np.mean(pities)),
+                "percentiles": dict(zip(self.percentiles, np.percentile(pities, self.percentiles).tolist()))}
+
+    def get_fifty_fifty_statistics(self, table_name, model):
+        if model.rate_up_chance is None:
+            return None
+        # 1 - rate up item, 0 - lost 50/50, -1 - unknown (wish on banner, which isn't in banner list)
+        rate_up = np.array([-1 if value is None else value for value in self.db.get_rate_up_of_hits(table_name, 5)],
+                           dtype=np.int8)
+        # 5-star after lost 50/50 is guaranteed to be rate up item, after unknown one it isn't known if it was 50/50,
+        # so it isn't counted as won or lost
+        previous = np.ones_like(rate_up)
+        previous[1:] = rate_up[:-1]
+        guaranteed = previous == 0
+        won = int(np.count_nonzero((rate_up == 1) & (previous == 1)))
+        lost = int(np.count_nonzero((rate_up == 0) & (previous == 1)))
+        return {"won": won,
+                "lost": lost,
+                "guaranteed": int(np.count_nonzero(guaranteed)),
+                "unknown": len(rate_up) - won - lost - int(np.count_nonzero(guaranteed)),
+                "win_rate": won / (won + lost) if won + lost else None,
+                "next_is_guaranteed": bool(len(rate_up) and rate_up[-1] == 0)}
+
+    def get_luck(self, pities, model, rarity):
+        expected_pity = model.get_expected_pity(rarity)
+        if not len(pities):
+            return {"expected_pity": expected_pity, "average_percentile": None}
+        cdf = model.get_pity_cdf(rarity)
+        # pity above hard pity can only come from missing screenshots, count it as the most unlucky one
+        percentiles = cdf[np.minimum(pities, len(cdf)) - 1]
+        return {"expected_pity": expected_pity, "average_percentile": float(np.mean(percentiles))}
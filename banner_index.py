@@ -0,0 +1,144 @@
+import numpy as np
+import hashlib
+import json
+import logging
+from catalog import get_catalog
+from wish_store import parse_timestamps, invalid_timestamp
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class BannerIndex:
+    # Interval index over banners of one wish table from banner_list.json.
+    # Banners are kept in arrays sorted by start, so banner of every wish can be found by np.searchsorted.
+    # Banners can overlap (double banners have the same dates, and one banner often ends the day the next one starts),
+    # so after searchsorted we also look at a few previous banners - max_overlap is computed when index is built.
+    # If a wish fits into more than one banner, the one which has the item on rate up wins.
+    unknown_banner_id = 0  # banner ids in banner_list.json start from 1
+
+    def __init__(self, banners):
+        """
+        :param banners: list of banners of one type from banner_list.json
+        """
+        banners = sorted(banners, key=lambda banner: banner["start"])
+        self.banner_ids = np.array([int(banner["id"]) for banner in banners], dtype=np.int64)
+        self.starts = parse_timestamps([banner["start"] for banner in banners])
+        self.ends = np.empty(len(banners), dtype=np.int64)
+        for i, banner in enumerate(banners):
+            if banner["end"] == "Indefinite":
+                self.ends[i] = np.iinfo(np.int64).max
+                continue
+            # banner lasts until the end of its last day
+            self.ends[i] = parse_timestamps([banner["end"]])[0] + 24 * 60 * 60 - 1
+            if self.ends[i] < self.starts[i]:
+                logger.warning("Banner {} ({}) ends before it starts!".format(banner["id"], banner["name"]))
+                self.ends[i] = self.starts[i + 1] - 1 if i + 1 < len(banners) else np.iinfo(np.int64).max
+        self.has_rate_up = np.array([len(banner["rate_up"]) > 0 for banner in banners], dtype=bool)
+
+        # rate up items are kept as sorted keys: banner position * number of names + name id
+        self.name_ids = {}
+        for banner in banners:
+            for item in banner["rate_up"]:
+                self.name_ids.setdefault(item["name"], len(self.name_ids))
+        keys = [position * len(self.name_ids) + self.name_ids[item["name"]]
+                for position, banner in enumerate(banners) for item in banner["rate_up"]]
+        self.rate_up_keys = np.unique(np.array(keys, dtype=np.int64))
+
+        # how many banners back we have to look, to find every banner overlapping given point in time
+        self.max_overlap = 0
+        for i in range(len(banners)):
+            overlapping = np.flatnonzero(self.ends[:i] >= self.starts[i])
+            if len(overlapping):
+                self.max_overlap = max(self.max_overlap, i - int(overlapping[0]))
+
+    def get_name_ids(self, item_names):
+        # maps names to ids used in rate_up_keys, names which are never on rate up get -1
+        unique_names, inverse = np.unique(np.asarray(item_names, dtype=object).astype(str), return_inverse=True)
+        unique_ids = np.array([self.name_ids.get(name, -1) for name in unique_names], dtype=np.int64)
+        return unique_ids[inverse]
+
+    def is_rate_up(self, positions, name_ids):
+        # vectorised check if item was on rate up in banner at given position
+        if not len(self.rate_up_keys):
+            return np.zeros(len(positions), dtype=bool)
+        keys = positions * len(self.name_ids) + name_ids
+        found = np.minimum(np.searchsorted(self.rate_up_keys, keys), len(self.rate_up_keys) - 1)
+        return (positions >= 0) & (name_ids >= 0) & (self.rate_up_keys[found] == keys)
+
+    def find_banners(self, timestamps, item_names, rarities):
+        """Finds banner of every wish.
+        :param timestamps: int64 numpy array of seconds since epoch
+        :param item_names: names of received items
+        :param rarities: rarities of received items
+        :return: (banner ids, rate up) numpy arrays. Banner id is unknown_banner_id, if wish doesn't fit into any
+                 banner. Rate up is 1 if 4/5-star item was on rate up, 0 if it wasn't and -1 if it doesn't apply
+                 (3-star items and banners without rate up).
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        rarities = np.asarray(rarities)
+        if not len(self.starts):
+            return np.full(len(timestamps), self.unknown_banner_id, dtype=np.int64), \
+                np.full(len(timestamps), -1, dtype=np.int64)
+        name_ids = self.get_name_ids(item_names)
+        latest = np.searchsorted(self.starts, timestamps, side='right') - 1
+        chosen = np.full(len(timestamps), -1, dtype=np.int64)
+        chosen_rate_up = np.zeros(len(timestamps), dtype=bool)
+        for back in range(self.max_overlap + 1):
+            candidates = latest - back
+            valid = (candidates >= 0) & (timestamps != invalid_timestamp)
+            valid[valid] = self.ends[candidates[valid]] >= timestamps[valid]
+            rate_up = valid & self.is_rate_up(np.where(valid, candidates, -1), name_ids)
+            # the latest banner is taken, unless one of the older overlapping banners has the item on rate up
+            take = valid & ((chosen < 0) | (rate_up & ~chosen_rate_up))
+            chosen[take] = candidates[take]
+            chosen_rate_up[take] = rate_up[take]
+
+        banner_ids = np.where(chosen >= 0, self.banner_ids[np.maximum(chosen, 0)], self.unknown_banner_id)
+        rate_up_applies = (chosen >= 0) & (rarities >= 4) & self.has_rate_up[np.maximum(chosen, 0)]
+        rate_up = np.where(rate_up_applies, chosen_rate_up.astype(np.int64), -1)
+        return banner_ids, rate_up
+
+
+class BannerList:
+    # Banner indexes of all wish tables loaded from banner_list.json (through shared catalog).
+    # Hash of banners of every table is stored in database with annotations, when banners change (new banner was added
+    # or rate up fixed), all wishes of the table are annotated again.
+    banner_list_keys = {"wishCharacter": "Character Wish",
+                        "wishWeapon": "Weapon Wish",
+                        "wishStandard": "Standard Wish",
+                        "wishBeginner": "Beginner Wish"}
+
+    def __init__(self, banner_list=None):
+        if banner_list is None:
+            banner_list = get_catalog().banner_list
+        self.indexes = {}
+        self.source_hashes = {}
+        for table_name, key in self.banner_list_keys.items():
+            self.indexes[table_name] = BannerIndex(banner_list.get(key, []))
+            self.source_hashes[table_name] = hashlib.sha1(json.dumps(banner_list.get(key, []), sort_keys=True)
+                                                          .encode("utf-8")).hexdigest()
+
+    def annotate_database(self, db, table_names=None):
+        """Sets banner and rate up of every wish, that wasn't annotated yet, or of all wishes of table, if they were
+        annotated with different banners.
+        :param db: WishDatabase
+        :param table_names: tables to annotate, None annotates all of them
+        :return: number of annotated wishes
+        """
+        annotated = 0
+        stored_hashes = db.get_banner_source_hashes()
+        for table_name in table_names or self.indexes:
+            if stored_hashes.get(table_name) != self.source_hashes[table_name]:
+                logger.info("Banners of {} changed, its wishes will be annotated again".format(table_name))
+                db.reset_wish_banners(table_name, self.source_hashes[table_name])
+            rows = db.get_wishes_without_banner(table_name)
+            if not rows:
+                continue
+            ids, names, times, rarities = zip(*rows)
+            banner_ids, rate_up = self.indexes[table_name].find_banners(parse_timestamps(list(times)), names,
+                                                                        rarities)
+            rate_up_values = [None if value < 0 else value for value in rate_up.tolist()]
+            db.update_wish_banners(table_name, list(zip(banner_ids.tolist(), rate_up_values, ids)))
+            logger.info("Annotated {} wishes of {} with banners".format(len(rows), table_name))
+            annotated = annotated + len(rows)
+        return annotated
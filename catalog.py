@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import threading
+import unicodedata
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+def normalize_name(name):
+    # lower case letters and digits only, so "Amos' Bow", "amos bow" and "AMOS'BOW" are the same name
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+class Catalog:
+    # Game data from json files (weapons, characters, materials and banners) parsed once and indexed.
+    # Every item record is a dict with at least: name, category (Weapon, Character, Material), type and rarity
+    # (None if not known). Parsed catalog is saved as pickle snapshot together with mtime, size and hash of source
+    # files, so next start loads snapshot instead of parsing json again.
+    source_paths = {"weapons": "weapon_list.json",
+                    "characters": "character_list.json",
+                    "materials": "material_list.json",
+                    "banners": "banner_list.json",
+                    "ascension": "ascension_list.json"}
+    snapshot_path = "catalog_cache.pickle"
+    snapshot_version = 3
+
+    def __init__(self, sources):
+        """
+        :param sources: dict with parsed json of every source_paths key
+        """
+        self.banner_list = sources["banners"]
+        self.ascension_list = sources["ascension"]  # ascension and talent costs
+        self.records = []
+        for weapon_type, weapons in sources["weapons"].items():
+            for weapon in weapons:
+                self.add_record(dict(weapon, category="Weapon", type=weapon_type))
+        for character in self.get_items_of_source(sources["characters"]):
+            self.add_record(dict({"type": None, "rarity": None}, **character, category="Character"))
+        for material in self.get_items_of_source(sources["materials"]):
+            self.add_record(dict({"type": None, "rarity": None}, **material, category="Material"))
+        # characters newer than character_list.json are still known from rate up of character banners, but without
+        # rarity, which then has to be given in banner_list.json
+        names = set(record["name"] for record in self.records)
+        for banner_key in ["Character Wish", "Beginner Wish"]:
+            for banner in self.banner_list.get(banner_key, []):
+                for item in banner["rate_up"]:
+                    if item["name"] not in names:
+                        names.add(item["name"])
+                        logger.warning("Character {} from banner {} is missing in character list".format(
+                            item["name"], banner["name"]))
+                        self.add_record({"name": item["name"], "category": "Character", "type": None,
+                                         "rarity": item.get("rarity")})
+        self.build_indexes()
+
+    @staticmethod
+    def get_items_of_source(source):
+        # character and material lists can be either list of records or dict of lists (like weapons by type)
+        if isinstance(source, list):
+            return source
+        return [dict(record, type=record.get("type", key)) for key, records in source.items() for record in records]
+
+    def add_record(self, record):
+        self.records.append(record)
+
+    def build_indexes(self):
+        self.by_name = {}
+        self.by_normalized_name = {}
+        self.by_rarity = {}
+        self.by_type = {}
+        self.by_category = {}
+        for record in self.records:
+            self.by_name[record["name"]] = record
+            self.by_normalized_name[normalize_name(record["name"])] = record
+            self.by_rarity.setdefault(record["rarity"], []).append(record)
+            self.by_type.setdefault(record["type"], []).append(record)
+            self.by_category.setdefault(record["category"], []).append(record)
+
+    def get(self, name):
+        # finds record by exact name or by normalized name, returns None if there isn't such item
+        record = self.by_name.get(name)
+        if record is None:
+            record = self.by_normalized_name.get(normalize_name(name))
+        return record
+
+    def get_names(self, category=None):
+        records = self.records if category is None else self.by_category.get(category, [])
+        return [record["name"] for record in records]
+
+    def find(self, category=None, rarity=None, item_type=None):
+        # records matching all given filters, only the smallest index of given filters is scanned
+        filters = [(key, value, index) for key, value, index in [("category", category, self.by_category),
+                                                                 ("rarity", rarity, self.by_rarity),
+                                                                 ("type", item_type, self.by_type)]
+                   if value is not None]
+        if not filters:
+            return list(self.records)
+        candidates = min((index.get(value, []) for key, value, index in filters), key=len)
+        return [record for record in candidates if all(record[key] == value for key, value, index in filters)]
+
+    @classmethod
+    def get_source_state(cls, path, known_state=None):
+        """Returns (mtime_ns, size, sha1) of source file. If mtime and size match known state, file is not hashed again.
+        """
+        stat = os.stat(path)
+        if known_state is not None and known_state[:2] == (stat.st_mtime_ns, stat.st_size):
+            return known_state
+        with open(path, "rb") as file:
+            return stat.st_mtime_ns, stat.st_size, hashlib.sha1(file.read()).hexdigest()
+
+    @classmethod
+    def load(cls, snapshot_path=None):
+        """Loads catalog from snapshot, if it's still valid, otherwise parses json files and writes new snapshot.
+        :param snapshot_path: path of snapshot, None uses default
+        :return: Catalog
+        """
+        snapshot_path = snapshot_path or cls.snapshot_path
+        snapshot = cls.read_snapshot(snapshot_path)
+        known_states = snapshot["states"] if snapshot is not None else {}
+        states = {key: cls.get_source_state(path, known_states.get(key)) for key, path in cls.source_paths.items()}
+        if snapshot is not None:
+            # mtime can change without change of content (e.g. after git checkout), only hash decides
+            if {key: state[2] for key, state in states.items()} == \
+                    {key: state[2] for key, state in known_states.items()}:
+                if states != known_states:
+                    cls.write_snapshot(snapshot_path, states, snapshot["catalog"])
+                return snapshot["catalog"]
+        logger.info("Parsing game data to catalog")
+        sources = {}
+        for key, path in cls.source_paths.items():
+            with open(path, encoding="utf-8") as file:
+                sources[key] = json.load(file)
+        catalog = cls(sources)
+        cls.write_snapshot(snapshot_path, states, catalog)
+        return catalog
+
+    @classmethod
+    def read_snapshot(cls, snapshot_path):
+        if not os.path.isfile(snapshot_path):
+            return None
+        try:
+            with open(snapshot_path, "rb") as file:
+                snapshot = pickle.load(file)
+            if snapshot.get("version") != cls.snapshot_version:
+                return None
+            return snapshot
+        except Exception as e:
+            logger.warning("Couldn't read catalog snapshot, it will be created again. {}".format(e))
+            return None
+
+    @classmethod
+    def write_snapshot(cls, snapshot_path, states, catalog):
+        try:
+            temporary_path = snapshot_path + ".tmp"
+            with open(temporary_path, "wb") as file:
+                pickle.dump({"version": cls.snapshot_version, "states": states, "catalog": catalog}, file,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, snapshot_path)
+        except OSError as e:
+            logger.warning("Couldn't write catalog snapshot. {}".format(e))
+
+
+catalog = None
+catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    # catalog shared by whole application (GUI, importer and analytics), loaded on first use
+    global catalog
+    with catalog_lock:
+        if catalog is None:
+            catalog = Catalog.load()
+        return catalog
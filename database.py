@@ -1,6 +1,8 @@
 import sqlite3
 from sqlite3 import Error
+import json
 import logging
+from catalog import Catalog, get_catalog
 
 logger = logging.getLogger('GenshinWishViewer')
 # https://www.sqlitetutorial.net/sqlite-python/
@@ -62,7 +64,7 @@ class Database:
                     raise Exception("Database version is newer than genshin wish counter version!")
                 elif db_version < self.database_version:
                     logger.info("Database version is older than genshin wish viewer version. Upgrading...")
-                    # upgrade_db(db_version)
+                    self.upgrade_database(db_version)
                 else:
                     logger.info("Database version matches genshin wish viewer version.")
         except sqlite3.OperationalError as e:
@@ -74,6 +76,20 @@ class Database:
                 # unknown error
                 raise
 
+    def upgrade_database(self, db_version):
+        """Runs migrations for every version newer than db_version and stores new version in systemInfo.
+        :param db_version: version found in systemInfo table
+        :return:
+        """
+        for version in range(db_version + 1, self.database_version + 1):
+            logger.info("Migrating database to version {}".format(version))
+            self.migrate_to_version(version)
+        self.insert_info_entry(self.database_version)
+
+    def migrate_to_version(self, version):
+        # implement this in derived classes, which bump database_version
+        raise Exception("Tried to migrate Database base parent class to version {}!".format(version))
+
     def create_info_table(self):
         logger.info("Creating info table")
         system_info_command = "CREATE TABLE IF NOT EXISTS systemInfo (creationDate date DEFAULT CURRENT_TIMESTAMP," \
@@ -89,56 +105,68 @@ class Database:
 
 
 class PresetDatabase(Database):
+    database_version = 2
     database_name = "PresetDatabase"
-    # WEAPON 5-STAR:    MORA    WPN_ASC_MAT ELT_ASC_MAT CMN_ASC_MAT
-    # ---1---          10000        5            5           3
-    # ---2---          20000        5           18          12
-    # ---3---          30000        9            9           9
-    # ---4---          45000        5           18          14
-    # ---5---          55000        9           14           9
-    # ---6---          65000        6           27          18
-    # WEAPON 4-STAR:    MORA    WPN_ASC_MAT ELT_ASC_MAT CMN_ASC_MAT
-    # ---1---           5000        3            3           2
-    # ---2---          15000        3           12           8
-    # ---3---          20000        6            6           6
-    # ---4---          30000        3           12           9
-    # ---5---          35000        6            9           6
-    # ---6---          45000        4           18          12
-    ###############################################################
-    # CHAR:             MORA    ASC_GEM BOS_MAT LCL_SPC CMN_ASC_MAT
-    # ---1---          20000        1        0       3       3
-    # ---2---          40000        3        2      10      15
-    # ---3---          60000        6        4      20      12
-    # ---4---          80000        3        8      30      18
-    # ---5---         100000        6       12      45      12
-    # ---6---         120000        6       20      60      24
-    # CHAR TALENT:      MORA    REQ_ASC CMN_ASC_MAT TLN_MAT WKL_BOS_MAT
-    # ---1---          12500        2        6       3          0
-    # ---2---          17500        3        3       2          0
-    # ---3---          25000        3        4       4          0
-    # ---4---          30000        4        6       6          0
-    # ---5---          37500        4        9       9          0
-    # ---6---         120000        5        4       4          1
-    # ---7---         260000        5        6       6          1
-    # ---8---         450000        6        9      12          2
-    # ---9---         700000        6       12      16          2
+    # ascension and talent costs are in ascension_list.json
+    # weapon stats in weapon_list.json are given for these levels, "+" means level after ascension
+    weapon_stat_levels = [1, 20, 20, 40, 40, 50, 50, 60, 60, 70, 70, 80, 80, 90]
+    weapon_stat_ascensions = [0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6]
+    # columns filled by insert_entry/insert_multiple_entries (id is generated)
+    preset_columns = {"Characters": ["name", "rarity", "element", "weaponType"],
+                      "Weapons": ["name", "type", "rarity", "secondaryStat", "passiveName", "passiveDescription",
+                                  "passiveValues", "weaponAscensionMaterial", "commonAscensionMaterial",
+                                  "eliteAscensionMaterial"],
+                      "WeaponStats": ["weaponId", "levelIndex", "level", "ascension", "baseAtk", "secondaryStatValue"],
+                      "Materials": ["name", "type", "rarity"],
+                      "Artifacts": ["name", "rarity", "twoPieceBonus", "fourPieceBonus"]}
+    # which catalog sources are imported to which tables
+    preset_sources = {"Characters": ["characters", "banners"],
+                      "Weapons": ["weapons"],
+                      "Materials": ["materials"]}
 
     def create_preset_tables(self):
         logger.info("Creating preset tables")
-        preset_commands = ["CREATE TABLE IF NOT EXISTS Characters ();",
-                           "CREATE TABLE IF NOT EXISTS Weapons ();",
-                           "CREATE TABLE IF NOT EXISTS Materials ();",
-                           "CREATE TABLE IF NOT EXISTS Artifacts ();"]
-        for command in preset_commands:
+        preset_commands = ["CREATE TABLE IF NOT EXISTS Characters (id integer PRIMARY KEY, name text NOT NULL UNIQUE,"
+                           " rarity integer, element text, weaponType text);",
+                           "CREATE TABLE IF NOT EXISTS Weapons (id integer PRIMARY KEY, name text NOT NULL UNIQUE,"
+                           " type text NOT NULL, rarity integer NOT NULL, secondaryStat text, passiveName text,"
+                           " passiveDescription text, passiveValues text, weaponAscensionMaterial text,"
+                           " commonAscensionMaterial text, eliteAscensionMaterial text);",
+                           # one row per weapon level from weapon_list.json, levelIndex is index in its arrays
+                           "CREATE TABLE IF NOT EXISTS WeaponStats (weaponId integer NOT NULL REFERENCES Weapons(id)"
+                           " ON DELETE CASCADE, levelIndex integer NOT NULL, level integer NOT NULL,"
+                           " ascension integer NOT NULL, baseAtk integer NOT NULL, secondaryStatValue real,"
+                           " PRIMARY KEY (weaponId, levelIndex)) WITHOUT ROWID;",
+                           "CREATE TABLE IF NOT EXISTS Materials (id integer PRIMARY KEY, name text NOT NULL UNIQUE,"
+                           " type text, rarity integer);",
+                           "CREATE TABLE IF NOT EXISTS Artifacts (id integer PRIMARY KEY, name text NOT NULL UNIQUE,"
+                           " rarity integer, twoPieceBonus text, fourPieceBonus text);",
+                           # sha1 of json files, which table was imported from
+                           "CREATE TABLE IF NOT EXISTS presetSources (tableName text PRIMARY KEY, sourceHash text"
+                           " NOT NULL);"]
+        # names are indexed by UNIQUE constraints
+        index_commands = ["CREATE INDEX IF NOT EXISTS CharactersRarityIndex ON Characters (rarity, weaponType);",
+                          "CREATE INDEX IF NOT EXISTS WeaponsTypeIndex ON Weapons (type, rarity, secondaryStat);",
+                          "CREATE INDEX IF NOT EXISTS WeaponsRarityIndex ON Weapons (rarity, secondaryStat);",
+                          "CREATE INDEX IF NOT EXISTS MaterialsTypeIndex ON Materials (type, rarity);"]
+        for command in preset_commands + index_commands:
             self.execute_command(command)
+        self.connection.commit()
 
     def create_tables(self):
-        """create tables for database (systemInfo, Characters, Weapons, Materials, Artifacts)
+        """create tables for database (systemInfo, Characters, Weapons, WeaponStats, Materials, Artifacts)
         :return:
         """
         self.create_info_table()
         self.create_preset_tables()
 
+    def migrate_to_version(self, version):
+        if version == 2:
+            # tables of version 1 had no columns, so they couldn't be created at all
+            self.create_preset_tables()
+        else:
+            raise Exception("Unknown PresetDatabase version {}!".format(version))
+
     def get_table_names(self):
         tables = []
         cmd = "SELECT name FROM sqlite_master WHERE type='table';"
@@ -146,7 +174,7 @@ class PresetDatabase(Database):
         for item in cursor:
             tables.append(item[0])
         # sqlite_sequence is always in sqlite_master table, if there are any other tables - remove it
-        if tables:
+        if 'sqlite_sequence' in tables:
             tables.remove('sqlite_sequence')
         return tables
 
@@ -160,15 +188,123 @@ class PresetDatabase(Database):
             count_table.append(self.connection.execute(cmd).fetchall()[0][0])
         return count_table
 
-    def insert_entry(self, table, wish):
-        pass
+    def insert_entry(self, table, entry):
+        self.insert_multiple_entries(table, [entry])
+
+    def insert_multiple_entries(self, table, entries):
+        """Inserts entries in one transaction - either all of them are inserted or none.
+        :param table: one of preset_columns keys
+        :param entries: list of tuples with values in order of preset_columns[table]
+        :return:
+        """
+        columns = self.preset_columns[table]
+        insert = "INSERT INTO {} ({}) VALUES ({});".format(table, ", ".join(columns), ", ".join("?" * len(columns)))
+        try:
+            with self.connection:
+                self.connection.executemany(insert, entries)
+        except Error as e:
+            self.failed_insert_number = self.failed_insert_number + 1
+            logger.error("Failed to insert entries to {}. {}".format(table, e))
+
+    def get_source_hashes(self):
+        return dict(self.connection.execute("SELECT tableName, sourceHash FROM presetSources;").fetchall())
 
-    def insert_multiple_entries(self, table, wishes):
-        pass
+    def import_game_data(self, catalog=None):
+        """Fills preset tables from json lists. Table is imported again only if json files it comes from changed,
+        every table is replaced in one transaction.
+        :param catalog: Catalog with parsed json files, None uses shared catalog
+        :return: names of imported tables
+        """
+        if catalog is None:
+            catalog = get_catalog()
+        source_hashes = {key: Catalog.get_source_state(path)[2] for key, path in Catalog.source_paths.items()}
+        stored_hashes = self.get_source_hashes()
+        imported = []
+        for table, sources in self.preset_sources.items():
+            source_hash = "".join(source_hashes[source] for source in sources)
+            if stored_hashes.get(table) == source_hash:
+                continue
+            logger.info("Importing {} to preset database".format(table))
+            with self.connection:
+                self.import_table(table, catalog)
+                self.connection.execute("INSERT OR REPLACE INTO presetSources (tableName, sourceHash) VALUES (?, ?);",
+                                        (table, source_hash))
+            imported.append(table)
+        return imported
+
+    def import_table(self, table, catalog):
+        # has to be called inside transaction
+        if table == "Weapons":
+            self.connection.execute("DELETE FROM WeaponStats;")
+        self.connection.execute("DELETE FROM {};".format(table))
+        if table == "Characters":
+            rows = [(record["name"], record["rarity"], record.get("element"), record.get("weapon_type"))
+                    for record in catalog.by_category.get("Character", [])]
+        elif table == "Materials":
+            rows = [(record["name"], record["type"], record["rarity"])
+                    for record in catalog.by_category.get("Material", [])]
+        else:
+            weapons = catalog.by_category.get("Weapon", [])
+            rows = [(record["name"], record["type"], record["rarity"], record["secondary_stat"] or None,
+                     record["passive name"], record["passive_description"], json.dumps(record["passive_values"]),
+                     record["weapon_asc_mat"], record["common_asc_mat"], record["elite_asc_mat"])
+                    for record in weapons]
+        columns = self.preset_columns[table]
+        self.connection.executemany("INSERT INTO {} ({}) VALUES ({});".format(
+            table, ", ".join(columns), ", ".join("?" * len(columns))), rows)
+        if table == "Weapons":
+            weapon_ids = dict(self.connection.execute("SELECT name, id FROM Weapons;").fetchall())
+            stats = [(weapon_ids[record["name"]], level_index, self.weapon_stat_levels[level_index],
+                      self.weapon_stat_ascensions[level_index], base_atk,
+                      record["secondary_stat_values"][level_index] if record["secondary_stat_values"] else None)
+                     for record in weapons for level_index, base_atk in enumerate(record["base_atk"])]
+            columns = self.preset_columns["WeaponStats"]
+            self.connection.executemany("INSERT INTO WeaponStats ({}) VALUES ({});".format(
+                ", ".join(columns), ", ".join("?" * len(columns))), stats)
+
+    def get_weapons(self, weapon_type=None, rarity=None, secondary_stat=None):
+        """Finds weapons by type, rarity and secondary stat (None matches everything), e.g. all 4-star bows
+        with CRIT Rate.
+        :return: list of (name, type, rarity, secondaryStat)
+        """
+        conditions = []
+        parameters = []
+        for column, value in [("type", weapon_type), ("rarity", rarity), ("secondaryStat", secondary_stat)]:
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                parameters.append(value)
+        select = "SELECT name, type, rarity, secondaryStat FROM Weapons{} ORDER BY name;".format(
+            " WHERE " + " AND ".join(conditions) if conditions else "")
+        return self.connection.execute(select, parameters).fetchall()
+
+    def get_weapon_stats(self, name, level=None):
+        # (level, ascension, baseAtk, secondaryStatValue) of every level of weapon, or only of given level
+        select = "SELECT level, ascension, baseAtk, secondaryStatValue FROM WeaponStats JOIN Weapons" \
+                 " ON Weapons.id = WeaponStats.weaponId WHERE Weapons.name = ?{} ORDER BY levelIndex;"
+        parameters = [name]
+        if level is not None:
+            parameters.append(level)
+        return self.connection.execute(select.format(" AND level = ?" if level is not None else ""),
+                                       parameters).fetchall()
 
 
 class WishDatabase(Database):
+    database_version = 9
     database_name = "WishDatabase"
+    wish_table_names = ["wishCharacter", "wishWeapon", "wishStandard", "wishBeginner"]
+    primogems_per_wish = 160
+    # granularity -> (SQL expression of bucket key, SQLite date modifier giving start of the next bucket)
+    # week buckets start on Monday, banner buckets are bannerId (None for wishes without banner)
+    bucket_granularities = {"day": ("date(timeReceived)", "+1 day"),
+                            "week": ("date(timeReceived, '-6 days', 'weekday 1')", "+7 days"),
+                            "month": ("strftime('%Y-%m-01', timeReceived)", "+1 month"),
+                            "banner": ("bannerId", None)}
+
+    def __init__(self, db_path):
+        Database.__init__(self, db_path)
+        # (table, granularity, date_from, date_to) -> {"max_id": ..., "buckets": {bucket: (pulls, 5-star, 4-star)},
+        #                                              "dirty": set of buckets to recompute}
+        self.bucket_cache = {}
 
     def create_wish_tables(self):
         logger.info("Creating wish tables")
@@ -183,12 +319,135 @@ class WishDatabase(Database):
         for command in wish_commands:
             self.execute_command(command)
 
+    def create_wish_indexes(self):
+        # (timeReceived, id) is the order in which wishes were made, so it's used as keyset for paging,
+        # itemRarity is included, so pity can be computed from index only
+        # (itemRarity, timeReceived, id) lets us seek previous 4-star/5-star without scanning whole table
+        logger.info("Creating wish indexes")
+        for table in self.wish_table_names:
+            self.execute_command("CREATE INDEX IF NOT EXISTS {0}TimeIndex ON {0} (timeReceived, id, itemRarity);".format(table))
+            self.execute_command("CREATE INDEX IF NOT EXISTS {0}RarityIndex ON {0} (itemRarity, timeReceived, id);"
+                                 .format(table))
+        self.connection.commit()
+
     def create_tables(self):
         """create tables for database (systemInfo, wishCharacter, wishWeapon, wishStandard, wishBeginner)
         :return:
         """
         self.create_info_table()
         self.create_wish_tables()
+        # newer schema changes are applied the same way as for upgraded database
+        for version in range(2, self.database_version + 1):
+            self.migrate_to_version(version)
+
+    def add_banner_columns(self):
+        # bannerId - id of banner from banner_list.json, rateUp - 1 if 4/5-star was rate up item, 0 if it wasn't
+        logger.info("Adding banner columns to wish tables")
+        for table in self.wish_table_names:
+            self.execute_command("ALTER TABLE {} ADD COLUMN bannerId integer;".format(table))
+            self.execute_command("ALTER TABLE {} ADD COLUMN rateUp integer;".format(table))
+        self.connection.commit()
+
+    def create_search_index(self):
+        # Item names are searched by FTS5 trigram index. There are only a few hundred different items, so instead of
+        # indexing every wish, distinct names are kept in itemNames (maintained by triggers on wish tables)
+        # and indexed, matching wishes are then found by {table}NameIndex.
+        logger.info("Creating search index")
+        commands = ["CREATE TABLE IF NOT EXISTS itemNames (id integer PRIMARY KEY, name text NOT NULL UNIQUE);",
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS itemNameSearch USING fts5(name, content='itemNames',"
+                    " content_rowid='id', tokenize='trigram');",
+                    "CREATE TRIGGER IF NOT EXISTS itemNamesInsert AFTER INSERT ON itemNames BEGIN"
+                    " INSERT INTO itemNameSearch (rowid, name) VALUES (new.id, new.name); END;",
+                    "CREATE TRIGGER IF NOT EXISTS itemNamesDelete AFTER DELETE ON itemNames BEGIN"
+                    " INSERT INTO itemNameSearch (itemNameSearch, rowid, name) VALUES ('delete', old.id, old.name);"
+                    " END;"]
+        # name is removed from itemNames, when the last wish with it is deleted or renamed
+        unused_name = "DELETE FROM itemNames WHERE name = old.itemName AND {};".format(" AND ".join(
+            "NOT EXISTS (SELECT 1 FROM {0} WHERE {0}.itemName = old.itemName)".format(table)
+            for table in self.wish_table_names))
+        for table in self.wish_table_names:
+            commands.extend([
+                "CREATE INDEX IF NOT EXISTS {0}NameIndex ON {0} (itemName, timeReceived, id, itemRarity);".format(table),
+                "CREATE TRIGGER IF NOT EXISTS {0}NameInsert AFTER INSERT ON {0} BEGIN"
+                " INSERT OR IGNORE INTO itemNames (name) VALUES (new.itemName); END;".format(table),
+                "CREATE TRIGGER IF NOT EXISTS {0}NameUpdate AFTER UPDATE OF itemName ON {0} BEGIN"
+                " INSERT OR IGNORE INTO itemNames (name) VALUES (new.itemName); {1} END;".format(table, unused_name),
+                "CREATE TRIGGER IF NOT EXISTS {0}NameDelete AFTER DELETE ON {0} BEGIN {1} END;"
+                .format(table, unused_name),
+                "INSERT OR IGNORE INTO itemNames (name) SELECT DISTINCT itemName FROM {};".format(table)])
+        for command in commands:
+            self.execute_command(command)
+        self.connection.commit()
+
+    def create_banner_indexes(self):
+        # lets banner buckets of get_time_buckets be counted from index only
+        logger.info("Creating banner indexes")
+        for table in self.wish_table_names:
+            self.execute_command("CREATE INDEX IF NOT EXISTS {0}BannerIndex ON {0} (bannerId, timeReceived, itemRarity);"
+                                 .format(table))
+        self.connection.commit()
+
+    def create_import_journal(self):
+        # Import of screenshots is journaled, so it can be resumed after crash without reading screenshots again.
+        # imports - one row per import, importImages - screenshots of import with status (queued -> ocr -> committed,
+        # or failed), importStaging - wishes read from screenshots, which weren't merged to wish table yet
+        logger.info("Creating import journal")
+        commands = ["CREATE TABLE IF NOT EXISTS imports (id integer PRIMARY KEY, tableName text NOT NULL, backend text"
+                    " NOT NULL, started date DEFAULT CURRENT_TIMESTAMP, finished date);",
+                    "CREATE TABLE IF NOT EXISTS importImages (id integer PRIMARY KEY, importId integer NOT NULL"
+                    " REFERENCES imports(id), position integer NOT NULL, imagePath text NOT NULL, status text NOT NULL"
+                    " DEFAULT 'queued');",
+                    "CREATE INDEX IF NOT EXISTS importImagesIndex ON importImages (importId, position);",
+                    "CREATE TABLE IF NOT EXISTS importStaging (imageId integer NOT NULL REFERENCES importImages(id),"
+                    " position integer NOT NULL, itemType text NOT NULL, itemName text NOT NULL, timeReceived date"
+                    " NOT NULL, itemRarity integer NOT NULL);",
+                    "CREATE INDEX IF NOT EXISTS importStagingIndex ON importStaging (imageId, position);"]
+        for command in commands:
+            self.execute_command(command)
+        self.connection.commit()
+
+    def create_multi_wish_labels(self):
+        # labels of multi-wishes split between pages of import (see PageMerger) - where their parts came from,
+        # so the next import puts the rest of multi-wish to the right place. Labels are comma separated, in order of ids
+        logger.info("Creating multi-wish labels")
+        self.execute_command("CREATE TABLE IF NOT EXISTS multiWishLabels (tableName text NOT NULL, timeReceived date"
+                             " NOT NULL, labels text NOT NULL, PRIMARY KEY (tableName, timeReceived)) WITHOUT ROWID;")
+        self.connection.commit()
+
+    def create_banner_sources(self):
+        # sha1 of banners of every wish table from banner_list.json, which bannerId and rateUp were computed from
+        logger.info("Creating banner sources")
+        self.execute_command("CREATE TABLE IF NOT EXISTS bannerSources (tableName text PRIMARY KEY, sourceHash text"
+                             " NOT NULL);")
+        self.connection.commit()
+
+    def create_wish_revisions(self):
+        # revision of every wish table, bumped when wishes already in table are changed or deleted (adding wishes
+        # doesn't bump it), so incremental export knows its watermark isn't enough
+        logger.info("Creating wish revisions")
+        self.execute_command("CREATE TABLE IF NOT EXISTS wishRevisions (tableName text PRIMARY KEY, revision integer"
+                             " NOT NULL);")
+        self.connection.commit()
+
+    def migrate_to_version(self, version):
+        if version == 2:
+            self.create_wish_indexes()
+        elif version == 3:
+            self.add_banner_columns()
+        elif version == 4:
+            self.create_search_index()
+        elif version == 5:
+            self.create_banner_indexes()
+        elif version == 6:
+            self.create_import_journal()
+        elif version == 7:
+            self.create_multi_wish_labels()
+        elif version == 8:
+            self.create_banner_sources()
+        elif version == 9:
+            self.create_wish_revisions()
+        else:
+            raise Exception("Unknown WishDatabase version {}!".format(version))
 
     def get_table_names(self):
         tables = []
@@ -211,6 +470,9 @@ class WishDatabase(Database):
             count_table.append(self.connection.execute(cmd).fetchall()[0][0])
         return count_table
 
+    def get_number_of_elements_in_table(self, table_name):
+        return self.connection.execute("SELECT COUNT(1) FROM {};".format(table_name)).fetchone()[0]
+
     def get_wishes_from_table(self, table_name):
         try:
             select = 'SELECT itemType, itemName, timeReceived, itemRarity FROM {} ORDER BY timeReceived ASC, id ASC;'.format(table_name)
@@ -218,6 +480,601 @@ class WishDatabase(Database):
         except Error as e:
             logger.error('Failed to select entries. {}'.format(e))
 
+    def iterate_wishes_from_table(self, table_name, chunk_size=5000):
+        # the same rows as get_wishes_from_table, but streamed in chunks, so whole table doesn't have to be in memory
+        select = 'SELECT itemType, itemName, timeReceived, itemRarity FROM {} ORDER BY timeReceived ASC, id ASC;'\
+            .format(table_name)
+        cursor = self.connection.execute(select)
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def iterate_export_rows(self, table_name, after_id=0, up_to_id=None, chunk_size=5000):
+        """Streams all columns of wishes in chunks, in order in which they were made.
+        :param table_name: one of wish_table_names
+        :param after_id: only wishes with bigger id (added later) are returned
+        :param up_to_id: only wishes with this or smaller id are returned, None returns all of them
+        :param chunk_size: number of rows in one chunk
+        :return: generator of lists of (id, itemType, itemName, timeReceived, itemRarity, bannerId, rateUp)
+        """
+        conditions, parameters = ["id > ?"], [after_id]
+        if up_to_id is not None:
+            conditions.append("id <= ?")
+            parameters.append(up_to_id)
+        select = "SELECT id, itemType, itemName, timeReceived, itemRarity, bannerId, rateUp FROM {} WHERE {}" \
+                 " ORDER BY timeReceived ASC, id ASC;".format(table_name, " AND ".join(conditions))
+        cursor = self.connection.execute(select, parameters)
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def get_max_id(self, table_name):
+        return self.connection.execute("SELECT MAX(id) FROM {};".format(table_name)).fetchone()[0] or 0
+
+    def get_wish_revisions(self):
+        # table name -> revision, tables which were never changed aren't there
+        return dict(self.connection.execute("SELECT tableName, revision FROM wishRevisions;").fetchall())
+
+    def bump_wish_revision(self, table_name):
+        # has to be called inside transaction, which changes wishes
+        self.connection.execute("INSERT INTO wishRevisions (tableName, revision) VALUES (?, 1) ON CONFLICT (tableName)"
+                                " DO UPDATE SET revision = revision + 1;", (table_name,))
+
+    def get_filter_conditions(self, rarities=None, date_from=None, date_to=None, prefix=""):
+        # builds WHERE conditions shared by paging queries, returns list of conditions and their parameters
+        conditions = []
+        parameters = []
+        if rarities:
+            conditions.append("{}itemRarity IN ({})".format(prefix, ", ".join("?" * len(rarities))))
+            parameters.extend(rarities)
+        if date_from is not None:
+            conditions.append("{}timeReceived >= ?".format(prefix))
+            parameters.append(date_from)
+        if date_to is not None:
+            conditions.append("{}timeReceived < ?".format(prefix))
+            parameters.append(date_to)
+        return conditions, parameters
+
+    def get_wishes_page(self, table_name, cursor=None, limit=50, backward=False, rarities=None, date_from=None,
+                        date_to=None):
+        """Returns one page of wishes using (timeReceived, id) as keyset, so cost of the query depends only on limit.
+        Rows are always ordered from oldest to newest: (id, itemType, itemName, timeReceived, itemRarity).
+        :param table_name: one of wish_table_names
+        :param cursor: (timeReceived, id) of the last row of previous page (first row, if going backward).
+                       None starts from the beginning (end, if going backward) of the table
+        :param limit: max number of rows in the page
+        :param backward: fetch rows older than cursor instead of newer
+        :param rarities: list of rarities to return, None returns all of them
+        :param date_from: return only wishes received at or after this date ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS")
+        :param date_to: return only wishes received before this date
+        :return: list of rows
+        """
+        if table_name not in self.wish_table_names:
+            logger.error("Wrong table name - {}!".format(table_name))
+            return []
+        conditions, parameters = self.get_filter_conditions(rarities, date_from, date_to)
+        if cursor is not None:
+            conditions.append("(timeReceived, id) {} (?, ?)".format("<" if backward else ">"))
+            parameters.extend(cursor)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        order = "DESC" if backward else "ASC"
+        select = "SELECT id, itemType, itemName, timeReceived, itemRarity FROM {} {} " \
+                 "ORDER BY timeReceived {}, id {} LIMIT ?;".format(table_name, where, order, order)
+        parameters.append(limit)
+        try:
+            rows = self.connection.execute(select, parameters).fetchall()
+        except Error as e:
+            logger.error('Failed to select page of entries. {}'.format(e))
+            return []
+        if backward:
+            rows.reverse()
+        return rows
+
+    def get_hit_key(self, table_name, rarities, key_condition, key_parameters, descending=False, offset=0,
+                    date_from=None, date_to=None):
+        # returns (timeReceived, id) of offset-th wish with one of given rarities, which fulfils key_condition
+        conditions, parameters = self.get_filter_conditions(rarities, date_from, date_to)
+        if key_condition:
+            conditions.append(key_condition)
+            parameters.extend(key_parameters)
+        order = "DESC" if descending else "ASC"
+        select = "SELECT timeReceived, id FROM {} WHERE {} ORDER BY timeReceived {}, id {} LIMIT 1 OFFSET ?;"\
+            .format(table_name, " AND ".join(conditions), order, order)
+        parameters.append(offset)
+        return self.connection.execute(select, parameters).fetchone()
+
+    def get_pity_entries(self, table_name, rarities=(5, 4), cursor=None, limit=None, backward=False, date_from=None,
+                         date_to=None, four_star_resets_on_five_star=False):
+        """Returns 5-star and/or 4-star wishes together with pity at which they were received.
+        Pity is computed by SQLite window functions: every wish gets its pull number and pity is difference between
+        pull numbers of the wish and of previous wish with the same rarity (LAG over rarity partition).
+        With limit, rows are paged using (timeReceived, id) keyset, the same way as in get_wishes_page, and window
+        is computed only over span of the page (from previous hits to the last wish of the page), which is found
+        by a few seeks of RarityIndex. Without limit, whole banner is returned from one query.
+        Rows are ordered from oldest to newest: (id, itemType, itemName, timeReceived, itemRarity, pity).
+        :param table_name: one of wish_table_names
+        :param rarities: rarities to return, only 5 and 4 are allowed
+        :param cursor: (timeReceived, id) of the last row of previous page (first row, if going backward)
+        :param limit: max number of rows in the page, None returns all of them
+        :param backward: fetch rows older than cursor instead of newer
+        :param date_from: return only wishes received at or after this date
+        :param date_to: return only wishes received before this date
+        :param four_star_resets_on_five_star: count 4-star pity since previous 4-star or 5-star (weapon banner)
+        :return: list of rows
+        """
+        if table_name not in self.wish_table_names:
+            logger.error("Wrong table name - {}!".format(table_name))
+            return []
+        rarities = [rarity for rarity in rarities if rarity in (5, 4)]
+        if not rarities:
+            return []
+        page_start = None
+        page_end = None
+        span_start = None
+        try:
+            if limit is not None:
+                if backward:
+                    key_condition = "(timeReceived, id) < (?, ?)" if cursor is not None else ""
+                    key_parameters = cursor if cursor is not None else []
+                    page_end = self.get_hit_key(table_name, rarities, key_condition, key_parameters, True, 0,
+                                                date_from, date_to)
+                    if page_end is None:
+                        return []
+                    page_start = self.get_hit_key(table_name, rarities, key_condition, key_parameters, True,
+                                                  limit - 1, date_from, date_to)
+                else:
+                    key_condition = "(timeReceived, id) > (?, ?)" if cursor is not None else ""
+                    key_parameters = cursor if cursor is not None else []
+                    page_start = self.get_hit_key(table_name, rarities, key_condition, key_parameters, False, 0,
+                                                  date_from, date_to)
+                    if page_start is None:
+                        return []
+                    page_end = self.get_hit_key(table_name, rarities, key_condition, key_parameters, False,
+                                                limit - 1, date_from, date_to)
+            if page_start is not None:
+                # window has to start at previous hit of every rarity, otherwise the first pity would be unknown
+                previous_hits = [self.get_hit_key(table_name, [rarity], "(timeReceived, id) < (?, ?)", page_start,
+                                                  True) for rarity in rarities]
+                if None not in previous_hits:
+                    span_start = min(previous_hits)
+        except Error as e:
+            logger.error('Failed to find page of pity entries. {}'.format(e))
+            return []
+
+        span_conditions = []
+        span_parameters = []
+        if span_start is not None:
+            span_conditions.append("(timeReceived, id) >= (?, ?)")
+            span_parameters.extend(span_start)
+        if page_end is not None:
+            span_conditions.append("(timeReceived, id) <= (?, ?)")
+            span_parameters.extend(page_end)
+        span_where = "WHERE " + " AND ".join(span_conditions) if span_conditions else ""
+
+        page_conditions, page_parameters = self.get_filter_conditions(rarities, date_from, date_to, "hits.")
+        if page_start is not None:
+            page_conditions.append("(hits.timeReceived, hits.id) >= (?, ?)")
+            page_parameters.extend(page_start)
+        elif cursor is not None:
+            page_conditions.append("(hits.timeReceived, hits.id) {} (?, ?)".format("<" if backward else ">"))
+            page_parameters.extend(cursor)
+
+        if four_star_resets_on_five_star:
+            previous_hit = "CASE WHEN hits.itemRarity = 4 THEN previousAnyHit ELSE previousHit END"
+        else:
+            previous_hit = "previousHit"
+        # names are joined only to hits, so the window itself runs over narrow rows
+        select = "WITH span AS (" \
+                 "SELECT id, timeReceived, itemRarity, " \
+                 "ROW_NUMBER() OVER (ORDER BY timeReceived, id) AS pullNumber FROM {0} {1}), " \
+                 "hits AS (" \
+                 "SELECT *, LAG(pullNumber, 1, 0) OVER (PARTITION BY itemRarity ORDER BY pullNumber) AS previousHit, " \
+                 "LAG(pullNumber, 1, 0) OVER (ORDER BY pullNumber) AS previousAnyHit " \
+                 "FROM span WHERE itemRarity >= 4) " \
+                 "SELECT hits.id, w.itemType, w.itemName, hits.timeReceived, hits.itemRarity, pullNumber - {2} " \
+                 "FROM hits JOIN {0} w ON w.id = hits.id WHERE {3} ORDER BY hits.timeReceived ASC, hits.id ASC;"\
+            .format(table_name, span_where, previous_hit, " AND ".join(page_conditions))
+        try:
+            return self.connection.execute(select, span_parameters + page_parameters).fetchall()
+        except Error as e:
+            logger.error('Failed to select pity entries. {}'.format(e))
+            return []
+
+    def find_item_names(self, query, fuzzy=True, limit=20, min_similarity=0.5):
+        """Finds names of received items matching query. Query is matched as prefix/substring (case insensitive),
+        if nothing matches and fuzzy is set, names sharing enough trigrams with query are returned (typos).
+        :param query: part of item name
+        :param fuzzy: allow typos
+        :param limit: max number of names
+        :param min_similarity: part of query trigrams, which has to be in fuzzy matched name
+        :return: list of names, the best matches first
+        """
+        query = query.strip()
+        if not query:
+            return []
+        if len(query) < 3:
+            # trigram index needs at least 3 characters, there are only hundreds of names so LIKE is fine
+            select = "SELECT name FROM itemNames WHERE name LIKE ? ESCAPE '\\' ORDER BY name LIMIT ?;"
+            pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            return [row[0] for row in self.connection.execute(select, (pattern, limit))]
+        # names starting with query go first, then names containing it
+        select = "SELECT itemNames.name FROM itemNameSearch JOIN itemNames ON itemNames.id = itemNameSearch.rowid" \
+                 " WHERE itemNameSearch MATCH ? ORDER BY instr(lower(itemNames.name), lower(?)) != 1, itemNames.name" \
+                 " LIMIT ?;"
+        names = [row[0] for row in self.connection.execute(select, ('"{}"'.format(query.replace('"', '""')),
+                                                                    query, limit))]
+        if names or not fuzzy:
+            return names
+        query_trigrams = set(query.lower()[i:i + 3] for i in range(len(query) - 2))
+        match = " OR ".join('"{}"'.format(trigram.replace('"', '""')) for trigram in query_trigrams)
+        select = "SELECT itemNames.name FROM itemNameSearch JOIN itemNames ON itemNames.id = itemNameSearch.rowid" \
+                 " WHERE itemNameSearch MATCH ?;"
+        scored = []
+        for (name,) in self.connection.execute(select, (match,)):
+            name_trigrams = set(name.lower()[i:i + 3] for i in range(len(name) - 2))
+            similarity = len(query_trigrams & name_trigrams) / len(query_trigrams)
+            if similarity >= min_similarity:
+                scored.append((-similarity, name))
+        return [name for similarity, name in sorted(scored)[:limit]]
+
+    def search_wishes(self, query=None, table_names=None, rarities=None, date_from=None, date_to=None, limit=50,
+                      cursor=None, fuzzy=True):
+        """Searches wishes by item name and filters, newest first. Pages are fetched by keyset (timeReceived, id,
+        banner) like in get_wishes_page, so deep pages are as fast as the first one.
+        :param query: part of item name (see find_item_names), None or empty matches every item
+        :param table_names: banners to search in, None searches all of them
+        :param rarities: list of rarities, None matches all
+        :param date_from: only wishes received at this date or later ("YYYY-MM-DD HH:MM:SS")
+        :param date_to: only wishes received before this date
+        :param limit: page size
+        :param cursor: last row of previous page, None returns the first page
+        :param fuzzy: allow typos in query
+        :return: (number of all matching wishes, page of (banner, id, itemType, itemName, timeReceived, itemRarity)),
+                 wishes are counted only for the first page, number is None for the next ones
+        """
+        conditions, parameters = self.get_filter_conditions(date_from=date_from, date_to=date_to)
+        names = None
+        if query and query.strip():
+            names = self.find_item_names(query, fuzzy, limit=100)
+            if not names:
+                return 0, []
+            conditions.append("itemName IN ({})".format(", ".join("?" * len(names))))
+            parameters = parameters + names
+        # with names, unary + keeps SQLite from choosing rarity index over much more selective name index
+        rarity_conditions, rarity_parameters = self.get_filter_conditions(rarities, prefix="+" if names else "")
+        conditions = conditions + rarity_conditions
+        parameters = parameters + rarity_parameters
+        table_names = table_names or self.wish_table_names
+        count = None
+        if cursor is None:
+            where = " WHERE " + " AND ".join(conditions) if conditions else ""
+            count_select = "SELECT {};".format(" + ".join("(SELECT COUNT(1) FROM {}{})".format(table_name, where)
+                                                          for table_name in table_names))
+            count = self.connection.execute(count_select, parameters * len(table_names)).fetchone()[0]
+        selects = []
+        all_parameters = []
+        for table_name in table_names:
+            table_conditions = list(conditions)
+            table_parameters = list(parameters)
+            if cursor is not None:
+                # rows of banners sorted before cursor's banner can still have the same (timeReceived, id)
+                banner, wish_id, time_received = cursor[0], cursor[1], cursor[4]
+                table_conditions.append("(timeReceived, id) {} (?, ?)".format("<=" if table_name < banner else "<"))
+                table_parameters.extend([time_received, wish_id])
+            where = " WHERE " + " AND ".join(table_conditions) if table_conditions else ""
+            selects.append("SELECT '{0}' AS banner, id, itemType, itemName, timeReceived, itemRarity FROM {0}{1}"
+                           .format(table_name, where))
+            all_parameters.extend(table_parameters)
+        # ORDER BY of compound select lets SQLite merge already sorted banners instead of sorting all of them
+        select = " UNION ALL ".join(selects) + " ORDER BY timeReceived DESC, id DESC, banner DESC LIMIT ?;"
+        rows = self.connection.execute(select, all_parameters + [limit]).fetchall()
+        return count, rows
+
+    def get_time_buckets(self, table_name, granularity="day", date_from=None, date_to=None):
+        """Number of wishes, spent primogems and 4/5-star drops grouped by day, week, month or banner.
+        Buckets are counted by SQLite (GROUP BY over range scan of TimeIndex/BannerIndex) and cached per
+        (table, granularity, range). Every new wish gets bigger id, so on the next call only buckets of wishes added
+        after the cached max id are counted again (it works for wishes inserted by other connections too).
+        :param table_name: one of wish_table_names
+        :param granularity: one of bucket_granularities keys
+        :param date_from: only wishes received at this date or later ("YYYY-MM-DD HH:MM:SS")
+        :param date_to: only wishes received before this date
+        :return: list of dicts with bucket (start date, or bannerId), pulls, primogems, five_star, four_star and
+                 five_star_rate, sorted by bucket
+        """
+        if granularity not in self.bucket_granularities:
+            raise Exception("Unknown granularity {}!".format(granularity))
+        key = (table_name, granularity, date_from, date_to)
+        max_id = self.get_max_id(table_name)
+        cached = self.bucket_cache.get(key)
+        if cached is None:
+            cached = {"max_id": max_id, "buckets": self.count_buckets(table_name, granularity, date_from, date_to),
+                      "dirty": set()}
+            self.bucket_cache[key] = cached
+        elif max_id > cached["max_id"]:
+            cached["dirty"].update(self.get_touched_buckets(table_name, granularity, date_from, date_to,
+                                                            cached["max_id"]))
+            cached["max_id"] = max_id
+        if cached["dirty"]:
+            logger.debug("Recounting {} {} buckets of {}".format(len(cached["dirty"]), granularity, table_name))
+            counted = self.count_buckets(table_name, granularity, date_from, date_to, cached["dirty"])
+            for bucket in cached["dirty"]:
+                if bucket in counted:
+                    cached["buckets"][bucket] = counted[bucket]
+                else:
+                    cached["buckets"].pop(bucket, None)
+            cached["dirty"] = set()
+        buckets = []
+        for bucket in sorted(cached["buckets"], key=lambda bucket: (bucket is None, bucket or 0) if granularity ==
+                             "banner" else bucket):
+            pulls, five_star, four_star = cached["buckets"][bucket]
+            buckets.append({"bucket": bucket, "pulls": pulls, "primogems": pulls * self.primogems_per_wish,
+                            "five_star": five_star, "four_star": four_star, "five_star_rate": five_star / pulls})
+        return buckets
+
+    def get_touched_buckets(self, table_name, granularity, date_from, date_to, after_id):
+        # buckets of wishes with id bigger than after_id, found by seek in primary key
+        conditions, parameters = self.get_filter_conditions(date_from=date_from, date_to=date_to)
+        select = "SELECT DISTINCT {} FROM {} WHERE {};".format(self.bucket_granularities[granularity][0], table_name,
+                                                               " AND ".join(["id > ?"] + conditions))
+        return [row[0] for row in self.connection.execute(select, [after_id] + parameters)]
+
+    def count_buckets(self, table_name, granularity, date_from=None, date_to=None, buckets=None):
+        """
+        :param buckets: count only these buckets, None counts all of them
+        :return: dict bucket -> (pulls, five star, four star)
+        """
+        bucket_expression, next_bucket = self.bucket_granularities[granularity]
+        conditions, parameters = self.get_filter_conditions(date_from=date_from, date_to=date_to)
+        if buckets is not None and next_bucket is None:
+            banner_ids = [bucket for bucket in buckets if bucket is not None]
+            banner_conditions = ["bannerId IN ({})".format(", ".join("?" * len(banner_ids)))] if banner_ids else []
+            if None in buckets:
+                banner_conditions.append("bannerId IS NULL")
+            conditions.append("({})".format(" OR ".join(banner_conditions)))
+            parameters = parameters + banner_ids
+        elif buckets is not None:
+            # time range of every bucket, neighbouring buckets are merged into one range
+            ranges = []
+            for start in sorted(buckets):
+                end = self.connection.execute("SELECT date(?, ?);", (start, next_bucket)).fetchone()[0]
+                if ranges and ranges[-1][1] == start:
+                    ranges[-1][1] = end
+                else:
+                    ranges.append([start, end])
+            conditions.append("({})".format(" OR ".join(["(timeReceived >= ? AND timeReceived < ?)"] * len(ranges))))
+            parameters = parameters + [value for time_range in ranges for value in time_range]
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        select = "SELECT {} AS bucket, COUNT(1), SUM(itemRarity = 5), SUM(itemRarity = 4) FROM {}{} GROUP BY bucket;"\
+            .format(bucket_expression, table_name, where)
+        counted = {row[0]: row[1:] for row in self.connection.execute(select, parameters)}
+        if buckets is not None:
+            counted = {bucket: counts for bucket, counts in counted.items() if bucket in buckets}
+        return counted
+
+    def get_rate_up_of_hits(self, table_name, rarity):
+        # rateUp column of every wish with given rarity, from oldest to newest (None if it's unknown)
+        select = "SELECT rateUp FROM {} WHERE itemRarity = ? ORDER BY timeReceived ASC, id ASC;".format(table_name)
+        return [row[0] for row in self.connection.execute(select, (rarity,))]
+
+    def get_current_pity(self, table_name, rarity):
+        # number of wishes made after the newest wish with given rarity (all wishes, if there wasn't any)
+        select = "SELECT COUNT(1) FROM {0} WHERE (timeReceived, id) > " \
+                 "(SELECT timeReceived, id FROM {0} WHERE itemRarity = ? ORDER BY timeReceived DESC, id DESC LIMIT 1)" \
+                 " OR NOT EXISTS (SELECT 1 FROM {0} WHERE itemRarity = ?);".format(table_name)
+        return self.connection.execute(select, (rarity, rarity)).fetchone()[0]
+
+    def get_change_counter(self):
+        """Returns value which changes every time anything was written to database.
+        PRAGMA data_version changes only when other connection commits, so changes made by this connection
+        are taken from total_changes.
+        :return: (data_version, total_changes)
+        """
+        data_version = self.connection.execute("PRAGMA data_version;").fetchone()[0]
+        return data_version, self.connection.total_changes
+
+    def get_wishes_without_banner(self, table_name):
+        # wishes, which weren't annotated with banner yet: (id, itemName, timeReceived, itemRarity)
+        select = "SELECT id, itemName, timeReceived, itemRarity FROM {} WHERE bannerId IS NULL;".format(table_name)
+        return self.connection.execute(select).fetchall()
+
+    def get_banner_source_hashes(self):
+        return dict(self.connection.execute("SELECT tableName, sourceHash FROM bannerSources;").fetchall())
+
+    def reset_wish_banners(self, table_name, source_hash):
+        """Removes banner and rate up of all wishes of table, so they are annotated again with changed banners.
+        :param table_name: one of wish_table_names
+        :param source_hash: hash of banners, which wishes will be annotated with
+        :return:
+        """
+        try:
+            with self.connection:
+                self.connection.execute("UPDATE {} SET bannerId = NULL, rateUp = NULL;".format(table_name))
+                self.bump_wish_revision(table_name)
+                self.connection.execute("INSERT OR REPLACE INTO bannerSources (tableName, sourceHash) VALUES (?, ?);",
+                                        (table_name, source_hash))
+        except Error as e:
+            logger.error('Failed to reset banners of wishes. {}'.format(e))
+            raise
+        # all wishes moved to None bucket
+        for (cached_table, granularity, date_from, date_to), cached in self.bucket_cache.items():
+            if cached_table == table_name and granularity == "banner":
+                cached["dirty"].update(set(cached["buckets"]) | {None})
+
+    def update_wish_banners(self, table_name, annotations):
+        """Sets banner of many wishes in one transaction.
+        :param table_name: one of wish_table_names
+        :param annotations: list of (bannerId, rateUp, id)
+        :return:
+        """
+        try:
+            with self.connection:
+                self.connection.executemany("UPDATE {} SET bannerId = ?, rateUp = ? WHERE id = ?;".format(table_name),
+                                            annotations)
+        except Error as e:
+            logger.error('Failed to update banners of wishes. {}'.format(e))
+            return
+        # banners are set only for wishes without banner, so they move from None bucket to their banners
+        touched = {None} | {annotation[0] for annotation in annotations}
+        for (cached_table, granularity, date_from, date_to), cached in self.bucket_cache.items():
+            if cached_table == table_name and granularity == "banner":
+                cached["dirty"].update(touched)
+
+    def get_wishes_in_time_range(self, table_name, time_from, time_to):
+        # wishes received between time_from and time_to (both included), in order in which they were made:
+        # (id, itemType, itemName, timeReceived, itemRarity)
+        select = "SELECT id, itemType, itemName, timeReceived, itemRarity FROM {} WHERE timeReceived >= ? AND" \
+                 " timeReceived <= ? ORDER BY timeReceived ASC, id ASC;".format(table_name)
+        return self.connection.execute(select, (time_from, time_to)).fetchall()
+
+    def get_time_range(self, table_name):
+        # (time of the oldest wish, time of the newest wish), (None, None) for empty table
+        return self.connection.execute("SELECT MIN(timeReceived), MAX(timeReceived) FROM {};".format(table_name))\
+            .fetchone()
+
+    def get_neighbour_rarities(self, table_name, time_received, before, limit=10):
+        # rarities of up to limit wishes received up to (or since) time_received, the nearest first
+        select = "SELECT itemRarity FROM {} WHERE timeReceived {} ? ORDER BY timeReceived {}, id {} LIMIT ?;"\
+            .format(table_name, *(["<=", "DESC", "DESC"] if before else [">=", "ASC", "ASC"]))
+        return [row[0] for row in self.connection.execute(select, (time_received, limit))]
+
+    def merge_wishes(self, table_name, wishes, replaced_times=(), commit=True):
+        """Inserts wishes in one transaction. Groups of wishes received at replaced_times (multi-wishes) are written
+        again in the right order (order of wishes with the same time is given by id): existing wishes of group keep
+        their ids and get the first wishes of group, only the rest is inserted. So ids of wishes are never reused
+        and new wishes always get bigger ids. Wishes, which changed, have bannerId and rateUp cleared, so they are
+        annotated again, and revision of table is bumped, if any wish changed or was deleted.
+        :param table_name: one of wish_table_names
+        :param wishes: list of [itemType, itemName, timeReceived, itemRarity] in order in which they were made,
+                       including the whole groups of replaced_times
+        :param replaced_times: times of groups, which are written again
+        :param commit: False leaves transaction open, so more merges can be committed together (see finish_import)
+        :return:
+        """
+        select = "SELECT id, itemType, itemName, timeReceived, itemRarity FROM {} WHERE timeReceived = ?" \
+                 " ORDER BY id ASC;".format(table_name)
+        try:
+            existing = {time_received: self.connection.execute(select, (time_received,)).fetchall()
+                        for time_received in replaced_times}
+            updates = []
+            inserts = []
+            for wish in wishes:
+                rows = existing.get(wish[2])
+                if not rows:
+                    inserts.append(tuple(wish[:4]))
+                    continue
+                row = rows.pop(0)
+                if tuple(row[1:5]) != tuple(wish[:4]):
+                    updates.append((wish[0], wish[1], wish[3], row[0]))
+            # wishes of replaced groups, which aren't in wishes anymore
+            deleted = [(row[0],) for rows in existing.values() for row in rows]
+            self.connection.executemany("UPDATE {} SET itemType = ?, itemName = ?, itemRarity = ?, bannerId = NULL,"
+                                        " rateUp = NULL WHERE id = ?;".format(table_name), updates)
+            self.connection.executemany("DELETE FROM {} WHERE id = ?;".format(table_name), deleted)
+            self.connection.executemany("INSERT INTO {} (itemType, itemName, timeReceived, itemRarity) VALUES"
+                                        " (?, ?, ?, ?);".format(table_name), inserts)
+            if updates or deleted:
+                self.bump_wish_revision(table_name)
+        except Error:
+            self.connection.rollback()
+            raise
+        if commit:
+            self.connection.commit()
+
+    def get_multi_wish_labels(self, table_name, time_from, time_to):
+        # time -> list of labels of multi-wishes received between time_from and time_to (both included)
+        select = "SELECT timeReceived, labels FROM multiWishLabels WHERE tableName = ? AND timeReceived >= ? AND" \
+                 " timeReceived <= ?;"
+        return {time_received: labels.split(",") for time_received, labels in
+                self.connection.execute(select, (table_name, time_from, time_to))}
+
+    def set_multi_wish_labels(self, table_name, labels):
+        """Stores labels of multi-wishes, it isn't committed (it's part of merge, see merge_wishes).
+        :param table_name: one of wish_table_names
+        :param labels: dict time -> list of labels, None removes labels of multi-wish
+        :return:
+        """
+        try:
+            self.connection.executemany("DELETE FROM multiWishLabels WHERE tableName = ? AND timeReceived = ?;",
+                                        [(table_name, time_received) for time_received, group_labels in labels.items()
+                                         if group_labels is None])
+            self.connection.executemany("INSERT OR REPLACE INTO multiWishLabels (tableName, timeReceived, labels)"
+                                        " VALUES (?, ?, ?);",
+                                        [(table_name, time_received, ",".join(group_labels))
+                                         for time_received, group_labels in labels.items() if group_labels is not None])
+        except Error:
+            self.connection.rollback()
+            raise
+
+    def start_import(self, table_name, backend, img_paths):
+        # journals new import, all screenshots are queued, returns id of import
+        with self.connection:
+            import_id = self.connection.execute("INSERT INTO imports (tableName, backend) VALUES (?, ?);",
+                                                (table_name, backend)).lastrowid
+            self.connection.executemany("INSERT INTO importImages (importId, position, imagePath) VALUES (?, ?, ?);",
+                                        [(import_id, position, img_path) for position, img_path in enumerate(img_paths)])
+        return import_id
+
+    def get_import(self, import_id):
+        # (tableName, backend, finished) of import, finished is None until its wishes are merged
+        return self.connection.execute("SELECT tableName, backend, finished FROM imports WHERE id = ?;",
+                                       (import_id,)).fetchone()
+
+    def get_unfinished_imports(self):
+        # imports interrupted before their wishes were merged: (id, tableName, backend, started)
+        return self.connection.execute("SELECT id, tableName, backend, started FROM imports WHERE finished IS NULL"
+                                       " ORDER BY id ASC;").fetchall()
+
+    def get_import_images(self, import_id):
+        # screenshots of import in order in which they were selected: (id, imagePath, status)
+        return self.connection.execute("SELECT id, imagePath, status FROM importImages WHERE importId = ?"
+                                       " ORDER BY position ASC;", (import_id,)).fetchall()
+
+    def stage_image_wishes(self, image_id, wishes):
+        """Stores wishes read from screenshot and marks screenshot as read (ocr) in one transaction.
+        :param image_id: id from importImages
+        :param wishes: list of [itemType, itemName, timeReceived, itemRarity], oldest first
+        :return:
+        """
+        with self.connection:
+            self.connection.executemany("INSERT INTO importStaging (imageId, position, itemType, itemName,"
+                                        " timeReceived, itemRarity) VALUES (?, ?, ?, ?, ?, ?);",
+                                        [(image_id, position) + tuple(wish[:4]) for position, wish in enumerate(wishes)])
+            self.connection.execute("UPDATE importImages SET status = 'ocr' WHERE id = ?;", (image_id,))
+
+    def set_image_status(self, image_id, status):
+        with self.connection:
+            self.connection.execute("UPDATE importImages SET status = ? WHERE id = ?;", (status, image_id))
+
+    def get_staged_pages(self, import_id):
+        # wishes of read screenshots of import, which weren't merged yet: list of (image id, list of wishes)
+        select = "SELECT importImages.id, itemType, itemName, timeReceived, itemRarity FROM importImages" \
+                 " JOIN importStaging ON importStaging.imageId = importImages.id WHERE importId = ? AND" \
+                 " status = 'ocr' ORDER BY importImages.position ASC, importStaging.position ASC;"
+        pages = []
+        for row in self.connection.execute(select, (import_id,)):
+            if not pages or pages[-1][0] != row[0]:
+                pages.append((row[0], []))
+            pages[-1][1].append(list(row[1:]))
+        return pages
+
+    def finish_import(self, import_id):
+        # marks read screenshots of import as committed and commits them together with their merged wishes
+        try:
+            self.connection.execute("UPDATE importImages SET status = 'committed' WHERE importId = ? AND"
+                                    " status = 'ocr';", (import_id,))
+            self.connection.execute("DELETE FROM importStaging WHERE imageId IN (SELECT id FROM importImages WHERE"
+                                    " importId = ?);", (import_id,))
+            self.connection.execute("UPDATE imports SET finished = CURRENT_TIMESTAMP WHERE id = ?;", (import_id,))
+        except Error:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+
     def insert_wish_entry(self, table, wish):
         try:
             insert = 'INSERT INTO {}(itemType, itemName, timeReceived, itemRarity) VALUES("{}", "{}", "{}", {});'\
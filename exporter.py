@@ -0,0 +1,242 @@
+from argparse import ArgumentParser
+import csv
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+import numpy as np
+from database import WishDatabase
+from profiles import ProfileRegistry
+from wish_store import parse_timestamps
+
+logger = logging.getLogger('GenshinWishViewer')
+export_columns = ["banner", "id", "itemType", "itemName", "timeReceived", "itemRarity", "bannerId", "rateUp"]
+
+
+class CsvWriter:
+    extension = "csv"
+
+    def __init__(self, file, uid):
+        self.writer = csv.writer(file, lineterminator="\n")
+        self.writer.writerow(export_columns)
+
+    def write_rows(self, table_name, rows):
+        self.writer.writerows((table_name,) + row for row in rows)
+
+    def close(self):
+        pass
+
+
+class NdjsonWriter:
+    # one json object per line
+    extension = "ndjson"
+
+    def __init__(self, file, uid):
+        self.file = file
+
+    def write_rows(self, table_name, rows):
+        self.file.writelines(json.dumps(dict(zip(export_columns, (table_name,) + row)), ensure_ascii=False) + "\n"
+                             for row in rows)
+
+    def close(self):
+        pass
+
+
+class UigfWriter:
+    # UIGF (Uniformed Interchangeable GachaLog Format) json document, written item by item
+    extension = "json"
+    uigf_version = "v2.2"
+    gacha_types = {"wishCharacter": "301", "wishWeapon": "302", "wishStandard": "200", "wishBeginner": "100"}
+
+    def __init__(self, file, uid):
+        self.file = file
+        self.first_item = True
+        info = {"uid": uid, "lang": "en-us", "export_time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "export_timestamp": int(time.time()), "export_app": "genshin-wish-viewer",
+                "uigf_version": self.uigf_version}
+        self.file.write('{{"info": {}, "list": ['.format(json.dumps(info, ensure_ascii=False)))
+
+    def write_rows(self, table_name, rows):
+        gacha_type = self.gacha_types[table_name]
+        for row_id, item_type, item_name, time_received, rarity, banner_id, rate_up in rows:
+            item = {"uigf_gacha_type": gacha_type, "gacha_type": gacha_type, "item_id": "", "count": "1",
+                    "time": time_received, "name": item_name, "item_type": item_type, "rank_type": str(rarity),
+                    "id": "{}{:015d}".format(gacha_type, row_id)}
+            self.file.write(("\n" if self.first_item else ",\n") + json.dumps(item, ensure_ascii=False))
+            self.first_item = False
+
+    def close(self):
+        self.file.write("\n]}\n")
+
+
+class ColumnarWriter:
+    # Compressed columnar binary format. File starts with magic and version, then there are blocks:
+    # uint32 number of rows, uint32 compressed size and zlib compressed columns of the block:
+    # table (uint8), id (int64), timestamp (int64 seconds), rarity (uint8), bannerId (int16, -1 if unknown),
+    # rateUp (int8, -1 if unknown), itemType and itemName ids (uint16) into block dictionary,
+    # which follows as utf-8 strings separated by \0 (dictionary length is uint32 before the columns).
+    extension = "gwvc"
+    magic = b"GWVC"
+    version = 1
+    binary = True
+
+    def __init__(self, file, uid):
+        self.file = file
+        self.file.write(self.magic + struct.pack("<I", self.version))
+
+    def write_rows(self, table_name, rows):
+        ids, item_types, item_names, times, rarities, banner_ids, rate_ups = zip(*rows)
+        dictionary = {}
+        type_ids = np.array([dictionary.setdefault(value, len(dictionary)) for value in item_types], dtype=np.uint16)
+        name_ids = np.array([dictionary.setdefault(value, len(dictionary)) for value in item_names], dtype=np.uint16)
+        dictionary_bytes = "\0".join(dictionary).encode("utf-8")
+        columns = [np.full(len(rows), WishDatabase.wish_table_names.index(table_name), dtype=np.uint8),
+                   np.array(ids, dtype=np.int64),
+                   parse_timestamps(list(times)),
+                   np.array(rarities, dtype=np.uint8),
+                   np.array([-1 if value is None else value for value in banner_ids], dtype=np.int16),
+                   np.array([-1 if value is None else value for value in rate_ups], dtype=np.int8),
+                   type_ids, name_ids]
+        block = struct.pack("<I", len(dictionary_bytes)) + dictionary_bytes + b"".join(column.tobytes()
+                                                                                       for column in columns)
+        compressed = zlib.compress(block)
+        self.file.write(struct.pack("<II", len(rows), len(compressed)) + compressed)
+
+    def close(self):
+        pass
+
+    @classmethod
+    def read(cls, path):
+        """Reads file written by ColumnarWriter.
+        :param path: path to file
+        :return: generator of rows (banner, id, itemType, itemName, timeReceived, itemRarity, bannerId, rateUp)
+        """
+        dtypes = [np.uint8, np.int64, np.int64, np.uint8, np.int16, np.int8, np.uint16, np.uint16]
+        with open(path, "rb") as file:
+            if file.read(4) != cls.magic or struct.unpack("<I", file.read(4))[0] != cls.version:
+                raise Exception("{} isn't columnar export of version {}!".format(path, cls.version))
+            while True:
+                header = file.read(8)
+                if not header:
+                    break
+                count, size = struct.unpack("<II", header)
+                block = zlib.decompress(file.read(size))
+                dictionary_size = struct.unpack("<I", block[:4])[0]
+                dictionary = block[4:4 + dictionary_size].decode("utf-8").split("\0")
+                offset = 4 + dictionary_size
+                columns = []
+                for dtype in dtypes:
+                    columns.append(np.frombuffer(block, dtype=dtype, count=count, offset=offset))
+                    offset = offset + count * np.dtype(dtype).itemsize
+                times = np.datetime_as_string(columns[2].astype('datetime64[s]'))
+                for i in range(count):
+                    yield (WishDatabase.wish_table_names[columns[0][i]], int(columns[1][i]),
+                           dictionary[columns[6][i]], dictionary[columns[7][i]], str(times[i]).replace("T", " "),
+                           int(columns[3][i]), None if columns[4][i] < 0 else int(columns[4][i]),
+                           None if columns[5][i] < 0 else int(columns[5][i]))
+
+
+class WishExporter:
+    # Streams wishes from database to file in chunks, so memory use doesn't depend on size of history.
+    # Incremental export writes only wishes added after watermark (the biggest exported id of every table),
+    # watermarks are kept in json file per database. Wishes already exported can be changed or deleted later (merge
+    # of multi-wish, annotation with changed banners) - then revision of their table differs from the one stored with
+    # watermark and the whole history is exported again.
+    writers = {"csv": CsvWriter, "ndjson": NdjsonWriter, "uigf": UigfWriter, "columnar": ColumnarWriter}
+    watermark_path = "export_watermarks.json"
+    chunk_size = 5000
+
+    def __init__(self, db, db_path, watermark_path=None):
+        self.db = db
+        self.db_path = os.path.abspath(db_path)
+        if watermark_path is not None:
+            self.watermark_path = watermark_path
+
+    def load_watermarks(self):
+        if not os.path.isfile(self.watermark_path):
+            return {}
+        with open(self.watermark_path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def save_watermark(self, key, watermark):
+        watermarks = self.load_watermarks()
+        watermarks[key] = watermark
+        temporary_path = self.watermark_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(watermarks, file, indent=2)
+        os.replace(temporary_path, self.watermark_path)
+
+    def export(self, output_path, export_format, uid="", incremental=False):
+        """
+        :param output_path: path of created file
+        :param export_format: one of writers keys
+        :param uid: UID of account (written to UIGF info)
+        :param incremental: export only wishes added since last incremental export to the same format, or all
+                            wishes, if some of them were changed since then
+        :return: number of exported wishes
+        """
+        writer_class = self.writers[export_format]
+        watermark_key = "{}|{}".format(self.db_path, export_format)
+        previous = self.load_watermarks().get(watermark_key, {}) if incremental else {}
+        revisions = self.db.get_wish_revisions()
+        if previous and previous.get("revisions") != revisions:
+            logger.warning("Exported wishes were changed since last export, whole history is exported again")
+            previous = {}
+        # everything up to current max id is exported, wishes added during export wait for the next one
+        watermark = {table_name: self.db.get_max_id(table_name) for table_name in self.db.wish_table_names}
+        watermark["revisions"] = revisions
+        exported = 0
+        if getattr(writer_class, "binary", False):
+            file = open(output_path, "wb")
+        else:
+            file = open(output_path, "w", encoding="utf-8", newline="")
+        with file:
+            writer = writer_class(file, uid)
+            for table_name in self.db.wish_table_names:
+                for chunk in self.db.iterate_export_rows(table_name, previous.get(table_name, 0),
+                                                         watermark[table_name], self.chunk_size):
+                    writer.write_rows(table_name, chunk)
+                    exported = exported + len(chunk)
+            writer.close()
+        if incremental:
+            self.save_watermark(watermark_key, watermark)
+        logger.info("Exported {} wishes to {}".format(exported, output_path))
+        return exported
+
+
+def export_all_profiles(directory, export_format, incremental=False, registry=None):
+    """Exports every profile to its own file {uid}.{extension} in directory.
+    :return: dict uid -> number of exported wishes
+    """
+    registry = registry or ProfileRegistry()
+    os.makedirs(directory, exist_ok=True)
+    extension = WishExporter.writers[export_format].extension
+    exported = {}
+    for uid in registry.get_uids():
+        db_path = registry.get_db_path(uid)
+        if not os.path.isfile(db_path):
+            continue
+        db = WishDatabase(db_path)
+        db.initialize_database()
+        try:
+            exported[uid] = WishExporter(db, db_path).export(os.path.join(directory, "{}.{}".format(uid, extension)),
+                                                              export_format, uid, incremental)
+        finally:
+            db.connection.close()
+    return exported
+
+
+def main():
+    parser = ArgumentParser(description="Export wish history of all profiles")
+    parser.add_argument("directory", help="directory for exported files")
+    parser.add_argument("-f", "--format", default="csv", choices=list(WishExporter.writers))
+    parser.add_argument("-i", "--incremental", action='store_true', help="export only wishes added since last export")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    export_all_profiles(args.directory, args.format, args.incremental)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
-import cv2
 import numpy as np
-import matplotlib.pyplot as plt
-import pytesseract
 import logging
 import os
+import re
+from datetime import datetime
+from lazy_import import LazyModule
+from catalog import get_catalog
+from name_corrector import get_name_corrector
+from rarity_classifier import RarityClassifier
+from ocr_backends import TesseractBackend
+from page_merger import PageMerger
+
+# OCR stack is imported on first use, so importing this module doesn't slow down start of the application
+cv2 = LazyModule("cv2")
+plt = LazyModule("matplotlib.pyplot")
 
 logger = logging.getLogger('GenshinWishViewer')
 # https://medium.com/analytics-vidhya/how-to-detect-tables-in-images-using-opencv-and-python-6a0f15e560c3
@@ -14,12 +23,46 @@ logger = logging.getLogger('GenshinWishViewer')
 # give option to download wish history using genshin web page url.
 class WishImporter:
     db = None
-
-    def __init__(self, database):
+    catalog = None
+    corrector = None
+    # cells read with lower confidence (0-100, of the least confident word) are read again with retry_passes
+    confidence_threshold = 80
+    # Rarity is taken from colour of name (RarityClassifier), "(4-Star)" read by OCR only breaks ties, when colour is
+    # less confident than this. Confidence of gold/purple is the share of coloured pixels in the winning hue range -
+    # clean names are close to 1, JPEG artefacts and antialiasing stay above 0.8, name cells mixing both colours
+    # fall below. Confidence of grey names is 1 - coloured fraction, which is always above 0.8 (see
+    # RarityClassifier.min_colour_fraction), so 3-star items never need the text.
+    colour_confidence_threshold = 0.8
+    header_contrast = 8  # how much darker (in gray levels) is background of table header than background of wishes
+    date_whitelist = "0123456789-:"
+    time_format = "%Y-%m-%d %H:%M:%S"
+    # (name, preprocessing, read as single line), from the cheapest
+    retry_passes = [("upscale", "upscale", False),
+                    ("otsu", "otsu", True),
+                    ("adaptive", "adaptive", True)]
+
+    def __init__(self, database, backend=None):
+        """
+        :param database: WishDatabase
+        :param backend: OcrBackend, tesseract if not given
+        """
         self.db = database
-
-    def load_image(self, img_path):
-        # img = cv2.imread(img_path)
+        self.backend = backend or TesseractBackend()
+        self.catalog = get_catalog()  # known item names, shared with the rest of the application
+        self.corrector = get_name_corrector()
+        self.rarity_classifier = RarityClassifier()
+        # wishes, which OCR probably misread and which weren't confidently corrected: dicts with image,
+        # wish (as inserted), read_name, confidence and reason ("name" or "rarity")
+        self.review_list = []
+        self.failed_images = []  # screenshots, which couldn't be read
+        self.ocr_stats = {"cells": 0, "retried": 0, "improved": 0, "uncertain": 0, "rarity_mismatches": 0,
+                          "derived_types": 0, "read_types": 0,
+                          "passes": {name: {"tried": 0, "accepted": 0} for name, preprocessing, config in
+                                     self.retry_passes}}
+
+    def load_image(self, img_path, color=False):
+        if color:
+            return cv2.imread(img_path)
         img_gray = cv2.imread(img_path, 0)
         return img_gray
 
@@ -35,8 +78,71 @@ class WishImporter:
 
     def get_wishes_from_imagev2(self, img_path):
         logger.debug("get_wishes_from_image -- img_path: {}". format(img_path))
-        img_gray = self.load_image(img_path)
+        # colour image is kept for rarity of items (colour of their names)
+        img_color = self.load_image(img_path, color=True)
+        img_gray = cv2.cvtColor(img_color, cv2.COLOR_BGR2GRAY)
+
+        cell_coords = self.get_cell_coordinates(img_gray)
+
+        # for i in cell_coords:
+        #     for cell in i:
+        #         self.show_img(img_gray[cell[2]:cell[3], cell[0]:cell[1]])
+
+        # get wish text from cells in rows
+        # only item name and time received are read. Item type is derived from the name (see correct_wish) and
+        # "wish type" column of new schema is the banner, which wishes are imported to
+        wishes = []
+        wish_rows = []
+        for number, row in enumerate(cell_coords):
+            if self.is_header_row(img_gray, cell_coords, number):
+                continue
+            wish_rows.append(row)
+        # all cells of page are read together, so OCR backend can process them in one batch
+        names = self.read_cells([img_gray[row[1][2]:row[1][3], row[1][0]:row[1][1]] for row in wish_rows])
+        times = self.read_cells([img_gray[row[-1][2]:row[-1][3], row[-1][0]:row[-1][1]] for row in wish_rows],
+                                is_date=True)
+        for row, name, time_received in zip(wish_rows, names, times):
+            # wishes with unreadable time can't be placed in history, so whole screenshot fails rather than
+            # staging them
+            normalized_time = self.normalize_time(time_received)
+            if normalized_time is None:
+                raise Exception("Couldn't read time of wish {} ({})".format(name.strip(), time_received.strip()))
+            # remove whitespaces from string, replace is in case \n will be in the middle of string
+            wish = [None, name.strip().replace('\n', " "), normalized_time]
+            colour = self.rarity_classifier.classify(img_color[row[1][2]:row[1][3], row[1][0]:row[1][1]])
+            type_snip = img_gray[row[0][2]:row[0][3], row[0][0]:row[0][1]]
+            wishes.append(self.correct_wish(self.add_rarity_to_wish(wish, colour, img_path), img_path, type_snip))
 
+        # reverse wishes (the ones on bottom are older and they should be inserted first to db)
+        wishes = wishes[::-1]
+
+        for item in wishes:
+            logger.debug(item)
+        logger.debug("--------")
+        return wishes
+
+    def normalize_time(self, text):
+        """Formats time read by OCR as "YYYY-MM-DD HH:MM:SS". Only digits are used, so separators, which OCR missed
+        or misread (e.g. no space between date and time), don't matter.
+        :param text: time received read by OCR
+        :return: formatted time, None if text isn't valid time
+        """
+        digits = re.sub(r"\D", "", text)
+        if len(digits) != 14:
+            return None
+        time_received = "{}-{}-{} {}:{}:{}".format(digits[:4], digits[4:6], digits[6:8], digits[8:10], digits[10:12],
+                                                   digits[12:])
+        try:
+            datetime.strptime(time_received, self.time_format)
+        except ValueError:
+            return None
+        return time_received
+
+    def get_cell_coordinates(self, img_gray):
+        """Finds table in image and coordinates of its cells from table lines.
+        :param img_gray: grayscale image of wish history
+        :return: list of rows, every row is list of cells [x_start, x_end, y_start, y_end]
+        """
         # binarize image to have only table lines
         # first cut off values above 205, then binarize everything bigger than 185
         # so we end up with binarizing everything in range of (185, 205)
@@ -80,32 +186,17 @@ class WishImporter:
                 pass
             else:
                 raise Exception("Number of detected objects in a row wasn't 3 or 4. Len(cell_coords[{}]: {}".format(i, len(cell_coords[i])))
-
-        # for i in cell_coords:
-        #     for cell in i:
-        #         self.show_img(img_gray[cell[2]:cell[3], cell[0]:cell[1]])
-
-        # get wish text from cells in rows
-        wishes = []
-        for row in cell_coords:
-            wish = []
-            for crdnt in row:
-                img_snip = img_gray[crdnt[2]:crdnt[3], crdnt[0]:crdnt[1]]
-                wish.append(self.get_text_from_image(img_snip).strip().replace('\n', " "))  # remove whitespaces from string, replace is in case \n will be in the middle of string
-            if wish[0] == "Item Type":
-                continue
-            # remove "wish type" information, if it's new schema
-            if len(wish) == 4:
-                wish.pop(2)
-            wishes.append(self.add_rarity_to_wish(wish))
-
-        # reverse wishes (the ones on bottom are older and they should be inserted first to db)
-        wishes = wishes[::-1]
-
-        for item in wishes:
-            logger.debug(item)
-        logger.debug("--------")
-        return wishes
+        return cell_coords
+
+    def is_header_row(self, img_gray, cell_coords, number):
+        # header is the first row of table and its background is darker than background of wishes
+        if number != 0 or len(cell_coords) < 2:
+            return False
+        header = cell_coords[0][0]
+        first_wish = cell_coords[1][0]
+        header_background = np.median(img_gray[header[2]:header[3], header[0]:header[1]])
+        wish_background = np.median(img_gray[first_wish[2]:first_wish[3], first_wish[0]:first_wish[1]])
+        return wish_background - header_background > self.header_contrast
 
     def find_long_line(self, img, offset=5):
         start = 0
@@ -238,34 +329,121 @@ class WishImporter:
                 grouped_coordinates[i].pop(2)
         return grouped_coordinates
 
-    def get_text_from_image(self, img, xconfig="-c page_separator=''"):
-        text = pytesseract.image_to_string(img, config=xconfig)
-        if not text:
+    def get_text_from_image(self, img, is_date=False):
+        # reads text of one cell, see read_cells
+        return self.read_cells([img], is_date)[0]
+
+    def read_cells(self, images, is_date=False):
+        """Reads text of cells by OCR backend. Cells read with low confidence are read again with more expensive
+        preprocessing (see retry_passes), until one of passes is confident enough. The most confident reading is
+        returned. Every pass reads all its cells as one batch.
+        :param images: grayscale images of cells
+        :param is_date: cells contain time received, retries allow only digits, "-" and ":"
+        :return: list of texts
+        """
+        self.ocr_stats["cells"] = self.ocr_stats["cells"] + len(images)
+        results = self.backend.recognize(images)
+        pending = [i for i, (text, confidence) in enumerate(results) if confidence < self.confidence_threshold]
+        first_confidences = {i: results[i][1] for i in pending}
+        self.ocr_stats["retried"] = self.ocr_stats["retried"] + len(pending)
+        for name, preprocessing, single_line in self.retry_passes:
+            if not pending:
+                break
+            retries = self.backend.recognize([self.preprocess(images[i], preprocessing) for i in pending], single_line,
+                                             self.date_whitelist if is_date else None)
+            self.ocr_stats["passes"][name]["tried"] = self.ocr_stats["passes"][name]["tried"] + len(pending)
+            for i, (retry_text, retry_confidence) in zip(pending, retries):
+                logger.debug("OCR retry {}: {} ({}) -> {} ({})".format(name, results[i][0], results[i][1], retry_text,
+                                                                      retry_confidence))
+                if retry_text and retry_confidence > results[i][1]:
+                    results[i] = (retry_text, retry_confidence)
+            accepted = [i for i in pending if results[i][1] >= self.confidence_threshold]
+            self.ocr_stats["passes"][name]["accepted"] = self.ocr_stats["passes"][name]["accepted"] + len(accepted)
+            pending = [i for i in pending if results[i][1] < self.confidence_threshold]
+        self.ocr_stats["improved"] = self.ocr_stats["improved"] + sum(results[i][1] > confidence for i, confidence in
+                                                                      first_confidences.items())
+        self.ocr_stats["uncertain"] = self.ocr_stats["uncertain"] + len(pending)
+        if not all(text for text, confidence in results):
             raise Exception("Failed to read text from image.")
-        return text
+        return [text for text, confidence in results]
+
+    def preprocess(self, img, preprocessing):
+        # text of cells is small, upscaled image is read much better
+        img = cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+        if preprocessing == "otsu":
+            ret, img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        elif preprocessing == "adaptive":
+            img = cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10)
+        return img
+
+    def get_import_report(self):
+        # summary of OCR retries and names to review, shown after import
+        stats = self.ocr_stats
+        passes = ", ".join("{} {}/{}".format(name, values["accepted"], values["tried"])
+                           for name, values in stats["passes"].items() if values["tried"])
+        report = "{} cells read, {} retried ({} improved, {} still uncertain), {} rarity mismatches, item type derived" \
+                 " for {} of {} wishes".format(stats["cells"], stats["retried"], stats["improved"], stats["uncertain"],
+                                              stats["rarity_mismatches"], stats["derived_types"],
+                                              stats["derived_types"] + stats["read_types"])
+        if passes:
+            report = report + ", accepted retries: " + passes
+        if self.failed_images:
+            report = report + ", {} images couldn't be read".format(len(self.failed_images))
+        return report + ", {} wishes to review".format(len(self.review_list))
 
     def import_from_dir(self, dir_path, table_name):
         if table_name not in ["wishCharacter", "wishWeapon", "wishStandard", "wishBeginner"]:
             logger.error("Wrong table name!")
             return
         img_paths = self.get_image_paths_from_dir_path(dir_path)
+        merger = PageMerger(self.db, table_name)
         for img_path in img_paths:
-            wishes = self.get_wishes_from_image(img_path)
-            if not self.check_if_wishes_are_already_in_db(wishes):
-                self.insert_to_db(wishes, table_name)
-            else:
-                logger.info("Wishes: {} are already in db!".format(wishes))
+            # old style reading keeps order of screenshot - the newest wish first
+            merger.merge_page(list(reversed(self.get_wishes_from_image(img_path))))
+        logger.info("Import finished: {}".format(merger.get_report()))
 
     def import_from_list_of_image_paths(self, img_paths, table_name):
         if table_name not in ["wishCharacter", "wishWeapon", "wishStandard", "wishBeginner"]:
             logger.error("Wrong table name!")
             return
-        for img_path in img_paths:
-            wishes = self.get_wishes_from_imagev2(img_path)
-            if not self.check_if_wishes_are_already_in_db(wishes):
-                self.insert_to_db(wishes, table_name)
-            else:
-                logger.info("Wishes: {} are already in db!".format(wishes))
+        import_id = self.db.start_import(table_name, self.backend.name, img_paths)
+        merger = self.import_journaled(import_id)[0]
+        logger.info("Import finished: {}".format(merger.get_report()))
+
+    def import_journaled(self, import_id, on_image_done=None):
+        """Reads screenshots of import journaled in database (see WishDatabase.start_import) and merges their wishes
+        to wish table. Wishes of every screenshot are staged in database as soon as it's read, so no screenshot is read
+        twice, if import is resumed after crash. Staged pages are merged in one transaction at the end, so wishes
+        of import are in database all or none of them.
+        :param import_id: id of started or interrupted import
+        :param on_image_done: called with number of screenshots done so far
+        :return: (PageMerger, list of inserted wishes, which can be appended in memory, if merger doesn't need reload)
+        """
+        journal = self.db.get_import(import_id)
+        if journal is None or journal[2] is not None:
+            raise Exception("Import {} doesn't exist or was already finished!".format(import_id))
+        table_name = journal[0]
+        for count, (image_id, img_path, status) in enumerate(self.db.get_import_images(import_id), start=1):
+            if status == "queued":
+                try:
+                    self.db.stage_image_wishes(image_id, self.get_wishes_from_imagev2(img_path))
+                except Exception as e:
+                    logger.error("Couldn't read wishes from {}. {}".format(img_path, e))
+                    self.failed_images.append(img_path)
+                    self.db.set_image_status(image_id, "failed")
+            if on_image_done is not None:
+                on_image_done(count)
+
+        merger = PageMerger(self.db, table_name, commit=False)
+        new_wishes = []
+        try:
+            for image_id, wishes in self.db.get_staged_pages(import_id):
+                new_wishes.extend(merger.merge_page(wishes))
+        except Exception:
+            self.db.connection.rollback()
+            raise
+        self.db.finish_import(import_id)
+        return merger, new_wishes
 
     def get_image_paths_from_dir_path(self, dir_path):
         if dir_path == "":
@@ -276,34 +454,85 @@ class WishImporter:
                 img_paths.append(dir_path + "/" + file)
         return img_paths
 
-    def add_rarity_to_wish(self, wish):
+    def add_rarity_to_wish(self, wish, colour=None, img_path=""):
+        """Adds rarity to wish and trims "(4-Star)" from item name. Rarity is given by colour of name, text is used
+        only when colour is ambiguous (or wasn't classified), disagreement of both is logged.
+        :param wish: [itemType, itemName, timeReceived]
+        :param colour: (rarity, confidence) of name cell from RarityClassifier, None uses only the text
+        :param img_path: image of wish, for review list
+        :return: wish with rarity
+        """
         position = wish[1].find("(")
-        if position == -1:
-            wish.append(3)
-        else:
-            # add rarity (4 or 5) and trim item name
-            wish.append(int(wish[1][position+1]))
-            wish[1] = wish[1][:position-1]
+        text_rarity = 3
+        if position != -1:
+            text_rarity = int(wish[1][position+1]) if wish[1][position+1:position+2].isdigit() else None
+            wish[1] = wish[1][:position].rstrip()
+        rarity = text_rarity
+        if colour is not None and colour[0] is not None:
+            colour_rarity, colour_confidence = colour
+            ambiguous = colour_confidence < self.colour_confidence_threshold
+            if not ambiguous or text_rarity is None:
+                rarity = colour_rarity
+            if colour_rarity != text_rarity:
+                self.ocr_stats["rarity_mismatches"] = self.ocr_stats["rarity_mismatches"] + 1
+                logger.warning("Rarity of {} from {} is {} by text and {} by colour (confidence {:.2f}), imported as {}"
+                               .format(wish[1], img_path, text_rarity, colour_rarity, colour_confidence, rarity))
+                if ambiguous:
+                    self.review_list.append({"image": img_path, "wish": wish, "read_name": wish[1],
+                                             "confidence": colour_confidence, "reason": "rarity"})
+        if rarity is None:
+            raise Exception("Failed to read rarity of {}.".format(wish[1]))
+        wish.append(rarity)
+        return wish
+
+    def correct_wish(self, wish, img_path, type_img=None):
+        """Replaces item name with the nearest catalog name, unsure corrections are added to review_list.
+        Item type, which wasn't read (None), is taken from catalog. Only if name isn't confidently known,
+        item type is read by OCR from type_img.
+        :param wish: [itemType or None, itemName, timeReceived, itemRarity]
+        :param img_path: image of wish, for review list
+        :param type_img: image of item type cell
+        :return: corrected wish
+        """
+        correction = self.corrector.correct(wish[0], wish[1], wish[3])
+        if wish[0] is None:
+            if correction["record"] is not None and not correction["review"]:
+                wish[0] = correction["record"]["category"]
+                self.ocr_stats["derived_types"] = self.ocr_stats["derived_types"] + 1
+            elif correction["record"] is None and wish[3] == 3:
+                # every 3-star item is a weapon
+                wish[0] = "Weapon"
+                self.ocr_stats["derived_types"] = self.ocr_stats["derived_types"] + 1
+                correction = self.corrector.correct(wish[0], wish[1], wish[3])
+            else:
+                wish[0] = self.get_text_from_image(type_img).strip()
+                self.ocr_stats["read_types"] = self.ocr_stats["read_types"] + 1
+                correction = self.corrector.correct(wish[0], wish[1], wish[3])
+        wish[1] = correction["name"]
+        if correction["review"]:
+            logger.warning("Name {} from {} should be reviewed, it was imported as {} (confidence {:.2f})"
+                           .format(correction["read_name"], img_path, wish[1], correction["confidence"]))
+            self.review_list.append({"image": img_path, "wish": wish, "read_name": correction["read_name"],
+                                     "confidence": correction["confidence"], "reason": "name"})
         return wish
 
     def get_wishes_from_image(self, img_path):
-        img_gray = self.load_image(img_path)
+        img_color = self.load_image(img_path, color=True)
+        img_gray = cv2.cvtColor(img_color, cv2.COLOR_BGR2GRAY)
         coordinates = self.get_text_contours(img_gray)
         wishes = []
         # pytesseract.pytesseract.tesseract_cmd = 'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
         # pytesseract.get_tesseract_version()
         for item in coordinates:
             wish = []
-            for crdnt in item:
+            for column, crdnt in enumerate(item):
                 img_snip = img_gray[crdnt[1]:crdnt[1] + crdnt[3], crdnt[0]:crdnt[0] + crdnt[2]]
-                wish.append(self.get_text_from_image(img_snip).replace('\n', " ").rstrip())  # remove whitespaces from string, replace is in case \n will be in the middle of string
-            wishes.append(self.add_rarity_to_wish(wish))
+                wish.append(self.get_text_from_image(img_snip, is_date=column == len(item) - 1).replace('\n', " ").rstrip())  # remove whitespaces from string, replace is in case \n will be in the middle of string
+            name = item[1]
+            colour = self.rarity_classifier.classify(img_color[name[1]:name[1] + name[3], name[0]:name[0] + name[2]])
+            wishes.append(self.correct_wish(self.add_rarity_to_wish(wish, colour, img_path), img_path))
         return wishes
 
-    def check_if_wishes_are_already_in_db(self, wishes):
-        # TODO implement!
-        return False
-
     def insert_to_db(self, wishes, table_name):
         # TODO check if connection is alive?
         if len(wishes) == 1:
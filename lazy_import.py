@@ -0,0 +1,27 @@
+import importlib
+import logging
+import time
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class LazyModule:
+    # Stands in for a module and imports it on first attribute access. Used for heavy modules (OpenCV, matplotlib,
+    # tesseract), which are needed only when wishes are imported from screenshots, so they don't slow down start-up.
+
+    def __init__(self, name):
+        self.__dict__["name"] = name
+        self.__dict__["module"] = None
+
+    def load(self):
+        if self.module is None:
+            load_start = time.perf_counter()
+            self.__dict__["module"] = importlib.import_module(self.name)
+            logger.debug("Imported {} in {:.0f} ms".format(self.name, (time.perf_counter() - load_start) * 1000))
+        return self.module
+
+    def __getattr__(self, attribute):
+        return getattr(self.load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self.load(), attribute, value)
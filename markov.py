@@ -0,0 +1,150 @@
+import numpy as np
+import logging
+from functools import lru_cache
+from pull_model import banner_models
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class TransitionMatrix:
+    # Sparse transition matrix in coordinate format. Product with vector is computed by np.bincount,
+    # which sums weighted entries going into the same state.
+
+    def __init__(self, size, rows, columns, values):
+        self.size = size
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.columns = np.asarray(columns, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+
+    def multiply(self, vector):
+        return np.bincount(self.rows, weights=self.values * vector[self.columns], minlength=self.size)
+
+
+def get_hit_transitions(banner_type, count_rate_up, fate_points_needed=2):
+    """Describes what happens with guarantee (and fate points) when 5-star is received.
+    :param banner_type: one of banner_models keys
+    :param count_rate_up: count only rate up copies (chosen weapon on weapon banner), otherwise count every 5-star
+    :param fate_points_needed: fate points of epitomized path needed for the chosen weapon
+    :return: (number of hit states, list of (from state, to state, copy gained, probability))
+    """
+    rate_up_chance = banner_models[banner_type].rate_up_chance
+    if not count_rate_up or rate_up_chance is None:
+        return 1, [(0, 0, 1, 1.0)]
+    if banner_type != "wishWeapon":
+        # state 0 - 50/50, state 1 - guaranteed
+        return 2, [(0, 0, 1, rate_up_chance), (0, 1, 0, 1 - rate_up_chance), (1, 0, 1, 1.0)]
+    # state is guaranteed * (fate_points_needed + 1) + fate points
+    transitions = []
+    for guaranteed in [0, 1]:
+        for fate_points in range(fate_points_needed + 1):
+            state = guaranteed * (fate_points_needed + 1) + fate_points
+            if fate_points >= fate_points_needed:
+                transitions.append((state, 0, 1, 1.0))
+                continue
+            rate_up = 1.0 if guaranteed else rate_up_chance
+            missed = min(fate_points + 1, fate_points_needed)
+            transitions.append((state, 0, 1, rate_up * 0.5))
+            transitions.append((state, missed, 0, rate_up * 0.5))
+            transitions.append((state, fate_points_needed + 1 + missed, 0, 1 - rate_up))
+    return 2 * (fate_points_needed + 1), transitions
+
+
+@lru_cache(maxsize=None)
+def get_transition_matrix(banner_type, max_copies, count_rate_up=True):
+    """Transition matrix of one wish. State is (copies, hit state, pity), index is
+    (copies * hit_states + hit state) * hard_pity + pity. Copies stop at max_copies.
+    :return: (TransitionMatrix, number of hit states)
+    """
+    rates = banner_models[banner_type].five_star_rates
+    hard_pity = len(rates)
+    hit_states, hit_transitions = get_hit_transitions(banner_type, count_rate_up)
+    rows, columns, values = [], [], []
+    for copies in range(max_copies + 1):
+        for hit_state in range(hit_states):
+            base = (copies * hit_states + hit_state) * hard_pity
+            # no 5-star, pity goes up
+            rows.extend(range(base + 1, base + hard_pity))
+            columns.extend(range(base, base + hard_pity - 1))
+            values.extend(1 - rates[:-1])
+            # 5-star, pity goes back to 0
+            for from_state, to_state, gained, probability in hit_transitions:
+                if from_state != hit_state:
+                    continue
+                new_copies = min(copies + gained, max_copies)
+                rows.extend([(new_copies * hit_states + to_state) * hard_pity] * hard_pity)
+                columns.extend(range(base, base + hard_pity))
+                values.extend(rates * probability)
+    size = (max_copies + 1) * hit_states * hard_pity
+    return TransitionMatrix(size, rows, columns, values), hit_states
+
+
+class MarkovEngine:
+    # Exact distribution of number of copies after N wishes. Pity and guarantee are modeled as Markov chain and
+    # distribution is moved one wish forward by sparse matrix-vector product.
+    # Distributions after every wish are memoized for every start state, so the next query only computes wishes,
+    # which weren't computed yet.
+
+    def __init__(self, banner_type, max_copies=7, count_rate_up=True):
+        """
+        :param banner_type: one of banner_models keys
+        :param max_copies: copies are counted up to this number, the last value of distribution is "max_copies or more"
+        :param count_rate_up: count only rate up copies (chosen weapon on weapon banner), otherwise count every 5-star
+        """
+        self.banner_type = banner_type
+        self.max_copies = max_copies
+        self.matrix, self.hit_states = get_transition_matrix(banner_type, max_copies, count_rate_up)
+        self.hard_pity = len(banner_models[banner_type].five_star_rates)
+        self.computed = {}  # start state -> (last state vector, list of copies distributions after every wish)
+
+    def get_start_vector(self, pity, guaranteed, fate_points):
+        if self.hit_states == 1:
+            hit_state = 0
+        elif self.banner_type == "wishWeapon":
+            hit_state = int(guaranteed) * self.hit_states // 2 + min(fate_points, self.hit_states // 2 - 1)
+        else:
+            hit_state = int(guaranteed)
+        vector = np.zeros(self.matrix.size)
+        vector[hit_state * self.hard_pity + min(pity, self.hard_pity - 1)] = 1.0
+        return vector
+
+    def get_distributions(self, pulls, pity=0, guaranteed=False, fate_points=0):
+        """
+        :param pulls: number of wishes
+        :param pity: current pity
+        :param guaranteed: next 5-star is guaranteed to be rate up
+        :param fate_points: fate points of epitomized path (weapon banner only)
+        :return: numpy array of shape (pulls + 1, max_copies + 1), [n][k] - chance of k copies after n wishes
+        """
+        key = (pity, bool(guaranteed), fate_points)
+        if key not in self.computed:
+            vector = self.get_start_vector(pity, guaranteed, fate_points)
+            self.computed[key] = (vector, [self.get_copies_distribution(vector)])
+        vector, distributions = self.computed[key]
+        for _ in range(len(distributions) - 1, pulls):
+            vector = self.matrix.multiply(vector)
+            distributions.append(self.get_copies_distribution(vector))
+        self.computed[key] = (vector, distributions)
+        return np.array(distributions[:pulls + 1])
+
+    def get_copies_distribution(self, vector):
+        return vector.reshape(self.max_copies + 1, -1).sum(axis=1)
+
+    def get_distribution(self, pulls, pity=0, guaranteed=False, fate_points=0):
+        # distribution of copies after given number of wishes
+        return self.get_distributions(pulls, pity, guaranteed, fate_points)[-1]
+
+    def get_probability(self, pulls, copies, pity=0, guaranteed=False, fate_points=0):
+        # chance of getting at least given number of copies within given number of wishes
+        if copies > self.max_copies:
+            raise Exception("Engine counts only up to {} copies!".format(self.max_copies))
+        return float(np.sum(self.get_distribution(pulls, pity, guaranteed, fate_points)[copies:]))
+
+
+def get_start_state(db, banner_type):
+    """Reads current pity and guarantee from stored history.
+    :param db: WishDatabase
+    :param banner_type: one of WishDatabase.wish_table_names
+    :return: (pity, guaranteed)
+    """
+    rate_up = [value for value in db.get_rate_up_of_hits(banner_type, 5) if value is not None]
+    return db.get_current_pity(banner_type, 5), bool(rate_up and not rate_up[-1])
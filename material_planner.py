@@ -0,0 +1,127 @@
+import numpy as np
+import logging
+from catalog import get_catalog
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class MaterialTarget:
+    # Leveling goal of one character or weapon, e.g. character from 40 to 90 with talents from 1 to 9
+
+    def __init__(self, category, name, start_level, target_level, start_ascended=False, target_ascended=False,
+                 talents=None, rarity=None):
+        """
+        :param category: Character or Weapon
+        :param name: name of character or weapon (used to find names of its materials in catalog)
+        :param start_level: current level
+        :param target_level: wanted level
+        :param start_ascended: current level is level cap (20, 40, ...) which is already ascended
+        :param target_ascended: wanted level cap should be ascended as well
+        :param talents: list of (current level, wanted level) of talents (characters only), single tuple is used
+                        for all three talents
+        :param rarity: rarity of weapon, None takes it from catalog (unknown weapon raises exception then)
+        """
+        self.category = category
+        self.name = name
+        self.start_level = start_level
+        self.target_level = target_level
+        self.start_ascended = start_ascended
+        self.target_ascended = target_ascended
+        if isinstance(talents, tuple):
+            talents = [talents] * 3
+        self.talents = talents or []
+        self.rarity = rarity
+
+
+class MaterialPlanner:
+    # Sums mora and materials needed for many targets at once. Costs of every table (weapon ascension of 4/5-star,
+    # character ascension, talents) are stored as cumulative sums in rows of one matrix, so cost of going from
+    # phase a to phase b is cumulative[b] - cumulative[a] - one fancy indexing of the matrix plans all targets.
+    talent_max_level = 10
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog if catalog is not None else get_catalog()
+        ascension_list = self.catalog.ascension_list
+        tables = {("Weapon", int(rarity)): phases for rarity, phases in ascension_list["Weapon Ascension"].items()}
+        tables[("Character", None)] = ascension_list["Character Ascension"]
+        tables["Talent"] = ascension_list["Talent"]
+
+        ignored_keys = ["phase", "level", "required_ascension"]
+        self.materials = []
+        for phases in tables.values():
+            for key in phases[0]:
+                if key not in ignored_keys and key not in self.materials:
+                    self.materials.append(key)
+        self.ascension_caps = np.array([phase["level"] for phase in ascension_list["Character Ascension"]])
+
+        rows = []
+        self.table_offsets = {}
+        for table_key, phases in tables.items():
+            costs = np.array([[phase.get(material, 0) for material in self.materials] for phase in phases],
+                             dtype=np.int64)
+            self.table_offsets[table_key] = len(rows)
+            rows.extend(np.vstack((np.zeros((1, len(self.materials)), dtype=np.int64), np.cumsum(costs, axis=0))))
+        self.cumulative = np.array(rows)
+
+    def get_phase(self, level, ascended):
+        # number of ascension phases done at given level
+        return int(np.searchsorted(self.ascension_caps, level, side='left')) + (1 if ascended and
+                                                                                level in self.ascension_caps else 0)
+
+    def get_table_key(self, target):
+        if target.category == "Character":
+            return "Character", None
+        rarity = target.rarity
+        if rarity is None:
+            record = self.catalog.get(target.name)
+            if record is None or record["rarity"] is None:
+                raise Exception("Rarity of weapon {} is not known, it has to be given in target!".format(target.name))
+            rarity = record["rarity"]
+        if ("Weapon", rarity) not in self.table_offsets:
+            raise Exception("There are no ascension costs of {}-star weapons ({})!".format(rarity, target.name))
+        return "Weapon", rarity
+
+    def plan(self, targets):
+        """
+        :param targets: list of MaterialTarget
+        :return: dict with mora, materials (material -> amount) and named_materials ((material, name) -> amount)
+                 for materials, which name is known from catalog
+        """
+        starts = []
+        ends = []
+        owners = []  # index of target for every (start, end) segment
+        for index, target in enumerate(targets):
+            if target.target_level < target.start_level:
+                raise Exception("Target level of {} is lower than current level!".format(target.name))
+            offset = self.table_offsets[self.get_table_key(target)]
+            starts.append(offset + self.get_phase(target.start_level, target.start_ascended))
+            ends.append(offset + self.get_phase(target.target_level, target.target_ascended))
+            owners.append(index)
+            for start_talent, target_talent in target.talents:
+                if not 1 <= start_talent <= target_talent <= self.talent_max_level:
+                    raise Exception("Wrong talent levels {}->{} of {}!".format(start_talent, target_talent,
+                                                                               target.name))
+                offset = self.table_offsets["Talent"]
+                starts.append(offset + start_talent - 1)
+                ends.append(offset + target_talent - 1)
+                owners.append(index)
+        if not starts:
+            return {"mora": 0, "materials": {}, "named_materials": {}}
+
+        segment_costs = self.cumulative[np.array(ends)] - self.cumulative[np.array(starts)]
+        totals = segment_costs.sum(axis=0)
+        target_costs = np.zeros((len(targets), len(self.materials)), dtype=np.int64)
+        np.add.at(target_costs, np.array(owners), segment_costs)
+
+        named_materials = {}
+        records = [self.catalog.get(target.name) for target in targets]
+        for column, material in enumerate(self.materials):
+            for record, amount in zip(records, target_costs[:, column].tolist()):
+                if amount and record is not None and record.get(material):
+                    key = (material, record[material])
+                    named_materials[key] = named_materials.get(key, 0) + amount
+        materials = {material: int(total) for material, total in zip(self.materials, totals.tolist())
+                     if material != "mora" and total}
+        return {"mora": int(totals[self.materials.index("mora")]),
+                "materials": materials,
+                "named_materials": named_materials}
@@ -0,0 +1,151 @@
+import logging
+import threading
+from catalog import get_catalog, normalize_name
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+def get_edit_distance(first, second):
+    # Levenshtein distance (insertions, deletions and substitutions) computed by bit-parallel algorithm of Myers
+    # (Hyyro's variant), every column of dynamic programming matrix is one operation on python int
+    if not first or not second:
+        return len(first) + len(second)
+    positions = {}
+    for i, char in enumerate(first):
+        positions[char] = positions.get(char, 0) | (1 << i)
+    mask = (1 << len(first)) - 1
+    last = 1 << (len(first) - 1)
+    positive, negative = mask, 0
+    distance = len(first)
+    for char in second:
+        equal = positions.get(char, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        horizontal_positive = negative | (~(horizontal | positive) & mask)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last:
+            distance = distance + 1
+        elif horizontal_negative & last:
+            distance = distance - 1
+        horizontal_positive = ((horizontal_positive << 1) | 1) & mask
+        horizontal_negative = (horizontal_negative << 1) & mask
+        positive = horizontal_negative | (~(vertical | horizontal_positive) & mask)
+        negative = horizontal_positive & vertical
+    return distance
+
+
+class BKTree:
+    # Burkhard-Keller tree of words for nearest neighbour search in edit distance. Every child is kept under its
+    # distance from parent, so by triangle inequality only children with key in [d - max_distance, d + max_distance]
+    # can contain words within max_distance of the query.
+    def __init__(self):
+        self.root = None  # [word, value, {distance: child}]
+        self.size = 0
+
+    def add(self, word, value=None):
+        if self.root is None:
+            self.root = [word, value, {}]
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            distance = get_edit_distance(word, node[0])
+            if distance == 0:
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [word, value, {}]
+                self.size = self.size + 1
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """
+        :return: list of (distance, word, value) of words within max_distance, closest first
+        """
+        found = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node = nodes.pop()
+            distance = get_edit_distance(word, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[0], node[1]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+        return sorted(found, key=lambda item: (item[0], item[1]))
+
+
+class NameCorrector:
+    # Snaps item names read by OCR to the nearest name from catalog ("Favonlus Warbow" -> "Favonius Warbow").
+    # Names are compared normalized (see normalize_name), so OCR mistakes in spaces and punctuation don't count.
+    # There is one BK-tree per category, so weapon is never corrected to character and vice versa.
+    # Confidence is similarity of names (1 - distance / length), lowered by rarity_conflict_penalty if catalog knows
+    # different rarity of the item than OCR read. Corrections with confidence below review_threshold
+    # should be checked by user.
+    review_threshold = 0.8
+    rarity_conflict_penalty = 0.25
+    max_relative_distance = 0.25  # max number of wrong letters per letter of name
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog or get_catalog()
+        self.trees = {}
+        for record in self.catalog.records:
+            self.trees.setdefault(record["category"], BKTree()).add(normalize_name(record["name"]), record)
+
+    def is_known(self, category, rarity):
+        # catalog may not have every item of some type and rarity, unknown names of such items are kept as they were
+        # read - records without rarity don't tell, if catalog knows items of given rarity
+        return rarity is not None and bool(self.catalog.find(category, rarity))
+
+    def get_confidence(self, distance, read_name, record, rarity):
+        confidence = 1 - distance / max(len(read_name), len(normalize_name(record["name"])), 1)
+        if record["rarity"] is not None and record["rarity"] != rarity:
+            confidence = confidence - self.rarity_conflict_penalty
+        return max(confidence, 0.0)
+
+    def correct(self, item_type, name, rarity):
+        """Finds catalog item for name read by OCR.
+        :param item_type: item type read by OCR (Weapon or Character), None searches items of every type
+        :param name: item name read by OCR
+        :param rarity: rarity read by OCR
+        :return: dict with name (corrected, or read one if nothing was found), read_name, confidence (None if catalog
+                 doesn't know items of such type and rarity), record (catalog record or None) and review (True if
+                 correction should be checked by user)
+        """
+        read_name = normalize_name(name)
+        candidates = []
+        exact = self.catalog.get(name)
+        if exact is not None:
+            candidates.append((0, exact))
+        else:
+            max_distance = max(1, int(len(read_name) * self.max_relative_distance))
+            trees = self.trees.values() if item_type is None else [self.trees.get(item_type, BKTree())]
+            candidates = [(distance, record) for tree in trees for distance, word, record in
+                          tree.search(read_name, max_distance)]
+        if not candidates:
+            known = self.is_known(item_type, rarity)
+            return {"name": name, "read_name": name, "confidence": 0.0 if known else None, "record": None,
+                    "review": known}
+        scored = [(self.get_confidence(distance, read_name, record, rarity), record) for distance, record in candidates]
+        if exact is not None and item_type is not None and exact["category"] != item_type:
+            # exact name of item of another category, item type was misread or the name is wrong
+            scored = [(confidence - self.rarity_conflict_penalty, record) for confidence, record in scored]
+        confidence, record = max(scored, key=lambda item: item[0])
+        if record["name"] != name:
+            logger.debug("Corrected {} to {} (confidence {:.2f})".format(name, record["name"], confidence))
+        return {"name": record["name"], "read_name": name, "confidence": confidence, "record": record,
+                "review": confidence < self.review_threshold}
+
+
+name_corrector = None
+name_corrector_lock = threading.Lock()
+
+
+def get_name_corrector():
+    # corrector built from shared catalog, built on first use
+    global name_corrector
+    with name_corrector_lock:
+        if name_corrector is None:
+            name_corrector = NameCorrector()
+        return name_corrector
@@ -0,0 +1,161 @@
+import numpy as np
+import logging
+import os
+from lazy_import import LazyModule
+
+cv2 = LazyModule("cv2")
+pytesseract = LazyModule("pytesseract")
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class OcrBackend:
+    # Reads text of cells cropped from wish history. Backends get the whole batch of cells at once, so they can
+    # process them together (CrnnBackend runs one forward pass for all cells of a page).
+    name = ""
+
+    def recognize(self, images, single_line=False, whitelist=None):
+        """
+        :param images: list of grayscale images of cells
+        :param single_line: every image is a single line of text
+        :param whitelist: string of allowed characters, None allows all of them
+        :return: list of (text, confidence 0-100 of the least confident word, 0 if nothing was read)
+        """
+        raise Exception("recognize isn't implemented in {}!".format(type(self).__name__))
+
+
+class TesseractBackend(OcrBackend):
+    # Tesseract run by pytesseract (one tesseract process per cell)
+    name = "tesseract"
+    config = "-c page_separator=''"
+
+    def recognize(self, images, single_line=False, whitelist=None):
+        config = self.config
+        if single_line:
+            config = config + " --psm 7"
+        if whitelist:
+            config = config + " -c tessedit_char_whitelist={}".format(whitelist)
+        return [self.recognize_image(img, config) for img in images]
+
+    def recognize_image(self, img, config):
+        data = pytesseract.image_to_data(img, config=config, output_type=pytesseract.Output.DICT)
+        lines = {}
+        confidences = []
+        for i, word in enumerate(data["text"]):
+            if float(data["conf"][i]) < 0 or not word.strip():
+                continue
+            lines.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(word.strip())
+            confidences.append(float(data["conf"][i]))
+        text = " ".join(" ".join(words) for words in lines.values())
+        return text, min(confidences) if confidences else 0.0
+
+
+class CrnnBackend(OcrBackend):
+    # Text recognition by CRNN network (ONNX) run by OpenCV DNN module on CPU, e.g. crnn_cs.onnx with alphabet_94.txt
+    # from OpenCV text recognition samples. Cells are cropped to their text, resized to input_size and all of them
+    # go through the network as one batch. Output of network (time steps x batch x alphabet + blank) is decoded
+    # by greedy CTC decoding. Alphabet has no space, so cells are split to words by gaps in text and every word
+    # is read separately, words of cell are joined by space again.
+    name = "crnn"
+    model_path = "models/crnn_cs.onnx"
+    alphabet_path = "models/alphabet_94.txt"
+    input_size = (100, 32)  # width, height
+    input_channels = 3
+    text_margin = 4  # pixels kept around text, when cell is cropped
+    word_gap = 0.3  # empty columns wider than this part of text height separate words
+
+    def __init__(self, model_path=None, alphabet_path=None):
+        if model_path is not None:
+            self.model_path = model_path
+        if alphabet_path is not None:
+            self.alphabet_path = alphabet_path
+        for path in [self.model_path, self.alphabet_path]:
+            if not os.path.isfile(path):
+                raise Exception("CRNN backend needs {} (see OpenCV text recognition samples)!".format(path))
+        with open(self.alphabet_path, encoding="utf-8") as file:
+            self.alphabet = [line.rstrip("\n") for line in file if line.rstrip("\n")]
+        self.net = cv2.dnn.readNetFromONNX(self.model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def crop_to_text(self, img):
+        # text is darker than background of cell, cell borders are thrown away by margin of cell
+        ret, text_mask = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        text_mask[:self.text_margin, :] = 0
+        text_mask[-self.text_margin:, :] = 0
+        text_mask[:, :self.text_margin] = 0
+        text_mask[:, -self.text_margin:] = 0
+        rows = np.flatnonzero(text_mask.any(axis=1))
+        columns = np.flatnonzero(text_mask.any(axis=0))
+        if not len(rows):
+            return img
+        return img[max(rows[0] - self.text_margin, 0):rows[-1] + self.text_margin + 1,
+                   max(columns[0] - self.text_margin, 0):columns[-1] + self.text_margin + 1]
+
+    def split_words(self, crop):
+        # returns crops of words of text, every one with full height of text
+        ret, text_mask = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        text_columns = np.flatnonzero(text_mask.any(axis=0))
+        text_rows = np.flatnonzero(text_mask.any(axis=1))
+        if len(text_columns) < 2:
+            return [crop]
+        min_gap = max(int((text_rows[-1] - text_rows[0] + 1) * self.word_gap), 2)
+        gaps = np.flatnonzero(np.diff(text_columns) > min_gap)
+        cuts = [0] + [(text_columns[gap] + text_columns[gap + 1]) // 2 for gap in gaps] + [crop.shape[1]]
+        return [crop[:, start:end] for start, end in zip(cuts[:-1], cuts[1:])]
+
+    def recognize(self, images, single_line=False, whitelist=None):
+        if not images:
+            return []
+        crops = []
+        owners = []  # index of image of every word
+        for i, img in enumerate(images):
+            words = self.split_words(self.crop_to_text(img))
+            crops.extend(words)
+            owners.extend([i] * len(words))
+        words = self.recognize_words(crops, whitelist)
+        texts = [[] for i in range(len(images))]
+        confidences = [[] for i in range(len(images))]
+        for owner, (text, confidence) in zip(owners, words):
+            if text:
+                texts[owner].append(text)
+                confidences[owner].append(confidence)
+        return [(" ".join(texts[i]), min(confidences[i]) if confidences[i] else 0.0) for i in range(len(images))]
+
+    def recognize_words(self, crops, whitelist=None):
+        # reads all crops in one forward pass, returns list of (text, confidence)
+        if self.input_channels == 3:
+            crops = [cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR) for crop in crops]
+        blob = cv2.dnn.blobFromImages(crops, scalefactor=1 / 127.5, size=self.input_size, mean=127.5)
+        self.net.setInput(blob)
+        output = self.net.forward()  # time steps x batch x classes, class 0 is CTC blank
+        output = output.reshape(output.shape[0], len(crops), -1)
+        probabilities = np.exp(output - output.max(axis=2, keepdims=True))
+        probabilities = probabilities / probabilities.sum(axis=2, keepdims=True)
+        if whitelist:
+            allowed = np.array([True] + [char in whitelist for char in self.alphabet])
+            probabilities = probabilities * allowed
+        best = probabilities.argmax(axis=2)
+        best_probabilities = probabilities.max(axis=2)
+        results = []
+        for i in range(len(crops)):
+            chars = []
+            confidences = []
+            previous = 0
+            for step, index in enumerate(best[:, i]):
+                if index != 0 and index != previous:
+                    chars.append(self.alphabet[index - 1])
+                    confidences.append(best_probabilities[step, i])
+                previous = index
+            text = "".join(chars).strip()
+            results.append((text, float(min(confidences)) * 100 if text else 0.0))
+        return results
+
+
+backends = {"tesseract": TesseractBackend, "crnn": CrnnBackend}
+
+
+def create_backend(name):
+    if name not in backends:
+        raise Exception("Unknown OCR backend {}!".format(name))
+    return backends[name]()
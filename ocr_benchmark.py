@@ -0,0 +1,92 @@
+from argparse import ArgumentParser
+import json
+import logging
+import os
+import time
+import numpy as np
+from importer import WishImporter
+from ocr_backends import backends, create_backend
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+def benchmark_backend(backend, img_paths, ground_truth=None):
+    """Imports every image with given backend (without database) and measures it.
+    :param backend: OcrBackend
+    :param img_paths: list of screenshots of wish history
+    :param ground_truth: dict file name -> list of expected wishes [itemType, itemName, timeReceived, itemRarity]
+                         in order returned by get_wishes_from_imagev2 (oldest first), None skips accuracy
+    :return: dict with latencies of images (seconds), cells, throughput (cells per second), field_accuracy
+             (share of correct names, times and rarities) and wish_accuracy (share of completely correct wishes)
+    """
+    importer = WishImporter(None, backend)
+    # the first image only warms up OCR engine and isn't measured
+    importer.get_wishes_from_imagev2(img_paths[0])
+    importer.ocr_stats["cells"] = 0
+    latencies = []
+    correct_fields = 0
+    correct_wishes = 0
+    expected_wishes = 0
+    for img_path in img_paths:
+        start = time.perf_counter()
+        try:
+            wishes = importer.get_wishes_from_imagev2(img_path)
+        except Exception as e:
+            logger.warning("{} failed on {}. {}".format(backend.name, img_path, e))
+            wishes = []
+        latencies.append(time.perf_counter() - start)
+        expected = (ground_truth or {}).get(os.path.basename(img_path))
+        if expected is None:
+            continue
+        expected_wishes = expected_wishes + len(expected)
+        for wish, expected_wish in zip(wishes, expected):
+            matches = [wish[i] == expected_wish[i] for i in (1, 2, 3)]
+            correct_fields = correct_fields + sum(matches)
+            correct_wishes = correct_wishes + (all(matches) and wish[0] == expected_wish[0])
+    latencies = np.array(latencies)
+    return {"latencies": latencies,
+            "cells": importer.ocr_stats["cells"],
+            "throughput": importer.ocr_stats["cells"] / latencies.sum() if latencies.sum() else 0.0,
+            "field_accuracy": correct_fields / (3 * expected_wishes) if expected_wishes else None,
+            "wish_accuracy": correct_wishes / expected_wishes if expected_wishes else None,
+            "report": importer.get_import_report()}
+
+
+def format_accuracy(accuracy):
+    return "-" if accuracy is None else "{:.1%}".format(accuracy)
+
+
+def main():
+    parser = ArgumentParser(description="Compare OCR backends on the same screenshots of wish history")
+    parser.add_argument("directory", help="directory with screenshots (.jpg/.png)")
+    parser.add_argument("-g", "--ground-truth", help="json file: image file name -> list of expected wishes")
+    parser.add_argument("-b", "--backends", nargs="+", default=list(backends), choices=list(backends))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    img_paths = sorted(os.path.join(args.directory, file) for file in os.listdir(args.directory)
+                       if file.lower().endswith((".jpg", ".png")))
+    if not img_paths:
+        raise Exception("There are no images in {}!".format(args.directory))
+    ground_truth = None
+    if args.ground_truth:
+        with open(args.ground_truth, encoding="utf-8") as file:
+            ground_truth = json.load(file)
+
+    print("{:<10} {:>12} {:>12} {:>14} {:>10} {:>10}".format("backend", "mean [ms]", "p95 [ms]", "cells/s",
+                                                             "fields", "wishes"))
+    for name in args.backends:
+        try:
+            backend = create_backend(name)
+            result = benchmark_backend(backend, img_paths, ground_truth)
+        except Exception as e:
+            print("{:<10} not available: {}".format(name, e))
+            continue
+        print("{:<10} {:>12.1f} {:>12.1f} {:>14.1f} {:>10} {:>10}".format(
+            name, result["latencies"].mean() * 1000, np.percentile(result["latencies"], 95) * 1000,
+            result["throughput"], format_accuracy(result["field_accuracy"]), format_accuracy(result["wish_accuracy"])))
+        print("{:<10} {}".format("", result["report"]))
+
+
+if __name__ == "__main__":
+    main()
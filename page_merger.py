@@ -0,0 +1,347 @@
+import bisect
+import logging
+
+logger = logging.getLogger('GenshinWishViewer')
+
+# Where wishes of multi-wish (wishes with the same time) came from. Pages of one import don't overlap each other, so
+# page can overlap only wishes, which were in database before import. Page, which goes on after (before) multi-wish,
+# contains its end (start).
+OLD = "old"  # wish was in database before import
+START = "start"  # the first wishes of multi-wish, page goes on before them
+END = "end"  # the last wishes of multi-wish, page goes on after them
+MIDDLE = "middle"  # part of multi-wish, the whole page has the same time
+WHOLE = "whole"  # the whole multi-wish was inside page
+# START and END wishes of earlier import - they can be overlapped like OLD wishes, but multi-wish still can't go on
+# before (after) them
+OLD_START = "old start"
+OLD_END = "old end"
+OLD_LABELS = (OLD, OLD_START, OLD_END)
+
+
+def get_old_label(label):
+    # label of wish of earlier import
+    if label in (START, OLD_START):
+        return OLD_START
+    if label in (END, OLD_END):
+        return OLD_END
+    return OLD
+
+
+def align_group(window, labels, page, anchor, max_group_size=10):
+    """Aligns wishes of page and history received at the same time (multi-wish). Page is contiguous part of the group,
+    so its wishes are inserted at one place of window and they can overlap OLD wishes on both sides of that place.
+    START wishes have to stay at the start of group, END wishes at its end (OLD_START and OLD_END too), and group can't
+    be bigger than max_group_size. Placement, which makes the whole multi-wish, is preferred - otherwise the same 3-star
+    weapon at the end of window and at the start of page would be thrown away as already known. Page rather overlaps
+    the whole part of multi-wish from earlier import (OLD_START or OLD_END wishes) or nothing of it. Then the biggest
+    overlap and the latest place are used.
+    :param window: keys of history wishes of group, in order in which they were made
+    :param labels: label (OLD, OLD_START, OLD_END, START, END, MIDDLE, WHOLE) of every window wish
+    :param page: keys of page wishes of group
+    :param anchor: START, END or MIDDLE - which part of group page contains
+    :param max_group_size: wishes made at once
+    :return: (merged order - list of ("window", index) or ("page", index), matched window index for every page wish,
+              conflicts), if page can't be placed, all window wishes are conflicts and only page wishes, which aren't
+              in window, are new
+    """
+    starts = [i for i, label in enumerate(labels) if label in (START, OLD_START)]
+    ends = [i for i, label in enumerate(labels) if label in (END, OLD_END)]
+    old_parts = [[i for i, label in enumerate(labels) if label == old_label] for old_label in (OLD_START, OLD_END)]
+    best = None
+    # page = window[first:insert] + new wishes + window[insert:last], overlapped window wishes have to be old and new
+    # wishes have to be after all START and before all END wishes
+    for first in range(len(window) + 1):
+        if anchor == START and first != 0:
+            continue
+        for insert in range(first, min(first + len(page), len(window)) + 1):
+            if insert > first and (labels[insert - 1] not in OLD_LABELS or
+                                   window[insert - 1] != page[insert - 1 - first]):
+                break
+            if (starts and starts[-1] >= insert) or (ends and ends[0] < insert):
+                continue
+            for last in range(insert, min(first + len(page), len(window)) + 1):
+                if last > insert and labels[last - 1] not in OLD_LABELS:
+                    break
+                if window[insert:last] != page[len(page) - (last - insert):]:
+                    continue
+                if anchor == END and last != len(window):
+                    continue
+                size = len(window) + len(page) - (last - first)
+                if size > max_group_size:
+                    continue
+                # page, which reaches both the start and the end of group, leaves no place for missing wishes
+                overlapped = labels[first:last]
+                if size not in (1, max_group_size) and \
+                        (anchor == START or any(label in (START, OLD_START) for label in overlapped)) and \
+                        (anchor == END or any(label in (END, OLD_END) for label in overlapped)):
+                    continue
+                split_parts = sum(1 for part in old_parts if 0 < sum(first <= i < last for i in part) < len(part))
+                score = (size == max_group_size, -split_parts, last - first, insert)
+                if best is None or score > best[0]:
+                    best = (score, first, insert, last)
+    if best is None:
+        unmatched = list(range(len(window)))
+        matched = [None] * len(page)
+        for k, key in enumerate(page):
+            i = next((i for i in unmatched if window[i] == key), None)
+            if i is not None:
+                unmatched.remove(i)
+                matched[k] = i
+        merged = [("window", i) for i in range(len(window))] + \
+                 [("page", k) for k in range(len(page)) if matched[k] is None]
+        return merged, matched, list(range(len(window)))
+    score, first, insert, last = best
+    matched = [None] * len(page)
+    for i in range(first, insert):
+        matched[i - first] = i
+    for i in range(insert, last):
+        matched[len(page) - (last - i)] = i
+    merged = [("window", i) for i in range(first)] + [("page", k) for k in range(len(page))] + \
+             [("window", i) for i in range(last, len(window))]
+    return merged, matched, []
+
+
+def align_page(window, labels, page, max_group_size=10, oldest=False):
+    """Aligns page with wishes, which are already in history in the same time span, like diff of two sequences.
+    Page is contiguous part of history, so every wish of window received after the first and before the last wish
+    of page has to be in page. Wishes received at the time of the first (last) wish of page can belong to multi-wish
+    split between pages, they are aligned by align_group.
+    Both sequences are walked once. When wishes differ, page is searched forward only within wishes received at the same
+    time, so alignment is O(len(page) + len(window)). Page, which is already whole in window (screenshot imported
+    by earlier import), is only matched.
+    :param window: keys (itemName, timeReceived, itemRarity) of history wishes received between time of the first and
+                   the last wish of page, in order in which they were made
+    :param labels: label (OLD, OLD_START, OLD_END, START, END, MIDDLE, WHOLE) of every window wish
+    :param page: keys of wishes of page, in order in which they were made
+    :param max_group_size: wishes made at once (multi-wish)
+    :param oldest: page is the oldest page of history, so it starts with the first wish
+    :return: dict with merged (order of the whole time span - list of ("window", index) or ("page", index)), matched
+             (index of matching window wish for every page wish, None for new wishes), labels (label of every page
+             wish) and conflicts (indexes of window wishes, which should be in page, but aren't)
+    """
+    for i in range(len(window) - len(page) + 1):
+        if window[i:i + len(page)] == page and all(label in OLD_LABELS for label in labels[i:i + len(page)]):
+            return {"merged": [("window", j) for j in range(len(window))], "matched": list(range(i, i + len(page))),
+                    "labels": labels[i:i + len(page)], "conflicts": []}
+    first_time, last_time = page[0][1], page[-1][1]
+    window_head = [i for i, key in enumerate(window) if key[1] == first_time]
+    page_head = [k for k, key in enumerate(page) if key[1] == first_time]
+    if first_time == last_time:
+        groups = [(window_head, page_head, START if oldest else MIDDLE)]
+    else:
+        window_tail = [i for i, key in enumerate(window) if key[1] == last_time]
+        page_tail = [k for k, key in enumerate(page) if key[1] == last_time]
+        groups = [(window_head, page_head, END),
+                  (list(range(len(window_head), len(window) - len(window_tail))),
+                   list(range(len(page_head), len(page) - len(page_tail))), WHOLE),
+                  (window_tail, page_tail, START)]
+        if oldest:
+            # the first multi-wish is whole in page
+            groups = [(list(range(len(window) - len(window_tail))), list(range(len(page) - len(page_tail))), WHOLE),
+                      groups[2]]
+
+    merged = []
+    matched = [None] * len(page)
+    page_labels = [None] * len(page)
+    conflicts = []
+    for window_indexes, page_indexes, anchor in groups:
+        for k in page_indexes:
+            page_labels[k] = anchor
+        if anchor != WHOLE:
+            group_merged, group_matched, group_conflicts = align_group(
+                [window[i] for i in window_indexes], [labels[i] for i in window_indexes],
+                [page[k] for k in page_indexes], anchor, max_group_size)
+            merged.extend((source, (window_indexes if source == "window" else page_indexes)[index])
+                          for source, index in group_merged)
+            for k, i in zip(page_indexes, group_matched):
+                matched[k] = None if i is None else window_indexes[i]
+            conflicts.extend(window_indexes[i] for i in group_conflicts)
+            continue
+        # page contains the whole multi-wishes between its first and last time
+        position = page_indexes[0] if page_indexes else len(page)
+        page_end = position + len(page_indexes)
+        for i in window_indexes:
+            key = window[i]
+            # wishes of page received before this wish can't match it or any later wish of window, they are new
+            while position < page_end and page[position][1] < key[1]:
+                merged.append(("page", position))
+                position = position + 1
+            k = position
+            while k < page_end and page[k][1] == key[1] and page[k] != key:
+                k = k + 1
+            if k < page_end and page[k] == key:
+                merged.extend(("page", new) for new in range(position, k + 1))
+                matched[k] = i
+                position = k + 1
+            else:
+                merged.append(("window", i))
+                conflicts.append(i)
+        merged.extend(("page", new) for new in range(position, page_end))
+    return {"merged": merged, "matched": matched, "labels": page_labels, "conflicts": conflicts}
+
+
+class PageMerger:
+    # Merges pages of wish history read from screenshots into banner table of WishDatabase. Pages can come in any order
+    # and overlap wishes imported before. Every page is aligned (see align_page) with wishes already in database in its
+    # time span (found by TimeIndex), so only its new wishes are inserted, at the right place.
+    # Multi-wishes have the same time for all 10 wishes, their order is given by id. If new wishes have to go before
+    # wishes already in database with the same time, the whole group is written again. Labels of wishes of multi-wishes
+    # touched by import are kept in memory, so parts of multi-wish from different pages are put together in the right
+    # order. Labels of multi-wishes, which are still incomplete, are stored in database too, so the next import can
+    # complete them (START and END wishes of earlier imports become OLD_START and OLD_END).
+    # Merger keeps segments - time spans of history known to be contiguous (history which was in database before
+    # is one segment). Between segments there can be missing pages, gap is certain, if 4-star guarantee isn't kept
+    # across it. Multi-wish with less than 10 wishes is missing a part too.
+    max_wishes_without_four_star = 9  # 4-star or better is guaranteed at least every 10 wishes
+    max_group_size = 10  # wishes of multi-wish
+    page_size = 6  # wishes on one page of wish history, only the oldest page can have less of them
+
+    def __init__(self, db, table_name, commit=True):
+        """
+        :param db: WishDatabase
+        :param table_name: one of wish_table_names
+        :param commit: commit every page, False leaves it to caller, so the whole import is committed at once
+        """
+        self.db = db
+        self.table_name = table_name
+        self.commit = commit
+        first, last = db.get_time_range(table_name)
+        self.segments = [[first, last]] if first is not None else []  # sorted [start time, end time]
+        self.segment_starts = [first] if first is not None else []
+        self.max_time = last
+        self.labels = {}  # time -> labels of wishes with that time in database, in order of ids
+        self.page_keys = set()  # pages already merged, the same screenshot can be imported twice
+        self.needs_reload = False  # wishes were inserted into history, not only appended after the newest one
+        self.stats = {"pages": 0, "inserted": 0, "duplicates": 0, "conflicts": 0, "rewritten_groups": 0,
+                      "skipped": 0}
+
+    def merge_page(self, page):
+        """Inserts new wishes of page to database.
+        :param page: list of wishes [itemType, itemName, timeReceived, itemRarity], oldest first
+        :return: list of inserted wishes, oldest first
+        """
+        if not page:
+            return []
+        self.stats["pages"] = self.stats["pages"] + 1
+        if any(older[2] > newer[2] for older, newer in zip(page, page[1:])):
+            logger.warning("Times of wishes in page aren't in order, page was probably misread and it's skipped: {}"
+                           .format(page))
+            self.stats["skipped"] = self.stats["skipped"] + 1
+            return []
+        keys = tuple((wish[1], wish[2], wish[3]) for wish in page)
+        if keys in self.page_keys:
+            self.stats["duplicates"] = self.stats["duplicates"] + len(page)
+            return []
+        self.page_keys.add(keys)
+
+        start, end = page[0][2], page[-1][2]
+        window = self.db.get_wishes_in_time_range(self.table_name, start, end)
+        stored_labels = self.db.get_multi_wish_labels(self.table_name, start, end)
+        window_labels = []
+        for row in window:
+            if row[3] != (window[len(window_labels) - 1][3] if window_labels else None):
+                if row[3] in self.labels:
+                    group_labels = iter(self.labels[row[3]])
+                else:
+                    group_labels = iter([get_old_label(label) for label in stored_labels.get(row[3], [])])
+            window_labels.append(next(group_labels, OLD))
+        alignment = align_page([(row[2], row[3], row[4]) for row in window], window_labels, list(keys),
+                               self.max_group_size, len(page) < self.page_size)
+        if alignment["conflicts"]:
+            logger.warning("{} wishes of {} between {} and {} don't fit imported page: {}".format(
+                len(alignment["conflicts"]), self.table_name, start, end,
+                [window[i][2] for i in alignment["conflicts"]]))
+        self.stats["conflicts"] = self.stats["conflicts"] + len(alignment["conflicts"])
+        new_indexes = [k for k, i in enumerate(alignment["matched"]) if i is None]
+        self.stats["duplicates"] = self.stats["duplicates"] + len(page) - len(new_indexes)
+
+        # group has to be written again, if new wish is before wish already in database with the same time
+        merged = alignment["merged"]
+        conflict_times = set(window[i][3] for i in alignment["conflicts"])
+        replaced_times = set()
+        seen_new = set()
+        for source, index in merged:
+            time_received = page[index][2] if source == "page" else window[index][3]
+            if source == "page" and alignment["matched"][index] is None:
+                seen_new.add(time_received)
+            elif time_received in seen_new and time_received not in conflict_times:
+                replaced_times.add(time_received)
+        rows = []
+        labels = {}
+        for source, index in merged:
+            if source == "page":
+                time_received = page[index][2]
+                matched = alignment["matched"][index]
+                if matched is None or time_received in replaced_times:
+                    rows.append(page[index][:4])
+                label = alignment["labels"][index] if matched is None else window_labels[matched]
+            else:
+                time_received = window[index][3]
+                if time_received in replaced_times:
+                    rows.append(list(window[index][1:5]))
+                label = window_labels[index]
+            labels.setdefault(time_received, []).append(label)
+        for time_received in conflict_times:
+            # group isn't written again, new wishes are after wishes in database
+            labels[time_received] = [window_labels[i] for i, row in enumerate(window) if row[3] == time_received] + \
+                                    [alignment["labels"][k] for k in new_indexes if page[k][2] == time_received]
+        # only multi-wishes can be split between pages, labels of the others aren't needed
+        labels = {time_received: group_labels for time_received, group_labels in labels.items()
+                  if len(group_labels) > 1 or time_received in (start, end)}
+        self.labels.update(labels)
+        if new_indexes:
+            # labels of complete multi-wishes and of wishes, which are all old, don't have to be stored
+            self.db.set_multi_wish_labels(self.table_name, {
+                time_received: group_labels if len(group_labels) < self.max_group_size and
+                any(label != OLD for label in group_labels) else None
+                for time_received, group_labels in labels.items()})
+            self.db.merge_wishes(self.table_name, rows, sorted(replaced_times), self.commit)
+        self.update_segments(start, end)
+        if not new_indexes:
+            return []
+
+        new_wishes = [page[k] for k in new_indexes]
+        self.stats["inserted"] = self.stats["inserted"] + len(new_wishes)
+        self.stats["rewritten_groups"] = self.stats["rewritten_groups"] + len(replaced_times)
+        if replaced_times or (self.max_time is not None and new_wishes[0][2] < self.max_time):
+            self.needs_reload = True
+        self.max_time = max(self.max_time or end, end)
+        return new_wishes
+
+    def update_segments(self, start, end):
+        # joins page with all segments overlapping its time span (sharing time of multi-wish counts as overlap)
+        i = bisect.bisect_right(self.segment_starts, end)
+        first = i
+        while first > 0 and self.segments[first - 1][1] >= start:
+            first = first - 1
+        if first < i:
+            start = min(start, self.segments[first][0])
+            end = max(end, self.segments[i - 1][1])
+        self.segments[first:i] = [[start, end]]
+        self.segment_starts[first:i] = [start]
+
+    def get_gaps(self):
+        """Finds places, where history is certainly missing wishes - multi-wishes touched by import, which have less
+        than 10 wishes, and boundaries of segments, where 4-star guarantee isn't kept.
+        :return: list of dicts with after (time of the last wish before gap), before (time of the first wish after gap)
+                 and reason
+        """
+        gaps = []
+        for time_received, labels in self.labels.items():
+            if 1 < len(labels) < self.max_group_size:
+                gaps.append({"after": time_received, "before": time_received, "reason": "incomplete multi-wish"})
+        for older, newer in zip(self.segments, self.segments[1:]):
+            three_stars = 0
+            for before in [True, False]:
+                rarities = self.db.get_neighbour_rarities(self.table_name, older[1] if before else newer[0], before,
+                                                          self.max_wishes_without_four_star + 1)
+                three_stars = three_stars + next((n for n, rarity in enumerate(rarities) if rarity != 3),
+                                                 len(rarities))
+            if three_stars > self.max_wishes_without_four_star:
+                gaps.append({"after": older[1], "before": newer[0], "reason": "4-star guarantee"})
+        return sorted(gaps, key=lambda gap: gap["after"])
+
+    def get_report(self):
+        return "{} new wishes, {} already known, {} conflicts, {} skipped pages, {} gaps in history".format(
+            self.stats["inserted"], self.stats["duplicates"], self.stats["conflicts"], self.stats["skipped"],
+            len(self.get_gaps()))
@@ -0,0 +1,62 @@
+import logging
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class PityTracker:
+    # Keeps running pity counters of one banner and positions of every 5-star and 4-star wish.
+    # Adding k wishes costs O(k), current pity is O(1) and pity at every hit is O(hits),
+    # so nothing has to be recalculated from the whole history, when UI is refreshed.
+    tracked_rarities = [5, 4]
+    # On weapon banner 5-star also fulfils guarantee of 4-star (or better) item, so it resets 4-star pity too
+    four_star_reset_banners = ["wishWeapon"]
+
+    def __init__(self, four_star_resets_on_five_star=False):
+        self.four_star_resets_on_five_star = four_star_resets_on_five_star
+        self.wish_count = 0
+        self.pity = {}
+        self.hit_positions = {}
+        self.hit_pities = {}
+        self.reset()
+
+    @classmethod
+    def for_banner(cls, banner_type):
+        return cls(banner_type in cls.four_star_reset_banners)
+
+    def reset(self):
+        self.wish_count = 0
+        for rarity in self.tracked_rarities:
+            self.pity[rarity] = 0
+            self.hit_positions[rarity] = []
+            self.hit_pities[rarity] = []
+
+    def add_wish(self, rarity):
+        for tracked_rarity in self.tracked_rarities:
+            self.pity[tracked_rarity] = self.pity[tracked_rarity] + 1
+        if rarity in self.pity:
+            self.hit_positions[rarity].append(self.wish_count)
+            self.hit_pities[rarity].append(self.pity[rarity])
+            self.pity[rarity] = 0
+            if rarity == 5 and self.four_star_resets_on_five_star:
+                self.pity[4] = 0
+        self.wish_count = self.wish_count + 1
+
+    def add_wishes(self, rarities):
+        """Updates counters with new wishes.
+        :param rarities: rarities of new wishes, ordered from oldest to newest
+        :return:
+        """
+        for rarity in rarities:
+            self.add_wish(int(rarity))
+
+    def get_pity(self, rarity):
+        # number of wishes made since last wish with given rarity
+        return self.pity[rarity]
+
+    def get_pity_at_hits(self, rarity):
+        # pity at which every item with given rarity was received (counting the wish, that gave the item)
+        return self.hit_pities[rarity]
+
+    def get_hit_positions(self, rarity):
+        # indexes of wishes with given rarity in banner history, from oldest to newest
+        return self.hit_positions[rarity]
@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import sqlite3
+import numpy as np
+from database import WishDatabase
+from pity_tracker import PityTracker
+from pull_model import banner_models
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class ProfileRegistry:
+    # Registry of accounts. Every account (UID) has its own WishDatabase file in profiles_directory, registry itself
+    # is small json file with names and paths of databases and the active profile.
+    # Database from before profiles existed (db.db) is registered as "default" profile.
+    registry_path = "profiles.json"
+    profiles_directory = "profiles"
+    default_profile = "default"
+    legacy_db_path = "db.db"
+
+    def __init__(self, registry_path=None):
+        if registry_path is not None:
+            self.registry_path = registry_path
+            self.profiles_directory = os.path.join(os.path.dirname(registry_path), "profiles")
+        self.active = self.default_profile
+        self.profiles = {}  # uid -> {"name": ..., "path": ...}
+        if os.path.isfile(self.registry_path):
+            with open(self.registry_path, encoding="utf-8") as file:
+                registry = json.load(file)
+            self.active = registry["active"]
+            self.profiles = registry["profiles"]
+        if not self.profiles:
+            self.profiles[self.default_profile] = {"name": "Default", "path": self.legacy_db_path}
+
+    def save(self):
+        temporary_path = self.registry_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"active": self.active, "profiles": self.profiles}, file, indent=2)
+        os.replace(temporary_path, self.registry_path)
+
+    def add_profile(self, uid, name=None):
+        """Registers account with its own database file.
+        :param uid: UID of account, only digits - it's used in file name of database
+        :param name: name shown in UI, UID if not given
+        :return: path of database of the profile
+        """
+        uid = str(uid)
+        if not uid.isdigit():
+            raise Exception("UID {} is not valid, it can contain only digits!".format(uid))
+        if uid in self.profiles:
+            raise Exception("Profile {} already exists!".format(uid))
+        path = os.path.join(self.profiles_directory, "{}.db".format(uid))
+        os.makedirs(self.profiles_directory, exist_ok=True)
+        self.profiles[uid] = {"name": name or uid, "path": path}
+        self.save()
+        logger.info("Added profile {} ({})".format(uid, path))
+        return path
+
+    def remove_profile(self, uid):
+        # database file is kept, only the registry entry is removed
+        uid = str(uid)
+        if uid == self.active:
+            raise Exception("Can't remove active profile!")
+        del self.profiles[uid]
+        self.save()
+
+    def set_active(self, uid):
+        # registry is written only when active profile really changes, not on every start
+        uid = str(uid)
+        if uid not in self.profiles:
+            raise Exception("Unknown profile {}!".format(uid))
+        if uid == self.active:
+            return
+        self.active = uid
+        self.save()
+
+    def get_uids(self):
+        return list(self.profiles)
+
+    def get_db_path(self, uid=None):
+        return self.profiles[str(uid) if uid is not None else self.active]["path"]
+
+
+class CrossAccountQuery:
+    # Aggregate queries over all accounts. Databases of profiles are ATTACHed to in-memory connection and wish tables
+    # are joined by UNION ALL views with uid column, so SQLite does all the work and no account is loaded to Python.
+    # SQLite can attach only limited number of databases at once (10 by default), so profiles are processed
+    # in batches and partial results (counts and pity histograms) are merged.
+    max_attached = 10
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def get_batches(self):
+        profiles = [(uid, profile["path"]) for uid, profile in self.registry.profiles.items()
+                    if os.path.isfile(profile["path"])]
+        return [profiles[i:i + self.max_attached] for i in range(0, len(profiles), self.max_attached)]
+
+    def open_batch(self, batch):
+        connection = sqlite3.connect(":memory:")
+        for number, (uid, path) in enumerate(batch):
+            connection.execute("ATTACH DATABASE ? AS shard{};".format(number), (path,))
+        for table_name in WishDatabase.wish_table_names:
+            # views can't have bound parameters, so uid is written as quoted literal
+            selects = ["SELECT '{}' AS uid, id, itemType, itemName, timeReceived, itemRarity FROM shard{}.{}"
+                       .format(uid.replace("'", "''"), number, table_name) for number, (uid, path) in enumerate(batch)]
+            connection.execute("CREATE TEMP VIEW all_{} AS {};".format(table_name, " UNION ALL ".join(selects)))
+        return connection
+
+    def run(self, query, parameters=()):
+        # runs query on every batch, yields rows of all batches
+        for batch in self.get_batches():
+            connection = self.open_batch(batch)
+            try:
+                for row in connection.execute(query, parameters):
+                    yield row
+            finally:
+                connection.close()
+
+    def get_totals(self, table_name):
+        """
+        :param table_name: one of WishDatabase.wish_table_names
+        :return: dict uid -> {"pulls", "five_star", "four_star"} and "all" key with sums of all accounts
+        """
+        query = "SELECT uid, COUNT(1), SUM(itemRarity = 5), SUM(itemRarity = 4) FROM all_{} GROUP BY uid;"\
+            .format(table_name)
+        totals = {}
+        all_totals = {"pulls": 0, "five_star": 0, "four_star": 0}
+        for uid, pulls, five_star, four_star in self.run(query):
+            totals[uid] = {"pulls": pulls, "five_star": five_star or 0, "four_star": four_star or 0}
+            for key in all_totals:
+                all_totals[key] = all_totals[key] + totals[uid][key]
+        totals["all"] = all_totals
+        return totals
+
+    def get_pity_histogram(self, table_name, rarity):
+        # histogram[k] - how many items of given rarity were received at pity k in all accounts
+        if table_name in PityTracker.four_star_reset_banners and rarity == 4:
+            previous_hit = "previousAnyHit"
+        else:
+            previous_hit = "previousHit"
+        query = "WITH numbered AS (SELECT uid, itemRarity, ROW_NUMBER() OVER (PARTITION BY uid ORDER BY" \
+                " timeReceived, id) AS position FROM all_{0}), " \
+                "hits AS (SELECT itemRarity, position," \
+                " LAG(position, 1, 0) OVER (PARTITION BY uid, itemRarity ORDER BY position) AS previousHit," \
+                " LAG(position, 1, 0) OVER (PARTITION BY uid ORDER BY position) AS previousAnyHit" \
+                " FROM numbered WHERE itemRarity >= 4) " \
+                "SELECT position - {1} AS pity, COUNT(1) FROM hits WHERE itemRarity = ? GROUP BY pity;"\
+            .format(table_name, previous_hit)
+        histogram = np.zeros(banner_models[table_name].hard_pity + 1, dtype=np.int64)
+        for pity, count in self.run(query, (rarity,)):
+            if pity >= len(histogram):
+                # pity above hard pity can only come from missing screenshots
+                histogram = np.concatenate((histogram, np.zeros(pity + 1 - len(histogram), dtype=np.int64)))
+            histogram[pity] = histogram[pity] + count
+        return histogram
+
+    def get_pity_statistics(self, table_name, rarity, percentiles=(25, 50, 75, 90)):
+        """Pity percentiles and luck of all accounts together.
+        :return: dict with count, average_pity, percentiles and average_percentile (luck, 0.5 is average,
+                 less is luckier)
+        """
+        histogram = self.get_pity_histogram(table_name, rarity)
+        count = int(histogram.sum())
+        if not count:
+            return {"count": 0, "average_pity": None, "percentiles": None, "average_percentile": None}
+        pities = np.arange(len(histogram))
+        cumulative = np.cumsum(histogram)
+        cdf = banner_models[table_name].get_pity_cdf(rarity)
+        model_percentiles = cdf[np.clip(pities, 1, len(cdf)) - 1]
+        return {"count": count,
+                "average_pity": float(np.sum(histogram * pities) / count),
+                "percentiles": {percentile: int(np.searchsorted(cumulative, percentile / 100 * count))
+                                for percentile in percentiles},
+                "average_percentile": float(np.sum(histogram * model_percentiles) / count)}
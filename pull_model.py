@@ -0,0 +1,63 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger('GenshinWishViewer')
+# Rates are based on data collected by community, as official numbers give only consolidated probability:
+# https://genshin-impact.fandom.com/wiki/Wish/Expanded_Wish_Probabilities
+
+
+class BannerModel:
+    # Soft/hard pity model of one banner. Chance of 5-star is base_rate until soft_pity_start,
+    # then it grows by soft_pity_increase every wish and reaches 100% at hard_pity.
+    # 4-star works the same way, but with its own numbers.
+
+    def __init__(self, name, base_rate, soft_pity_start, soft_pity_increase, hard_pity, rate_up_chance,
+                 four_star_base_rate=0.051, four_star_soft_pity_start=9, four_star_soft_pity_increase=0.51,
+                 four_star_hard_pity=10):
+        self.name = name
+        self.base_rate = base_rate
+        self.soft_pity_start = soft_pity_start
+        self.soft_pity_increase = soft_pity_increase
+        self.hard_pity = hard_pity
+        self.rate_up_chance = rate_up_chance  # None for banners without rate up
+        self.four_star_base_rate = four_star_base_rate
+        self.four_star_soft_pity_start = four_star_soft_pity_start
+        self.four_star_soft_pity_increase = four_star_soft_pity_increase
+        self.four_star_hard_pity = four_star_hard_pity
+        self.five_star_rates = self.compute_rates(base_rate, soft_pity_start, soft_pity_increase, hard_pity)
+        self.four_star_rates = self.compute_rates(four_star_base_rate, four_star_soft_pity_start,
+                                                  four_star_soft_pity_increase, four_star_hard_pity)
+
+    @staticmethod
+    def compute_rates(base_rate, soft_pity_start, soft_pity_increase, hard_pity):
+        # rates[k] is chance of getting the item on wish number k+1, if there wasn't one before
+        pity = np.arange(1, hard_pity + 1)
+        rates = base_rate + soft_pity_increase * np.maximum(0, pity - soft_pity_start + 1)
+        return np.minimum(rates, 1.0)
+
+    def get_rates(self, rarity):
+        return self.five_star_rates if rarity == 5 else self.four_star_rates
+
+    def get_pity_distribution(self, rarity):
+        # distribution[k] is chance, that the item is received exactly on wish number k+1
+        rates = self.get_rates(rarity)
+        not_received_before = np.concatenate(([1.0], np.cumprod(1 - rates)[:-1]))
+        return rates * not_received_before
+
+    def get_pity_cdf(self, rarity):
+        return np.cumsum(self.get_pity_distribution(rarity))
+
+    def get_expected_pity(self, rarity):
+        distribution = self.get_pity_distribution(rarity)
+        return float(np.sum(distribution * np.arange(1, len(distribution) + 1)))
+
+
+character_banner_model = BannerModel("Character Event Wish", 0.006, 74, 0.06, 90, 0.5)
+weapon_banner_model = BannerModel("Weapon Event Wish", 0.007, 63, 0.07, 80, 0.75, four_star_base_rate=0.06,
+                                  four_star_soft_pity_start=8, four_star_soft_pity_increase=0.6)
+standard_banner_model = BannerModel("Permanent Wish", 0.006, 74, 0.06, 90, None)
+
+banner_models = {"wishCharacter": character_banner_model,
+                 "wishWeapon": weapon_banner_model,
+                 "wishStandard": standard_banner_model,
+                 "wishBeginner": standard_banner_model}
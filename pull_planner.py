@@ -0,0 +1,164 @@
+import numpy as np
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pull_model import banner_models
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class PullGoal:
+    # One goal of a plan, e.g. 2 copies of rate up character. Goals of a plan are done one after another.
+    planned_banners = ["wishCharacter", "wishWeapon"]
+
+    def __init__(self, banner_type, copies=1, pity=0, guaranteed=False, fate_points=0, fate_points_needed=2):
+        """
+        :param banner_type: wishCharacter or wishWeapon
+        :param copies: how many copies of rate up 5-star (chosen weapon on weapon banner) we want
+        :param pity: number of wishes since last 5-star on this banner
+        :param guaranteed: next 5-star is guaranteed to be rate up item
+        :param fate_points: fate points of epitomized path (weapon banner only)
+        :param fate_points_needed: with this many fate points, next 5-star is the chosen weapon
+        """
+        if banner_type not in self.planned_banners:
+            raise Exception("Can't plan wishes on {} banner!".format(banner_type))
+        self.banner_type = banner_type
+        self.copies = copies
+        self.pity = pity
+        self.guaranteed = guaranteed
+        self.fate_points = fate_points
+        self.fate_points_needed = fate_points_needed
+
+    @classmethod
+    def from_history(cls, db, banner_type, copies=1, analytics=None):
+        """Creates goal starting from current pity and guarantee stored in database.
+        :param db: WishDatabase
+        :param banner_type: wishCharacter or wishWeapon
+        :param copies: how many copies we want
+        :param analytics: WishAnalytics, used to find out if next 5-star is guaranteed
+        :return: PullGoal
+        """
+        guaranteed = False
+        if analytics is not None:
+            fifty_fifty = analytics.get_banner_statistics(banner_type)["fifty_fifty"]
+            guaranteed = bool(fifty_fifty and fifty_fifty["next_is_guaranteed"])
+        return cls(banner_type, copies, db.get_current_pity(banner_type, 5), guaranteed)
+
+
+class PlanResult:
+    # Distribution of number of wishes needed to complete all goals of a plan
+    quantile_levels = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+    def __init__(self, pulls):
+        self.trials = len(pulls)
+        self.cdf = np.cumsum(np.bincount(pulls)) / self.trials  # cdf[n] - chance to be done within n wishes
+        self.quantiles = dict(zip(self.quantile_levels, np.quantile(pulls, self.quantile_levels).tolist()))
+        self.mean = float(np.mean(pulls))
+
+    def get_probability(self, pulls):
+        # chance, that all goals are done within given number of wishes
+        if pulls < 0:
+            return 0.0
+        return float(self.cdf[min(pulls, len(self.cdf) - 1)])
+
+    def get_pulls_for_probability(self, probability):
+        # number of wishes needed to be done with at least given probability
+        return int(np.searchsorted(self.cdf, probability))
+
+
+def get_conditional_cdfs(rates):
+    # cdfs[p][k] - chance, that next 5-star comes within k+1 wishes, if current pity is p
+    hard_pity = len(rates)
+    cdfs = np.ones((hard_pity, hard_pity))
+    for pity in range(hard_pity):
+        remaining = rates[pity:]
+        not_received_before = np.concatenate(([1.0], np.cumprod(1 - remaining)[:-1]))
+        cdfs[pity, :len(remaining)] = np.cumsum(remaining * not_received_before)
+    cdfs[:, -1] = 1.0
+    return cdfs
+
+
+def simulate_trials(goals, trials, seed):
+    """Simulates plan in many trials at once. Instead of simulating every wish, number of wishes until next 5-star
+    is drawn from soft pity distribution, so every loop iteration handles one 5-star of all trials.
+    :param goals: list of PullGoal
+    :param trials: number of trials
+    :param seed: seed (or SeedSequence) of random generator
+    :return: numpy array with number of wishes used in every trial
+    """
+    generator = np.random.default_rng(seed)
+    total_pulls = np.zeros(trials, dtype=np.int64)
+    used_banners = set()
+    for goal in goals:
+        model = banner_models[goal.banner_type]
+        cdfs = get_conditional_cdfs(model.five_star_rates)
+        # only the first goal on a banner starts from saved state, next ones start right after getting the target
+        if goal.banner_type in used_banners:
+            pity, guaranteed, fate_points = 0, False, 0
+        else:
+            pity, guaranteed, fate_points = goal.pity, goal.guaranteed, goal.fate_points
+        used_banners.add(goal.banner_type)
+        pity = np.full(trials, min(pity, model.hard_pity - 1), dtype=np.int64)
+        guaranteed = np.full(trials, guaranteed, dtype=bool)
+        fate_points = np.full(trials, fate_points, dtype=np.int64)
+        copies = np.zeros(trials, dtype=np.int64)
+
+        active = np.arange(trials)
+        while len(active):
+            # wishes until next 5-star
+            random_values = generator.random(len(active))
+            pulls = np.empty(len(active), dtype=np.int64)
+            for start_pity in np.unique(pity[active]):
+                same_pity = pity[active] == start_pity
+                pulls[same_pity] = np.searchsorted(cdfs[start_pity], random_values[same_pity]) + 1
+            total_pulls[active] = total_pulls[active] + pulls
+            pity[active] = 0
+
+            # which 5-star it was
+            rate_up = guaranteed[active] | (generator.random(len(active)) < model.rate_up_chance)
+            if goal.banner_type == "wishWeapon":
+                # there are two rate up weapons, epitomized path decides, if we get the chosen one
+                chosen = rate_up & (generator.random(len(active)) < 0.5)
+                chosen = chosen | (fate_points[active] >= goal.fate_points_needed)
+                fate_points[active] = np.where(chosen, 0, fate_points[active] + 1)
+            else:
+                chosen = rate_up
+            guaranteed[active] = ~rate_up & ~chosen
+            copies[active] = copies[active] + chosen
+            active = active[copies[active] < goal.copies]
+    return total_pulls
+
+
+class PullPlanner:
+    # Monte Carlo planner answering "how many wishes do I need to get X with probability p".
+    # Trials are split into chunks, which are simulated in process pool on all cores.
+    executor = None
+
+    def __init__(self, trials=1000000, workers=None):
+        self.trials = trials
+        self.workers = workers or os.cpu_count() or 1
+
+    @classmethod
+    def get_executor(cls, workers):
+        # pool is created once and reused, starting processes again would take longer than simulation itself
+        if cls.executor is None:
+            cls.executor = ProcessPoolExecutor(max_workers=workers)
+        return cls.executor
+
+    def plan(self, goals, seed=None):
+        """
+        :param goals: list of PullGoal, which are done one after another
+        :param seed: seed of random generator, None gives different results every time
+        :return: PlanResult
+        """
+        seeds = np.random.SeedSequence(seed).spawn(self.workers)
+        chunk_sizes = [self.trials // self.workers + (1 if i < self.trials % self.workers else 0)
+                       for i in range(self.workers)]
+        if self.workers == 1:
+            pulls = simulate_trials(goals, self.trials, seeds[0])
+        else:
+            executor = self.get_executor(self.workers)
+            futures = [executor.submit(simulate_trials, goals, chunk_size, chunk_seed)
+                       for chunk_size, chunk_seed in zip(chunk_sizes, seeds)]
+            pulls = np.concatenate([future.result() for future in futures])
+        return PlanResult(pulls)
@@ -0,0 +1,39 @@
+import numpy as np
+import logging
+from lazy_import import LazyModule
+
+cv2 = LazyModule("cv2")
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class RarityClassifier:
+    # Finds rarity of item from colour of its name in wish history - 5-star names are gold, 4-star purple and 3-star
+    # dark grey. Pixels of name cell are converted to HSV and strongly saturated pixels (text, not the beige
+    # background) are counted in hue histogram. If there are only a few coloured pixels compared to dark ones,
+    # it's 3-star item.
+    hue_ranges = {5: (10, 35), 4: (125, 165)}  # OpenCV hue is 0-179
+    min_saturation = 90
+    min_value = 80
+    max_dark_value = 130  # grey text of 3-star items
+    min_colour_fraction = 0.2  # of text pixels, which have to be coloured for 4/5-star
+
+    def classify(self, img):
+        """
+        :param img: BGR image of name cell
+        :return: (rarity, confidence 0-1), rarity is None if there is no text in image
+        """
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        hue, saturation, value = hsv[:, :, 0], hsv[:, :, 1], hsv[:, :, 2]
+        coloured = (saturation >= self.min_saturation) & (value >= self.min_value)
+        histogram = np.bincount(hue[coloured].ravel(), minlength=180)
+        counts = {rarity: int(histogram[start:end + 1].sum()) for rarity, (start, end) in self.hue_ranges.items()}
+        coloured_count = sum(counts.values())
+        dark_count = int(np.count_nonzero((value < self.max_dark_value) & ~coloured))
+        if coloured_count + dark_count == 0:
+            return None, 0.0
+        colour_fraction = coloured_count / (coloured_count + dark_count)
+        if colour_fraction < self.min_colour_fraction:
+            return 3, 1 - colour_fraction
+        rarity = max(counts, key=counts.get)
+        return rarity, counts[rarity] / coloured_count
@@ -0,0 +1,50 @@
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class StartupProfiler:
+    # Measures phases of application start-up. Enabled by --profile-startup, otherwise phases cost only
+    # one perf_counter call each.
+    enabled = False
+    start_time = None
+    phases = None
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.phases = []  # (name, start, duration) in seconds since start_time
+
+    def reset(self, start_time=None):
+        self.start_time = start_time if start_time is not None else time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, phase_start, time.perf_counter())
+
+    def add_phase(self, name, phase_start, phase_end):
+        self.phases.append((name, phase_start - self.start_time, phase_end - phase_start))
+
+    def mark(self, name):
+        # zero length phase, e.g. first paint of main window
+        now = time.perf_counter()
+        self.add_phase(name, now, now)
+
+    def get_report(self):
+        lines = ["Start-up profile:", "{:<32} {:>10} {:>10}".format("phase", "start [ms]", "took [ms]")]
+        for name, phase_start, duration in self.phases:
+            lines.append("{:<32} {:>10.1f} {:>10.1f}".format(name, phase_start * 1000, duration * 1000))
+        return "\n".join(lines)
+
+    def report(self):
+        if self.enabled:
+            print(self.get_report())
+
+
+profiler = StartupProfiler()
@@ -0,0 +1,70 @@
+import hashlib
+import importlib.util
+import logging
+import os
+from PyQt5 import uic
+
+logger = logging.getLogger('GenshinWishViewer')
+
+
+class CompiledUiLoader:
+    # Loads .ui file through python module generated by uic.compileUi. Parsing 136 KB of XML by uic.loadUi takes
+    # a big part of start-up, while importing compiled module is fast. Module is generated again, when hash
+    # of .ui file written in its first line doesn't match the file anymore.
+    cache_directory = "ui_cache"
+    hash_prefix = "# source hash: "
+
+    def __init__(self, ui_path, cache_directory=None):
+        self.ui_path = ui_path
+        if cache_directory is not None:
+            self.cache_directory = cache_directory
+        module_name = os.path.splitext(os.path.basename(ui_path))[0] + "_ui"
+        self.module_name = module_name
+        self.module_path = os.path.join(self.cache_directory, module_name + ".py")
+
+    def get_source_hash(self):
+        with open(self.ui_path, "rb") as file:
+            return hashlib.sha1(file.read()).hexdigest()
+
+    def get_cached_hash(self):
+        if not os.path.isfile(self.module_path):
+            return None
+        with open(self.module_path, encoding="utf-8") as file:
+            first_line = file.readline().rstrip("\n")
+        return first_line[len(self.hash_prefix):] if first_line.startswith(self.hash_prefix) else None
+
+    def compile(self, source_hash):
+        logger.info("Compiling {} to {}".format(self.ui_path, self.module_path))
+        os.makedirs(self.cache_directory, exist_ok=True)
+        temporary_path = self.module_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(self.hash_prefix + source_hash + "\n")
+            uic.compileUi(self.ui_path, file)
+        os.replace(temporary_path, self.module_path)
+
+    def load_module(self):
+        source_hash = self.get_source_hash()
+        if self.get_cached_hash() != source_hash:
+            self.compile(source_hash)
+        spec = importlib.util.spec_from_file_location(self.module_name, self.module_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def setup_ui(self, window):
+        """Builds widgets from .ui file into window, the same way as uic.loadUi(ui_path, window) does - every named
+        widget becomes attribute of window. If compiled module can't be used, falls back to uic.loadUi.
+        :param window: QMainWindow (or other widget matching top level widget of .ui file)
+        :return:
+        """
+        try:
+            module = self.load_module()
+        except Exception as e:
+            logger.warning("Couldn't use compiled {}, loading it directly. {}".format(self.ui_path, e))
+            uic.loadUi(self.ui_path, window)
+            return
+        form_class = next(getattr(module, name) for name in dir(module) if name.startswith("Ui_"))
+        form = form_class()
+        form.setupUi(window)
+        for name, value in vars(form).items():
+            setattr(window, name, value)
@@ -0,0 +1,137 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger('GenshinWishViewer')
+invalid_timestamp = np.iinfo(np.int64).min  # the same value as NaT, used when OCR gave us unparsable date
+
+
+def parse_timestamps(times):
+    """Converts dates of wishes ("YYYY-MM-DD HH:MM:SS") to int64 seconds since epoch.
+    :param times: list of date strings
+    :return: numpy array, broken dates are set to invalid_timestamp
+    """
+    try:
+        return np.array(times, dtype='datetime64[s]').astype(np.int64)
+    except ValueError:
+        # at least one date is broken - parse them one by one and mark broken ones
+        timestamps = np.empty(len(times), dtype=np.int64)
+        for i, time in enumerate(times):
+            try:
+                timestamps[i] = np.datetime64(time, 's').astype(np.int64)
+            except ValueError:
+                logger.warning("Couldn't parse date of wish: {}".format(time))
+                timestamps[i] = invalid_timestamp
+        return timestamps
+
+
+class WishStore:
+    # Columnar in-memory store of wishes from one banner. Instead of keeping a tuple of strings per wish,
+    # every column is a numpy array, so single wish takes 11 bytes:
+    # timestamp (int64 seconds since epoch), rarity (uint8) and item id (uint16), which is index to interned
+    # (itemType, itemName) table. Arrays grow by doubling, so appending is amortised O(1).
+    initial_capacity = 64
+    max_item_id = np.iinfo(np.uint16).max
+
+    def __init__(self):
+        self.size = 0
+        self.timestamps = np.empty(self.initial_capacity, dtype=np.int64)
+        self.rarities = np.empty(self.initial_capacity, dtype=np.uint8)
+        self.item_ids = np.empty(self.initial_capacity, dtype=np.uint16)
+        self.items = []  # (itemType, itemName), index is item id
+        self.item_lookup = {}  # (itemType, itemName) -> item id
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.size = 0
+
+    def reserve(self, capacity):
+        if capacity <= len(self.timestamps):
+            return
+        new_capacity = len(self.timestamps)
+        while new_capacity < capacity:
+            new_capacity = new_capacity * 2
+        for column in ["timestamps", "rarities", "item_ids"]:
+            old_array = getattr(self, column)
+            new_array = np.empty(new_capacity, dtype=old_array.dtype)
+            new_array[:self.size] = old_array[:self.size]
+            setattr(self, column, new_array)
+
+    def intern_item(self, item_type, item_name):
+        key = (item_type, item_name)
+        item_id = self.item_lookup.get(key)
+        if item_id is None:
+            item_id = len(self.items)
+            if item_id > self.max_item_id:
+                raise Exception("Too many different items in WishStore! Max is {}".format(self.max_item_id + 1))
+            self.items.append(key)
+            self.item_lookup[key] = item_id
+        return item_id
+
+    def append(self, wish):
+        self.append_many([wish])
+
+    def append_many(self, wishes):
+        """Appends wishes at the end of the store.
+        :param wishes: list of (itemType, itemName, timeReceived, itemRarity), ordered from oldest to newest
+        :return:
+        """
+        if not wishes:
+            return
+        count = len(wishes)
+        self.reserve(self.size + count)
+        new_slice = slice(self.size, self.size + count)
+        self.timestamps[new_slice] = parse_timestamps([wish[2] for wish in wishes])
+        self.rarities[new_slice] = [wish[3] for wish in wishes]
+        self.item_ids[new_slice] = [self.intern_item(wish[0], wish[1]) for wish in wishes]
+        self.size = self.size + count
+
+    def get_wish(self, index):
+        # returns wish in the same format as it's stored in database, mostly for debugging and exporting
+        if index < 0:
+            index = index + self.size
+        if not 0 <= index < self.size:
+            raise IndexError("WishStore index out of range")
+        item_type, item_name = self.items[self.item_ids[index]]
+        if self.timestamps[index] == invalid_timestamp:
+            time = ""
+        else:
+            time = str(np.datetime64(int(self.timestamps[index]), 's')).replace('T', ' ')
+        return item_type, item_name, time, int(self.rarities[index])
+
+    def get_timestamps(self):
+        return self.timestamps[:self.size]
+
+    def get_rarities(self):
+        return self.rarities[:self.size]
+
+    def get_item_ids(self):
+        return self.item_ids[:self.size]
+
+    def get_count(self, rarity=None):
+        if rarity is None:
+            return self.size
+        return int(np.count_nonzero(self.get_rarities() == rarity))
+
+    def get_rarity_positions(self, rarity):
+        # indexes of wishes with given rarity, from oldest to newest
+        return np.flatnonzero(self.get_rarities() == rarity)
+
+    def get_pity(self, rarity):
+        """Returns number of wishes made since last wish with given rarity. If there wasn't any, it's all of them.
+        :param rarity: 4 or 5
+        :return: pity
+        """
+        positions = self.get_rarity_positions(rarity)
+        if not len(positions):
+            return self.size
+        return self.size - 1 - int(positions[-1])
+
+    def get_pity_at_hits(self, rarity):
+        # pity at which every wish with given rarity was received (counting wish that gave the item)
+        return np.diff(self.get_rarity_positions(rarity), prepend=-1)
+
+    def get_memory_usage(self):
+        # bytes used by columns of stored wishes (without spare capacity and interned names)
+        return self.size * (self.timestamps.itemsize + self.rarities.itemsize + self.item_ids.itemsize)